@@ -1,7 +1,194 @@
-from django.contrib import admin
-from .models import Profile, Membership, SubscriptionEvent
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from . import deletion, rollups
+from .models import Profile, Membership, EventType, SubscriptionEvent, AccountDeletion, DailyEventRollup, RollupState, Task
+from .paginators import EstimatedCountPaginator
 
-# Register your models here.
-admin.site.register(Profile)
-admin.site.register(Membership)
-admin.site.register(SubscriptionEvent)
+
+class IndexedSearchMixin:
+    """
+    Search that only uses lookups an index can answer.
+
+    The default search_fields lookups are case-insensitive substring matches,
+    which scan the whole table. Stripe ids and usernames are matched exactly
+    or by case-sensitive prefix instead, and every field listed here must be
+    indexed: the database only avoids a scan when each OR'd term can use one.
+
+    A prefix is searched as the range [term, term + U+FFFF), which a plain
+    btree index answers (on a related field, through a subquery on its table); LIKE 'term%' cannot use one on SQLite, nor on
+    PostgreSQL under a non-C collation. __startswith on top keeps the match
+    exact wherever a collation orders the range differently.
+    """
+    exact_search_fields = ()
+    prefix_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = Q()
+        for field in self.exact_search_fields:
+            condition |= Q(**{field: term})
+        for field in self.prefix_search_fields:
+            condition |= self._prefix_condition(queryset.model, field, term)
+        return queryset.filter(condition), False
+
+    def _prefix_condition(self, model, field, term):
+        relation, _, name = field.rpartition('__')
+        if not relation:
+            return Q(**{f'{field}__gte': term, f'{field}__lt': term + '\uffff', f'{field}__startswith': term})
+        # A prefix on a joined table ORed with local terms would scan this one;
+        # an IN subquery lets each side use its own index
+        related = model._meta.get_field(relation).related_model
+        return Q(**{f'{relation}__in': related._default_manager.filter(self._prefix_condition(related, name, term)).values('pk')})
+
+
+@admin.register(Profile)
+class ProfileAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('user', 'subscription_status', 'email_confirmed', 'two_factor_enabled', 'stripe_customer_id')
+    list_filter = ('subscription_status', 'email_confirmed', 'two_factor_enabled')
+    list_select_related = ('user',)
+    search_fields = ('user__username', 'stripe_customer_id')
+    prefix_search_fields = ('user__username',)
+    exact_search_fields = ('stripe_customer_id', 'stripe_subscription_id')
+    raw_id_fields = ('user',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('bio', 'recovery_codes')
+
+
+@admin.register(Membership)
+class MembershipAdmin(admin.ModelAdmin):
+    list_display = ('name', 'stripe_price_id')
+
+
+class EventTypeFilter(admin.SimpleListFilter):
+    """Filter by Stripe event type string, answered from the type_id index."""
+    title = 'event type'
+    parameter_name = 'event_type'
+
+    def lookups(self, request, model_admin):
+        return EventType.objects.order_by('code').values_list('code', 'name')
+
+    def queryset(self, request, queryset):
+        if self.value():
+            event_type = EventType.objects.filter(code=self.value()).first()
+            return queryset.filter(type=event_type) if event_type else queryset.none()
+        return queryset
+
+
+@admin.register(EventType)
+class EventTypeAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name')
+    search_fields = ('code',)
+
+
+@admin.register(SubscriptionEvent)
+class SubscriptionEventAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'customer_id', 'subscription_id', 'created')
+    list_filter = (EventTypeFilter,)
+    list_select_related = ('type',)
+    raw_id_fields = ('type',)
+    # Customer ids go in the search box: exact event ids, customer id prefixes.
+    # subscription_id has no index, so searching it would scan the table.
+    search_fields = ('event_id', 'customer_id')
+    exact_search_fields = ('event_id',)
+    prefix_search_fields = ('customer_id',)
+    search_help_text = 'Exact event id, or a customer id prefix.'
+    # The primary key follows insertion order and needs no extra index
+    ordering = ('-pk',)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_queryset(self, request):
+        # The payload is only read on the change form, which loads it with one extra query
+        return super().get_queryset(request).defer('data')
+
+
+@admin.register(DailyEventRollup)
+class DailyEventRollupAdmin(admin.ModelAdmin):
+    list_display = ('day', 'currency', 'new_subscriptions', 'cancellations', 'reactivations', 'invoices_paid', 'invoices_failed', 'revenue')
+    list_filter = ('currency',)
+    date_hierarchy = 'day'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('report/', self.admin_site.admin_view(self.report_view), name='accounts_dailyeventrollup_report'),
+        ] + super().get_urls()
+
+    def report_view(self, request):
+        """Monthly subscription, churn and payment figures, read from the rollups only"""
+        report = rollups.monthly_report()
+        for totals in report.values():
+            totals['revenue_display'] = [f"{amount / 100:.2f} {currency}" for currency, amount in sorted(totals['revenue'].items())]
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title='Subscription report',
+            report=report,
+            state=RollupState.objects.filter(name=rollups.STATE_NAME).first(),
+        )
+        return TemplateResponse(request, 'admin/accounts/dailyeventrollup/report.html', context)
+
+
+@admin.register(AccountDeletion)
+class AccountDeletionAdmin(admin.ModelAdmin):
+    list_display = ('username', 'requested_at', 'completed_at', 'events_deleted', 'last_error')
+    list_filter = (('completed_at', admin.EmptyFieldListFilter),)
+    readonly_fields = ('user', 'username', 'stripe_customer_id', 'stripe_subscription_id', 'profile_image', 'requested_at', 'completed_at', 'events_deleted', 'last_error')
+    actions = ['process_deletions']
+
+    @admin.action(description='Process selected deletions now')
+    def process_deletions(self, request, queryset):
+        completed = failed = 0
+        # Each account is removed in its own short transactions, never one spanning the selection
+        for account_deletion in queryset.filter(completed_at__isnull=True).select_related('user'):
+            if deletion.process(account_deletion):
+                completed += 1
+            else:
+                failed += 1
+        self.message_user(request, f'{completed} accounts deleted, {failed} failed.', messages.WARNING if failed else messages.SUCCESS)
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'run_at', 'attempts', 'duration', 'worker', 'last_error')
+    list_filter = ('status', 'name')
+    ordering = ('-pk',)
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'duration', 'worker', 'last_error')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['run_again']
+
+    @admin.action(description='Queue selected tasks to run again now')
+    def run_again(self, request, queryset):
+        count = queryset.exclude(status=Task.RUNNING).update(status=Task.QUEUED, run_at=timezone.now(), attempts=0)
+        self.message_user(request, f'{count} tasks queued.', messages.SUCCESS)
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class AccountUserAdmin(UserAdmin):
+    actions = ['schedule_deletion']
+
+    @admin.action(description='Delete selected accounts in the background')
+    def schedule_deletion(self, request, queryset):
+        users = list(queryset.select_related('profile'))
+        for user in users:
+            deletion.request_deletion(user)
+        self.message_user(request, f'{len(users)} accounts deactivated and queued for deletion.', messages.SUCCESS)
@@ -0,0 +1,158 @@
+"""
+Self-hosted front-end assets.
+
+base.html used to load Bootstrap, Bootstrap Icons and htmx from public CDNs,
+which costs extra DNS and TLS handshakes on first paint and leaves caching
+to someone else. The pinned files listed in VENDORED are downloaded once
+with `manage.py vendor_assets` into accounts/static/vendor/ and committed;
+from then on collectstatic fingerprints and precompresses them like every
+other static file (see accounts.storage) and serve() hands them out with
+far-future immutable headers.
+
+Until a file is vendored, pages load it from its pinned CDN URL with the
+recorded Subresource Integrity hash, so a page is never left without its
+CSS or JS; `manage.py check --deploy` warns about every such file.
+vendor_assets refuses a download that does not match the recorded hash.
+"""
+import base64
+import hashlib
+import mimetypes
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# name: (path under accounts/static, upstream URL of the pinned release,
+# its Subresource Integrity hash or None when not recorded yet)
+VENDORED = {
+    'bootstrap.css': (
+        'vendor/bootstrap/bootstrap.min.css',
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+        'sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM',
+    ),
+    'bootstrap.js': (
+        'vendor/bootstrap/bootstrap.bundle.min.js',
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+        'sha384-geWF76RCwLtnZ8qwWowPQNguL3RmwHVBC9FhGdlKrxdiJJigb/j/68SIy3Te4Bkz',
+    ),
+    'bootstrap-icons.css': (
+        'vendor/bootstrap-icons/bootstrap-icons.css',
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/bootstrap-icons.css',
+        None,
+    ),
+    # Referenced by bootstrap-icons.css as ./fonts/...; collectstatic rewrites those URLs to the hashed names
+    'bootstrap-icons.woff2': (
+        'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2',
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff2',
+        None,
+    ),
+    'bootstrap-icons.woff': (
+        'vendor/bootstrap-icons/fonts/bootstrap-icons.woff',
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font/fonts/bootstrap-icons.woff',
+        None,
+    ),
+    'htmx.js': (
+        'vendor/htmx/htmx.min.js',
+        'https://unpkg.com/htmx.org@1.9.10/dist/htmx.min.js',
+        'sha384-D1Kt99CQMDuVetoL1lrYwg5t+9QdHe7NLX/SoJYkXDFfX37iInKRy5xLSi8nO7UC',
+    ),
+}
+
+# (Content-Encoding, file suffix) in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MUTABLE_MAX_AGE = 60
+
+
+def missing():
+    """The VENDORED paths the static finders cannot find."""
+    return [path for path, _, _ in VENDORED.values() if not finders.find(path)]
+
+
+def integrity(data):
+    """The Subresource Integrity value of `data`, as recorded in VENDORED."""
+    return 'sha384-' + base64.b64encode(hashlib.sha384(data).digest()).decode()
+
+
+@lru_cache(maxsize=None)
+def source(name):
+    """(URL, integrity) of an asset: the static file once vendored, else the pinned CDN copy."""
+    path, upstream, sri = VENDORED[name]
+    if finders.find(path):
+        return static(path), None
+    return upstream, sri
+
+
+def url(name):
+    """URL of a vendored asset."""
+    return source(name)[0]
+
+
+def _integrity_attrs(sri):
+    return format_html(' integrity="{}" crossorigin="anonymous"', sri) if sri else ''
+
+
+def stylesheet(name):
+    href, sri = source(name)
+    return format_html('<link href="{}" rel="stylesheet"{}>', href, _integrity_attrs(sri))
+
+
+def script(name):
+    src, sri = source(name)
+    return format_html('<script src="{}"{}></script>', src, _integrity_attrs(sri))
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _is_fingerprinted(path):
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None) or {}
+    return path in hashed_files.values()
+
+
+def serve(request, path):
+    """
+    Serve a file from STATIC_ROOT, picking the .br or .gz variant written by
+    collectstatic when the client accepts it. Fingerprinted names never change
+    content, so they are cacheable for a year.
+    """
+    root = Path(settings.STATIC_ROOT).resolve()
+    full_path = (root / path).resolve()
+    if root not in full_path.parents or not full_path.is_file() or full_path.name == 'staticfiles.json':
+        raise Http404('Static file not found')
+    content_type = mimetypes.guess_type(full_path.name)[0] or 'application/octet-stream'
+    chosen, encoding = full_path, None
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    for coding, suffix in ENCODINGS:
+        variant = full_path.with_name(full_path.name + suffix)
+        if coding in accepted and variant.is_file():
+            chosen, encoding = variant, coding
+            break
+    stat = chosen.stat()
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(chosen.open('rb'), content_type=content_type)
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if _is_fingerprinted(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=MUTABLE_MAX_AGE)
+    return response
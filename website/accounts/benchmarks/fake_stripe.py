@@ -0,0 +1,284 @@
+"""
+A local stand-in for the Stripe API, used by the benchmark suite.
+
+FakeStripeServer answers the REST endpoints the accounts views call with
+canned objects, and signed_webhook() builds webhook payloads signed the way
+Stripe signs them, so stripe_webhook can be driven without network access.
+"""
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ..services.stripe_service import get_stripe
+
+SUBSCRIPTION_ID = 'sub_bench'
+CUSTOMER_ID = 'cus_bench'
+PRICE_ID = 'price_bench'
+PRODUCT_ID = 'prod_bench'
+
+
+def subscription_object(subscription_id=SUBSCRIPTION_ID, customer_id=CUSTOMER_ID, status='active'):
+    now = int(time.time())
+    return {
+        'id': subscription_id,
+        'object': 'subscription',
+        'customer': customer_id,
+        'status': status,
+        'created': now - 86400,
+        'cancel_at_period_end': False,
+        'items': {
+            'object': 'list',
+            'data': [{
+                'id': 'si_bench',
+                'object': 'subscription_item',
+                'current_period_start': now - 86400,
+                'current_period_end': now + 29 * 86400,
+                'price': {
+                    'id': PRICE_ID,
+                    'object': 'price',
+                    'product': PRODUCT_ID,
+                    'unit_amount': 2000,
+                    'currency': 'usd',
+                    'recurring': {'interval': 'month'},
+                },
+            }],
+        },
+    }
+
+
+def invoice_object(customer_id=CUSTOMER_ID, amount=2000, status='paid'):
+    return {
+        'id': 'in_bench',
+        'object': 'invoice',
+        'customer': customer_id,
+        'subscription': SUBSCRIPTION_ID,
+        'status': status,
+        'currency': 'usd',
+        'amount_due': amount,
+        'amount_paid': amount if status == 'paid' else 0,
+        'next_payment_attempt': int(time.time()) + 29 * 86400,
+    }
+
+
+
+def full_invoice_object(customer_id=CUSTOMER_ID, amount=2000, lines=3):
+    """An invoice with the fields and nesting Stripe sends in invoice.paid events (about 5 KB as JSON)."""
+    now = int(time.time())
+    period = {'start': now - 30 * 86400, 'end': now}
+    line_items = [{
+        'id': f'il_bench_{i}',
+        'object': 'line_item',
+        'amount': amount,
+        'currency': 'usd',
+        'description': f'1 \u00d7 Bench Plan (at $20.00 / month), seat {i}',
+        'discount_amounts': [],
+        'discountable': True,
+        'discounts': [],
+        'livemode': False,
+        'metadata': {},
+        'parent': {
+            'type': 'subscription_item_details',
+            'subscription_item_details': {'invoice_item': None, 'proration': False, 'proration_details': {'credited_items': None}, 'subscription': SUBSCRIPTION_ID, 'subscription_item': f'si_bench_{i}'},
+        },
+        'period': period,
+        'pretax_credit_amounts': [],
+        'pricing': {'price_details': {'price': PRICE_ID, 'product': PRODUCT_ID}, 'type': 'price_details', 'unit_amount_decimal': str(amount)},
+        'quantity': 1,
+        'taxes': [],
+    } for i in range(lines)]
+    return {
+        'id': 'in_bench',
+        'object': 'invoice',
+        'account_country': 'US',
+        'account_name': 'WebSubscription',
+        'account_tax_ids': None,
+        'amount_due': amount * lines,
+        'amount_overpaid': 0,
+        'amount_paid': amount * lines,
+        'amount_remaining': 0,
+        'amount_shipping': 0,
+        'application': None,
+        'attempt_count': 1,
+        'attempted': True,
+        'auto_advance': False,
+        'automatic_tax': {'disabled_reason': None, 'enabled': False, 'liability': None, 'provider': None, 'status': None},
+        'billing_reason': 'subscription_cycle',
+        'collection_method': 'charge_automatically',
+        'created': now,
+        'currency': 'usd',
+        'custom_fields': None,
+        'customer': customer_id,
+        'customer_address': {'city': 'City', 'country': 'US', 'line1': '123 Business St', 'line2': None, 'postal_code': '12345', 'state': 'CA'},
+        'customer_email': 'bench@example.com',
+        'customer_name': 'Bench User',
+        'customer_phone': None,
+        'customer_shipping': None,
+        'customer_tax_exempt': 'none',
+        'customer_tax_ids': [],
+        'default_payment_method': None,
+        'default_source': None,
+        'default_tax_rates': [],
+        'description': None,
+        'discounts': [],
+        'due_date': None,
+        'effective_at': now,
+        'ending_balance': 0,
+        'footer': None,
+        'from_invoice': None,
+        'hosted_invoice_url': 'https://invoice.stripe.com/i/acct_bench/test_YWNjdF9iZW5jaA',
+        'invoice_pdf': 'https://pay.stripe.com/invoice/acct_bench/test_YWNjdF9iZW5jaA/pdf',
+        'issuer': {'type': 'self'},
+        'last_finalization_error': None,
+        'latest_revision': None,
+        'lines': {'object': 'list', 'data': line_items, 'has_more': False, 'total_count': lines, 'url': '/v1/invoices/in_bench/lines'},
+        'livemode': False,
+        'metadata': {},
+        'next_payment_attempt': None,
+        'number': 'BENCH-0001',
+        'on_behalf_of': None,
+        'parent': {'quote_details': None, 'subscription_details': {'metadata': {}, 'subscription': SUBSCRIPTION_ID}, 'type': 'subscription_details'},
+        'payment_settings': {'default_mandate': None, 'payment_method_options': None, 'payment_method_types': None},
+        'period_end': period['end'],
+        'period_start': period['start'],
+        'post_payment_credit_notes_amount': 0,
+        'pre_payment_credit_notes_amount': 0,
+        'receipt_number': None,
+        'rendering': None,
+        'shipping_cost': None,
+        'shipping_details': None,
+        'starting_balance': 0,
+        'statement_descriptor': None,
+        'status': 'paid',
+        'status_transitions': {'finalized_at': now, 'marked_uncollectible_at': None, 'paid_at': now, 'voided_at': None},
+        'subtotal': amount * lines,
+        'subtotal_excluding_tax': amount * lines,
+        'test_clock': None,
+        'total': amount * lines,
+        'total_discount_amounts': [],
+        'total_excluding_tax': amount * lines,
+        'total_pretax_credit_amounts': [],
+        'total_taxes': [],
+        'webhooks_delivered_at': now,
+    }
+
+ROUTES = (
+    ('GET', re.compile(r'^/v1/subscriptions/(?P<id>[\w-]+)$'), lambda m, form: subscription_object(m['id'])),
+    ('POST', re.compile(r'^/v1/subscriptions/(?P<id>[\w-]+)$'), lambda m, form: dict(subscription_object(m['id']), cancel_at_period_end=form.get('cancel_at_period_end') == 'true')),
+    ('DELETE', re.compile(r'^/v1/subscriptions/(?P<id>[\w-]+)$'), lambda m, form: subscription_object(m['id'], status='canceled')),
+    ('GET', re.compile(r'^/v1/customers/(?P<id>[\w-]+)$'), lambda m, form: {'id': m['id'], 'object': 'customer', 'name': 'Bench User', 'email': 'bench@example.com'}),
+    ('POST', re.compile(r'^/v1/customers$'), lambda m, form: {'id': CUSTOMER_ID, 'object': 'customer', 'name': form.get('name'), 'email': form.get('email')}),
+    ('GET', re.compile(r'^/v1/products/(?P<id>[\w-]+)$'), lambda m, form: {'id': m['id'], 'object': 'product', 'name': 'Bench Plan'}),
+    ('GET', re.compile(r'^/v1/prices/(?P<id>[\w-]+)$'), lambda m, form: subscription_object()['items']['data'][0]['price']),
+    ('POST', re.compile(r'^/v1/invoices/create_preview$'), lambda m, form: invoice_object(status='draft')),
+    ('POST', re.compile(r'^/v1/checkout/sessions$'), lambda m, form: {'id': 'cs_bench', 'object': 'checkout.session', 'url': 'https://checkout.stripe.test/cs_bench'}),
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _dispatch(self, method):
+        path, _, query = self.path.partition('?')
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else query
+        form = dict(pair.split('=', 1) for pair in body.split('&') if '=' in pair)
+        self.server.request_count += 1
+        for route_method, pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                return self._send(200, handler(match, form))
+        return self._send(404, {'error': {'type': 'invalid_request_error', 'message': f'No fake for {method} {path}'}})
+
+    def _send(self, status, payload):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Request-Id', 'req_bench')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeStripeServer:
+    """Serve the fake Stripe API on a local port from a background thread."""
+
+    def __init__(self, latency=0.0):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.request_count = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+@contextmanager
+def use_fake_stripe(server, api_key='sk_test_bench'):
+    """Point the Stripe SDK at `server` for the duration of the block."""
+    stripe = get_stripe()
+    saved = stripe.api_base, stripe.api_key
+    stripe.api_base, stripe.api_key = server.url, api_key
+    try:
+        yield server
+    finally:
+        stripe.api_base, stripe.api_key = saved
+
+
+def webhook_event(event_type='customer.subscription.updated', obj=None, event_id=None):
+    obj = obj if obj is not None else subscription_object()
+    return {
+        'id': event_id or f'evt_bench_{time.time_ns()}',
+        'object': 'event',
+        'type': event_type,
+        'created': int(time.time()),
+        'data': {'object': obj},
+    }
+
+
+def signed_webhook(event, secret, timestamp=None):
+    """Return (payload bytes, Stripe-Signature header) for `event`."""
+    payload = json.dumps(event).encode()
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    signed = f'{timestamp}.'.encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return payload, f't={timestamp},v1={signature}'
@@ -0,0 +1,179 @@
+"""
+Throughput and latency benchmarks for the accounts views.
+
+Each scenario sends requests through Django's test client from a pool of
+threads, against a fixture database and the fake Stripe server. Latency is
+measured around each request; query and Stripe call counts come from the
+request metrics middleware.
+
+Every scenario starts from the same state (empty cache, closed circuit
+breaker, freshly loaded catalog) and each thread sends one untimed request
+first. Counts still vary a little between runs, since concurrent requests
+share Stripe reads through single-flight depending on timing, so compare()
+allows them a small relative tolerance as well.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import catalog, event_types, metrics
+from ..models import Membership, SubscriptionEvent
+from ..services.circuit_breaker import stripe_breaker
+from . import fake_stripe
+
+USERNAME = 'benchuser'
+PASSWORD = 'benchpass123'
+WEBHOOK_SECRET = 'whsec_bench'
+
+# scenario: (URL name, expected status code, needs a logged in client)
+SCENARIOS = {
+    'stripe_webhook': ('stripe_webhook', 200, False),
+    'login': ('login', 302, False),
+    'profile': ('profile', 200, True),
+    'subscription_details': ('subscription_details', 200, True),
+    'subscribing_page': ('subscribing_page', 200, True),
+}
+
+
+def create_fixtures(event_count=500):
+    """Create the benchmark user, a membership and `event_count` subscription events."""
+    user = User.objects.create_user(username=USERNAME, email='bench@example.com', password=PASSWORD)
+    profile = user.profile
+    profile.email_confirmed = True
+    profile.stripe_customer_id = fake_stripe.CUSTOMER_ID
+    profile.stripe_subscription_id = fake_stripe.SUBSCRIPTION_ID
+    profile.subscription_status = 'active'
+    profile.save()
+    Membership.objects.create(name='Bench Plan', stripe_price_id=fake_stripe.PRICE_ID)
+    now = timezone.now()
+    SubscriptionEvent.objects.bulk_create(
+        SubscriptionEvent(
+            event_id=f'evt_fixture_{i}',
+            event_type='invoice.paid' if i % 5 else 'customer.subscription.created',
+            created=now - timedelta(hours=i),
+            data={'object': fake_stripe.invoice_object() if i % 5 else fake_stripe.subscription_object()},
+            customer_id=fake_stripe.CUSTOMER_ID,
+            subscription_id=fake_stripe.SUBSCRIPTION_ID,
+        )
+        for i in range(event_count)
+    )
+    return user
+
+
+def _send(scenario, client):
+    url_name, _, _ = SCENARIOS[scenario]
+    url = reverse(url_name)
+    if scenario == 'stripe_webhook':
+        event = fake_stripe.webhook_event('customer.subscription.updated')
+        payload, signature = fake_stripe.signed_webhook(event, WEBHOOK_SECRET)
+        return client.post(url, data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+    if scenario == 'login':
+        return client.post(url, {'username': USERNAME, 'password': PASSWORD})
+    return client.get(url)
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def run_scenario(scenario, user, requests=200, concurrency=4):
+    """Send `requests` requests for `scenario` from `concurrency` threads and summarise them."""
+    url_name, expected_status, needs_login = SCENARIOS[scenario]
+    # Hook the database before the worker threads open their connections
+    metrics.install()
+    local = threading.local()
+    opened = []
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            if needs_login:
+                local.client.force_login(user)
+            # Let the main thread close this worker's connection afterwards
+            connection = connections['default']
+            connection.inc_thread_sharing()
+            opened.append(connection)
+        return local.client
+
+    def one_request(_):
+        start = time.perf_counter()
+        response = _send(scenario, client())
+        elapsed = time.perf_counter() - start
+        if response.status_code != expected_status:
+            raise AssertionError(f'{scenario} returned {response.status_code}, expected {expected_status}')
+        return elapsed
+
+    cache.clear()
+    stripe_breaker.reset()
+    catalog.warm()
+    event_types.warm()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bench') as pool:
+        # One untimed request per thread opens its connection and logs it in
+        list(pool.map(one_request, range(concurrency)))
+        metrics.registry.reset()
+        start = time.perf_counter()
+        latencies = sorted(pool.map(one_request, range(requests)))
+        wall = time.perf_counter() - start
+    for connection in opened:
+        connection.close()
+
+    recorded = metrics.registry.snapshot().get(url_name, {})
+    _, queries, count = recorded.get('db_queries', ([], 0, 0))
+    _, stripe_calls, _ = recorded.get('stripe_calls', ([], 0, 0))
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'requests_per_second': round(requests / wall, 2),
+        'p50_ms': round(_percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(_percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(_percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(queries / count, 2) if count else 0.0,
+        'stripe_calls_per_request': round(stripe_calls / count, 2) if count else 0.0,
+    }
+
+
+def compare(results, baseline, tolerance=0.25, count_tolerance=0.1):
+    """
+    Return a message for every result that regressed against `baseline`:
+    throughput and p95 latency by more than `tolerance`, query and Stripe
+    call counts by more than `count_tolerance` (relative).
+    """
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        if result['requests_per_second'] < base['requests_per_second'] * (1 - tolerance):
+            regressions.append(f"{scenario}: {result['requests_per_second']} req/s, baseline {base['requests_per_second']}")
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {result['p95_ms']} ms, baseline {base['p95_ms']}")
+        # Tighter than the timings: one more query on a 4-query view is 25%
+        for key in ('queries_per_request', 'stripe_calls_per_request'):
+            if result[key] > base[key] * (1 + count_tolerance):
+                regressions.append(f'{scenario}: {key} {result[key]}, baseline {base[key]}')
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
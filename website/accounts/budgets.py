@@ -0,0 +1,50 @@
+"""
+Per-view performance budgets.
+
+A view declares the most SQL queries, Stripe calls and milliseconds a single
+request to it may use with the @budget decorator. The request metrics
+middleware logs a warning when a live request goes over budget, and the
+route tests in accounts/tests.py fail when a view exceeds its budget against
+a realistically sized fixture.
+"""
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+Budget = namedtuple('Budget', ('max_queries', 'max_stripe_calls', 'max_ms'))
+
+
+def budget(max_queries, max_stripe_calls=0, max_ms=None):
+    """Attach a Budget to the view; decorators using functools.wraps keep it."""
+    def decorator(view_func):
+        view_func.budget = Budget(max_queries, max_stripe_calls, max_ms)
+        return view_func
+    return decorator
+
+
+def get_budget(view_func):
+    return getattr(view_func, 'budget', None)
+
+
+def violations(view_budget, queries, stripe_calls, seconds):
+    """Return a message for every limit in `view_budget` the request went over."""
+    found = []
+    if queries > view_budget.max_queries:
+        found.append(f'{queries} queries, budget {view_budget.max_queries}')
+    if stripe_calls > view_budget.max_stripe_calls:
+        found.append(f'{stripe_calls} Stripe calls, budget {view_budget.max_stripe_calls}')
+    if view_budget.max_ms is not None and seconds * 1000 > view_budget.max_ms:
+        found.append(f'{seconds * 1000:.0f} ms, budget {view_budget.max_ms} ms')
+    return found
+
+
+def check_request(request, request_metrics, seconds):
+    """Log a warning when the request that just finished went over its view's budget."""
+    match = getattr(request, 'resolver_match', None)
+    view_budget = get_budget(match.func) if match is not None else None
+    if view_budget is None or request_metrics is None:
+        return
+    found = violations(view_budget, request_metrics.db_queries, request_metrics.stripe_calls, seconds)
+    if found:
+        logger.warning('%s exceeded its budget: %s', match.url_name, '; '.join(found))
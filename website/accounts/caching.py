@@ -0,0 +1,40 @@
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.cache import cache_page
+
+
+def patch_anonymous_cache_headers(response, timeout):
+    """Let browsers and a CDN keep an anonymous response for `timeout` seconds."""
+    patch_cache_control(response, public=True, max_age=timeout, s_maxage=timeout)
+    # A visitor with a session cookie may be logged in and must not get the shared copy
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def cache_anonymous_page(timeout=None):
+    """
+    Cache the full response for anonymous users only.
+
+    Authenticated users always get a freshly rendered, private response. The
+    anonymous variant is stored with cache_page and shared by every anonymous
+    visitor, so the wrapped view must not render a CSRF token or other
+    per-visitor content for them.
+    """
+    def decorator(view_func):
+        seconds = settings.ANONYMOUS_PAGE_CACHE_TIMEOUT if timeout is None else timeout
+        cached_view = cache_page(seconds, key_prefix='anonymous')(view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                response = view_func(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+                return response
+            response = cached_view(request, *args, **kwargs)
+            return patch_anonymous_cache_headers(response, seconds)
+
+        return _wrapped_view
+
+    return decorator
@@ -0,0 +1,60 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+
+from .models import Membership
+
+# Cache key for the fully rendered subscribe page served to anonymous users.
+SUBSCRIBE_PAGE_CACHE_KEY = 'accounts:subscribe:anonymous'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_memberships = None
+_loaded_at = 0.0
+_invalidated_at = float('-inf')
+
+
+def _timeout():
+    return getattr(settings, 'MEMBERSHIP_CATALOG_TIMEOUT', 300)
+
+
+def get_memberships():
+    """Return the Membership catalog, loading it from the database when stale."""
+    global _memberships, _loaded_at
+    memberships = _memberships
+    if memberships is not None and time.monotonic() - _loaded_at < _timeout():
+        return memberships
+    with _lock:
+        if _memberships is None or time.monotonic() - _loaded_at >= _timeout():
+            memberships = Membership.objects.order_by('id')
+            if time.monotonic() - _invalidated_at < settings.REPLICA_PIN_SECONDS:
+                # Just changed: the replica may not have the change yet
+                memberships = memberships.using(DEFAULT_DB_ALIAS)
+            _memberships = list(memberships)
+            _loaded_at = time.monotonic()
+        return _memberships
+
+
+def warm():
+    """Load the catalog up front so the first request does not pay for it."""
+    invalidate()
+    try:
+        return get_memberships()
+    except DatabaseError as e:
+        # Startup must not fail before migrations have been applied
+        logger.warning('Could not warm the membership catalog: %s', e)
+        return None
+
+
+def invalidate():
+    """Drop the cached catalog and every page rendered from it."""
+    global _memberships, _invalidated_at
+    with _lock:
+        _memberships = None
+        _invalidated_at = time.monotonic()
+    cache.delete(SUBSCRIBE_PAGE_CACHE_KEY)
@@ -0,0 +1,19 @@
+"""
+System checks for the accounts app.
+"""
+from django.core.checks import Tags, Warning, register
+
+from . import assets
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_vendored_assets(app_configs, **kwargs):
+    """Pages load a file that is not vendored from its CDN; a deploy should ship them all."""
+    return [
+        Warning(
+            f'Vendored asset {path} is missing; pages load it from the CDN.',
+            hint='Run `manage.py vendor_assets` and commit accounts/static/vendor/.',
+            id='accounts.W001',
+        )
+        for path in assets.missing()
+    ]
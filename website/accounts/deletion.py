@@ -0,0 +1,121 @@
+"""
+Account deletion, split between the request and a background job.
+
+request_deletion() runs in the delete_user view: it deactivates the user,
+records an AccountDeletion and queues a task for it, which is cheap.
+process() does the slow part later, in the task worker (or from
+`manage.py process_account_deletions` or the admin): it cancels
+the Stripe subscription, deletes the customer's SubscriptionEvent rows in
+chunks, removes the profile image and finally the user. Every step can be
+repeated, so a failed deletion is simply retried on the next run.
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import taskqueue
+from .models import AccountDeletion, SubscriptionEvent, Task
+from .services import images
+from .services.stripe_service import stripe
+
+logger = logging.getLogger(__name__)
+
+PROCESS_TASK = 'accounts.tasks.process_account_deletion'
+
+
+def request_deletion(user):
+    """Deactivate `user` and queue the deletion of their account."""
+    profile = user.profile
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        deletion, _ = AccountDeletion.objects.update_or_create(
+            user=user,
+            defaults={
+                'username': user.username,
+                'stripe_customer_id': profile.stripe_customer_id,
+                'stripe_subscription_id': profile.stripe_subscription_id,
+                'profile_image': profile.profile_image.name if profile.profile_image else '',
+            },
+        )
+        taskqueue.enqueue(PROCESS_TASK, deletion.pk)
+    return deletion
+
+
+def _cancel_subscription(subscription_id):
+    try:
+        stripe.Subscription.cancel(subscription_id, api_key=settings.STRIPE_SECRET_KEY)
+    except stripe.error.InvalidRequestError as e:
+        # Already cancelled or unknown to Stripe: nothing left to stop
+        logger.info('Subscription %s not cancelled: %s', subscription_id, e)
+
+
+def _delete_events(customer_id, batch_size):
+    deleted = 0
+    while True:
+        # One short transaction per chunk keeps the table writable for webhooks
+        with transaction.atomic():
+            ids = list(SubscriptionEvent.objects.filter(customer_id=customer_id).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            count, _ = SubscriptionEvent.objects.filter(pk__in=ids).delete()
+        deleted += count
+        taskqueue.heartbeat()
+
+
+def process(deletion, batch_size=None):
+    """Carry out one AccountDeletion; returns True when it completed."""
+    if deletion.completed_at:
+        return True
+    batch_size = batch_size or settings.ACCOUNT_DELETION_BATCH_SIZE
+    try:
+        if deletion.stripe_subscription_id:
+            _cancel_subscription(deletion.stripe_subscription_id)
+        if deletion.stripe_customer_id:
+            deletion.events_deleted += _delete_events(deletion.stripe_customer_id, batch_size)
+        images.delete_image(deletion.profile_image)
+        with transaction.atomic():
+            if deletion.user_id:
+                deletion.user.delete()
+            deletion.user = None
+            deletion.completed_at = timezone.now()
+            deletion.last_error = ''
+            deletion.save()
+    except Exception as e:
+        logger.exception('Deletion of account %s failed', deletion.username)
+        deletion.last_error = str(e)
+        deletion.save(update_fields=['events_deleted', 'last_error'])
+        return False
+    logger.info('Deleted account %s and %d subscription events', deletion.username, deletion.events_deleted)
+    return True
+
+
+def _left_to_tasks():
+    """Ids of the deletions a queued or running process_account_deletion task will carry out."""
+    tasks = Task.objects.filter(name=PROCESS_TASK, status__in=(Task.QUEUED, Task.RUNNING))
+    return {args[0] for args in tasks.values_list('args', flat=True) if args}
+
+
+def process_pending(limit=None, batch_size=None):
+    """
+    Process unfinished deletions oldest first, skipping those a worker still
+    has queued or running (so the same rows are not deleted twice at once);
+    returns (completed, failed).
+    """
+    pending = (
+        AccountDeletion.objects.filter(completed_at__isnull=True)
+        .exclude(pk__in=_left_to_tasks())
+        .select_related('user')
+        .order_by('requested_at')
+    )
+    if limit:
+        pending = pending[:limit]
+    completed = failed = 0
+    for deletion in pending:
+        if process(deletion, batch_size):
+            completed += 1
+        else:
+            failed += 1
+    return completed, failed
@@ -0,0 +1,72 @@
+"""
+The EventType rows, kept in memory per process.
+
+Every stored webhook event points at an EventType. Looking the type up
+with get_or_create would add a query to each webhook, yet the table only
+gains a row when Stripe sends a type for the first time, so the worker
+loads it once (warm-up does it at start) and get() only queries for a
+code it has not seen. A row created by get() joins the cache once its
+transaction commits, so a rolled back row is never handed out.
+"""
+import logging
+import threading
+from functools import partial
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, transaction
+
+from .models import EVENT_NAMES, EventType
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_by_code = None
+
+
+def _loaded():
+    global _by_code
+    by_code = _by_code
+    if by_code is not None:
+        return by_code
+    with _lock:
+        if _by_code is None:
+            # The primary: a type added a moment ago may not be on the replica yet
+            _by_code = {event_type.code: event_type for event_type in EventType.objects.using(DEFAULT_DB_ALIAS)}
+        return _by_code
+
+
+def _remember(event_type):
+    with _lock:
+        if _by_code is not None:
+            _by_code[event_type.code] = event_type
+
+
+def get(code):
+    """The EventType for `code`, added with its friendly name the first time Stripe sends it."""
+    event_type = _loaded().get(code)
+    if event_type is None:
+        event_type, _ = EventType.objects.get_or_create(code=code, defaults={'name': EVENT_NAMES.get(code, code)})
+        transaction.on_commit(partial(_remember, event_type))
+    return event_type
+
+
+def name(code):
+    """The friendly name of the event type `code`, or the code itself for a type never stored."""
+    event_type = _loaded().get(code)
+    return event_type.name if event_type is not None else code
+
+
+def warm():
+    """Load the event types up front so the first webhook does not pay for it."""
+    invalidate()
+    try:
+        return _loaded()
+    except DatabaseError as e:
+        # Startup must not fail before migrations have been applied
+        logger.warning('Could not warm the event types: %s', e)
+        return None
+
+
+def invalidate():
+    global _by_code
+    with _lock:
+        _by_code = None
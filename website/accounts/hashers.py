@@ -0,0 +1,23 @@
+"""
+Password hashers with work factors taken from settings.
+
+Raising a parameter in settings makes must_update() true for older hashes,
+so Django re-hashes the password the next time its owner logs in.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, ScryptPasswordHasher
+
+
+class TunedScryptPasswordHasher(ScryptPasswordHasher):
+    work_factor = settings.SCRYPT_WORK_FACTOR
+    block_size = settings.SCRYPT_BLOCK_SIZE
+    parallelism = settings.SCRYPT_PARALLELISM
+    # scrypt needs 128 * work_factor * block_size bytes; leave headroom for OpenSSL
+    maxmem = 256 * work_factor * block_size
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Needs the optional argon2-cffi package."""
+    time_cost = settings.ARGON2_TIME_COST
+    memory_cost = settings.ARGON2_MEMORY_COST
+    parallelism = settings.ARGON2_PARALLELISM
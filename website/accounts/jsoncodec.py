@@ -0,0 +1,81 @@
+"""
+JSON encoding and decoding for the JSONField columns and the webhook.
+
+JSON_CODEC picks the implementation: "orjson" (needs the orjson package),
+"json" (the standard library) or "auto", which uses orjson when it is
+installed. orjson encodes and parses Stripe payloads several times faster;
+`manage.py benchmark_json` measures both on invoice-sized events.
+
+Django's JSONField calls json.dumps(value, cls=encoder) and
+json.loads(value, cls=decoder), so the codec plugs in as the encoder and
+decoder classes below. Whatever orjson refuses (integers beyond 64 bits,
+non-string keys, NaN) goes through the standard library instead, so
+every value the stdlib codec accepted still round-trips.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def codec_name(name=None):
+    """The codec in use for `name` (default settings.JSON_CODEC): "orjson" or "json"."""
+    name = name or settings.JSON_CODEC
+    if name == 'auto':
+        return 'orjson' if orjson is not None else 'json'
+    if name == 'orjson' and orjson is None:
+        raise ImproperlyConfigured('JSON_CODEC = "orjson" needs orjson: pip install orjson')
+    if name not in ('orjson', 'json'):
+        raise ImproperlyConfigured(f'Unknown JSON_CODEC {name!r}; use "auto", "orjson" or "json"')
+    return name
+
+
+def dumps(value, codec=None):
+    """Encode `value` as a JSON string."""
+    if codec_name(codec) == 'orjson':
+        try:
+            return orjson.dumps(value).decode()
+        except TypeError:
+            pass
+    return json.dumps(value)
+
+
+def loads(data, codec=None):
+    """Parse a JSON str or bytes; raises ValueError when it is not JSON."""
+    if codec_name(codec) == 'orjson':
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # The stdlib also accepts NaN and Infinity; it raises for real errors
+            pass
+    return json.loads(data)
+
+
+class JSONEncoder(json.JSONEncoder):
+    """JSONField encoder that encodes with the configured codec."""
+
+    def encode(self, o):
+        # orjson has no indent or sort_keys equivalent here; those callers get the stdlib
+        if codec_name() == 'orjson' and self.indent is None and not self.sort_keys:
+            try:
+                return orjson.dumps(o).decode()
+            except TypeError:
+                pass
+        return super().encode(o)
+
+
+class JSONDecoder(json.JSONDecoder):
+    """JSONField decoder that parses with the configured codec."""
+
+    def decode(self, s, *args, **kwargs):
+        if codec_name() == 'orjson':
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+        return super().decode(s, *args, **kwargs)
@@ -0,0 +1,84 @@
+"""
+Periodic cleanup jobs, run by `manage.py run_scheduler` (see accounts.scheduler).
+
+Every job works in batches: each batch is one short transaction over at most
+`batch_size` rows, and the job sleeps `pause` seconds between batches so it
+never holds locks or saturates the database for long. Each returns the
+number of rows it removed or cleared.
+"""
+import time
+from datetime import timedelta, timezone as dt_timezone
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBSessionStore
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import partitions, rollups
+from .models import Profile, RollupState, SubscriptionEvent
+
+
+def _in_batches(queryset, apply, batch_size, pause):
+    done = 0
+    while True:
+        with transaction.atomic():
+            keys = list(queryset.values_list('pk', flat=True)[:batch_size])
+            if not keys:
+                return done
+            done += apply(queryset.model._default_manager.filter(pk__in=keys))
+        if pause:
+            time.sleep(pause)
+
+
+def _delete(queryset):
+    deleted, _ = queryset.delete()
+    return deleted
+
+
+def session_model():
+    """The model behind SESSION_ENGINE, or None when sessions are not stored in the database."""
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    return store.get_model_class() if issubclass(store, DBSessionStore) else None
+
+
+def purge_sessions(batch_size=1000, pause=0.0):
+    """Delete expired django_session rows."""
+    model = session_model()
+    if model is None:
+        return 0
+    return _in_batches(model.objects.filter(expire_date__lt=timezone.now()), _delete, batch_size, pause)
+
+
+def clear_abandoned_2fa_secrets(max_age_hours=24, batch_size=1000, pause=0.0):
+    """Clear secrets enable_2fa issued that were never confirmed within `max_age_hours`."""
+    cutoff = timezone.now() - timedelta(hours=max_age_hours)
+    abandoned = Profile.objects.filter(two_factor_enabled=False).exclude(
+        Q(two_factor_secret__isnull=True) | Q(two_factor_secret=''),
+    ).filter(
+        # Secrets issued before the timestamp existed count as abandoned
+        Q(two_factor_secret_created_at__lt=cutoff) | Q(two_factor_secret_created_at__isnull=True),
+    )
+    return _in_batches(abandoned, lambda batch: batch.update(two_factor_secret=None, two_factor_secret_created_at=None), batch_size, pause)
+
+
+def purge_old_events(retention_days=None, batch_size=1000, pause=0.0):
+    """
+    Delete SubscriptionEvent rows older than the retention period.
+
+    Only events already folded into the daily rollups are removed, so the
+    reports keep their totals. Whole UTC days go at once, which lets
+    rollups.rebuild() keep the rollups of every day before the oldest event
+    left. On PostgreSQL whole monthly partitions are dropped first; batches
+    only delete what is left in the boundary month.
+    """
+    retention_days = retention_days or settings.SUBSCRIPTION_EVENT_RETENTION_DAYS
+    if not retention_days:
+        return 0
+    rolled_up = RollupState.objects.filter(name=rollups.STATE_NAME).values_list('last_event_id', flat=True).first() or 0
+    cutoff = (timezone.now() - timedelta(days=retention_days)).astimezone(dt_timezone.utc)
+    cutoff = cutoff.replace(hour=0, minute=0, second=0, microsecond=0)
+    dropped = partitions.drop_partitions_before(cutoff, max_event_id=rolled_up)
+    old = SubscriptionEvent.objects.filter(created__lt=cutoff, pk__lte=rolled_up)
+    return dropped + _in_batches(old, _delete, batch_size, pause)
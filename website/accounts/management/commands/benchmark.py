@@ -0,0 +1,66 @@
+import os
+import tempfile
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from accounts.benchmarks import fake_stripe, runner
+
+DEFAULT_BASELINE = Path(runner.__file__).with_name('baseline.json')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the accounts views against a fake Stripe server and compare with a stored baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', choices=sorted(runner.SCENARIOS), help='Scenario to run; repeat for several. Default: all.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent client threads.')
+        parser.add_argument('--events', type=int, default=500, help='Subscription events in the fixture.')
+        parser.add_argument('--stripe-latency', type=float, default=0.0, help='Seconds the fake Stripe server waits before answering.')
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help='Baseline JSON file.')
+        parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative throughput/latency regression.')
+        parser.add_argument('--count-tolerance', type=float, default=0.1, help='Allowed relative increase in queries and Stripe calls per request.')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenario'] or list(runner.SCENARIOS)
+        results = {}
+        setup_test_environment()
+        with tempfile.TemporaryDirectory() as tmp:
+            # A file database lets the client threads share data without shared-cache locking
+            connections['default'].settings_dict['TEST']['NAME'] = os.path.join(tmp, 'benchmark.sqlite3')
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                with fake_stripe.FakeStripeServer(latency=options['stripe_latency']) as server, \
+                        fake_stripe.use_fake_stripe(server), \
+                        override_settings(STRIPE_WEBHOOK_SECRET=runner.WEBHOOK_SECRET):
+                    user = runner.create_fixtures(options['events'])
+                    for scenario in scenarios:
+                        results[scenario] = runner.run_scenario(scenario, user, options['requests'], options['concurrency'])
+                        self._report(scenario, results[scenario])
+            finally:
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+
+        if options['save_baseline']:
+            runner.save_baseline(options['baseline'], results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        baseline = runner.load_baseline(options['baseline'])
+        if baseline is None:
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --save-baseline to create one.")
+            return
+        regressions = runner.compare(results, baseline, options['tolerance'], options['count_tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n  ' + '\n  '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def _report(self, scenario, result):
+        self.stdout.write(
+            f"{scenario:22} {result['requests_per_second']:>8} req/s  "
+            f"p50 {result['p50_ms']:>7} ms  p95 {result['p95_ms']:>7} ms  p99 {result['p99_ms']:>7} ms  "
+            f"{result['queries_per_request']:>5} queries/req  {result['stripe_calls_per_request']:>4} stripe/req"
+        )
@@ -0,0 +1,52 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+def _time_hashes(hasher_path, rounds):
+    """Hash `rounds` passwords with a fresh salt each and return the seconds taken."""
+    hasher = import_string(hasher_path)()
+    start = time.perf_counter()
+    for i in range(rounds):
+        hasher.encode(f'benchmark-password-{i}', hasher.salt())
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Measure password hashes per second per core for each configured hasher, to size login capacity.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', action='append', choices=sorted(settings.PASSWORD_HASHER_CHOICES), help='Hasher to measure; repeat for several. Default: all.')
+        parser.add_argument('--rounds', type=int, default=10, help='Hashes per process.')
+        parser.add_argument('--processes', type=int, default=1, help='Hash in this many processes at once to check how throughput scales.')
+
+    def handle(self, *args, **options):
+        names = options['hasher'] or list(settings.PASSWORD_HASHER_CHOICES)
+        rounds, processes = options['rounds'], options['processes']
+        cores = os.cpu_count() or 1
+        self.stdout.write(f'{rounds} hashes x {processes} process(es), {cores} cores available')
+        for name in names:
+            path = settings.PASSWORD_HASHER_CHOICES[name]
+            try:
+                # Warms up, and fails fast when the hasher's optional library is missing
+                _time_hashes(path, 1)
+            except ValueError as e:
+                self.stdout.write(f'{name:8} skipped: {e}')
+                continue
+            start = time.perf_counter()
+            if processes == 1:
+                busy = [_time_hashes(path, rounds)]
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    busy = list(pool.map(_time_hashes, [path] * processes, [rounds] * processes))
+            wall = time.perf_counter() - start
+            per_core = rounds * len(busy) / sum(busy)
+            preferred = ' (preferred)' if settings.PASSWORD_HASHERS[0] == path else ''
+            self.stdout.write(
+                f'{name:8} {1000 / per_core:8.1f} ms/hash  {per_core:8.1f} hashes/s per core  '
+                f'{rounds * processes / wall:8.1f} hashes/s measured  ~{per_core * cores:8.1f} logins/s on {cores} cores{preferred}'
+            )
@@ -0,0 +1,50 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+
+from accounts import jsoncodec
+from accounts.benchmarks import fake_stripe
+
+
+def _time(func, payloads, rounds):
+    """Call func on every payload `rounds` times and return the microseconds per call."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for payload in payloads:
+            func(payload)
+    return (time.perf_counter() - start) / (rounds * len(payloads)) * 1e6
+
+
+class Command(BaseCommand):
+    help = 'Measure JSON encoding and parsing of invoice.paid webhook payloads with each available codec.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=200, help='Passes over the payloads per measurement.')
+        parser.add_argument('--lines', type=int, default=3, help='Invoice lines per payload; more lines make bigger payloads.')
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        events = [
+            fake_stripe.webhook_event('invoice.paid', fake_stripe.full_invoice_object(amount=1000 + i, lines=options['lines']), event_id=f'evt_json_{i}')
+            for i in range(20)
+        ]
+        encoded = [jsoncodec.dumps(event, codec='json') for event in events]
+        size = sum(len(text) for text in encoded) / len(encoded)
+        self.stdout.write(f'{len(events)} invoice.paid events, {size / 1024:.1f} KB each, {rounds} rounds; JSON_CODEC resolves to {jsoncodec.codec_name()}')
+        baseline = None
+        for codec in ('json', 'orjson'):
+            try:
+                jsoncodec.codec_name(codec)
+            except ImproperlyConfigured as e:
+                self.stdout.write(f'{codec:7} skipped: {e}')
+                continue
+            # Warm-up pass, then the measured ones
+            _time(lambda event: jsoncodec.dumps(event, codec), events, 1)
+            dumps = _time(lambda event: jsoncodec.dumps(event, codec), events, rounds)
+            loads = _time(lambda text: jsoncodec.loads(text, codec), encoded, rounds)
+            baseline = baseline or (dumps, loads)
+            self.stdout.write(
+                f'{codec:7} encode {dumps:8.1f} us ({baseline[0] / dumps:4.1f}x)  '
+                f'decode {loads:8.1f} us ({baseline[1] / loads:4.1f}x)'
+            )
@@ -0,0 +1,42 @@
+from contextlib import nullcontext
+from datetime import date
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import exports
+from accounts.models import SubscriptionEvent
+
+
+class Command(BaseCommand):
+    help = 'Stream the subscription event log to a CSV or Parquet file, flattened for offline analysis.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Output file, or - for CSV on stdout.')
+        parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+        parser.add_argument('--chunk-size', type=int, default=exports.DEFAULT_CHUNK_SIZE, help='Rows fetched per round trip and per Parquet row group.')
+        parser.add_argument('--customer', help='Only export this Stripe customer id.')
+        parser.add_argument('--since', type=date.fromisoformat, help='Only export events created on or after this date (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        queryset = SubscriptionEvent.objects.all()
+        if options['customer']:
+            queryset = queryset.filter(customer_id=options['customer'])
+        if options['since']:
+            queryset = queryset.filter(created__date__gte=options['since'])
+        rows = exports.iter_rows(queryset, options['chunk_size'])
+        output = options['output']
+        if options['format'] == 'parquet':
+            if output == '-':
+                raise CommandError('Parquet output needs a file name.')
+            try:
+                count = exports.write_parquet(rows, output, options['chunk_size'])
+            except ImproperlyConfigured as e:
+                raise CommandError(str(e))
+        else:
+            count = -1  # the header line
+            with open(output, 'w', newline='') if output != '-' else nullcontext(self.stdout) as f:
+                for line in exports.iter_csv(rows):
+                    f.write(line)
+                    count += 1
+        self.stderr.write(f'Exported {count} events.')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from accounts import deletion
+
+
+class Command(BaseCommand):
+    help = 'Carry out queued account deletions: cancel Stripe subscriptions, purge events and images, delete the users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many deletions.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Subscription events deleted per transaction.')
+
+    def handle(self, *args, **options):
+        completed, failed = deletion.process_pending(options['limit'], options['batch_size'])
+        self.stdout.write(f'{completed} account deletions completed, {failed} failed.')
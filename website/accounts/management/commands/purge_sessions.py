@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts import maintenance
+
+
+class Command(BaseCommand):
+    help = 'Delete expired django_session rows in small batches, so logins are never blocked behind one long DELETE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement.')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        if maintenance.session_model() is None:
+            self.stdout.write(f'{settings.SESSION_ENGINE} keeps no session rows; nothing to purge.')
+            return
+        purged = maintenance.purge_sessions(options['batch_size'], options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired sessions.'))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the maintenance jobs in settings.MAINTENANCE_SCHEDULE on their cron specs and report what each removed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the jobs due this minute, then exit.')
+        parser.add_argument('--run', action='append', metavar='JOB', help='Run this job now, whatever its schedule (repeatable).')
+        parser.add_argument('--list', action='store_true', help='Show the schedule.')
+
+    def _report(self, report):
+        for name, result, seconds in report:
+            took = 'failed' if seconds is None else f'{seconds:.2f} s'
+            self.stdout.write(f'{name}: {result} ({took})')
+
+    def handle(self, *args, **options):
+        schedule = scheduler.get_schedule()
+        if options['list']:
+            for name, job in schedule.items():
+                self.stdout.write(f"{job['cron'].spec:<16} {name}")
+            return
+        if options['run']:
+            unknown = set(options['run']) - set(schedule)
+            if unknown:
+                raise CommandError(f"Unknown jobs: {', '.join(sorted(unknown))}")
+            self._report([(name, *scheduler.run_job(name, schedule[name])) for name in options['run']])
+            return
+        if options['once']:
+            self._report(scheduler.run_due(timezone.now(), schedule))
+            return
+        last = timezone.now()
+        self.stdout.write(f'Scheduler running {len(schedule)} jobs.')
+        while True:
+            # Sleep to just past the next minute boundary
+            time.sleep(60 - timezone.now().second + 0.5)
+            now = timezone.now()
+            # Minutes missed while a long job ran are caught up, at most an hour back
+            for moment in scheduler.minutes_between(last, now):
+                self._report(scheduler.run_due(moment, schedule))
+            last = now
@@ -0,0 +1,71 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from accounts import taskqueue
+
+
+def _run_threads(threads, poll_interval, stop=None):
+    stop = stop or threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+    workers = [
+        threading.Thread(target=taskqueue.work, args=(stop, poll_interval), name=f'taskworker-{n}')
+        for n in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    while any(worker.is_alive() for worker in workers):
+        # Wake up regularly so signals are handled and lost tasks are requeued
+        stop.wait(poll_interval * 10)
+        if not stop.is_set():
+            taskqueue.requeue_stale()
+        for worker in workers:
+            worker.join(0)
+
+
+def _supervise(processes):
+    """Wait for the worker processes; stop and reap them all when the parent is interrupted or terminated."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    try:
+        while not stop.is_set() and any(process.is_alive() for process in processes):
+            stop.wait(1)
+    except KeyboardInterrupt:
+        pass
+    for process in processes:
+        process.terminate()
+        process.join()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (emails, Stripe customers, image and account cleanup) in a pool of threads and processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Worker threads per process.')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes, each with --threads threads.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds an idle worker waits before looking for due tasks again.')
+        parser.add_argument('--once', action='store_true', help='Run the tasks that are due now in this thread, then exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            taskqueue.requeue_stale()
+            succeeded, failed = taskqueue.run_pending()
+            self.stdout.write(f'{succeeded} tasks succeeded, {failed} failed.')
+            return
+        self.stdout.write(f"Running {options['processes']} x {options['threads']} task workers.")
+        if options['processes'] == 1:
+            _run_threads(options['threads'], options['poll_interval'])
+            return
+        # Children must not share the parent's database connections
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_run_threads, args=(options['threads'], options['poll_interval']), name=f'taskworker-process-{n}')
+            for n in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        _supervise(processes)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts import rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold subscription events received since the last run into the daily rollup tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events per transaction.')
+        parser.add_argument('--lag', type=int, help='Leave events younger than N seconds for the next run (default: ROLLUP_LAG_SECONDS).')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute every rollup from the whole event log.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            processed = rollups.rebuild(options['batch_size'])
+        else:
+            processed = rollups.update(options['batch_size'], options['lag'])
+        self.stdout.write(f'Rolled up {processed} subscription events.')
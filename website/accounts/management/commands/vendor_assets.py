@@ -0,0 +1,37 @@
+import urllib.request
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import assets
+
+
+class Command(BaseCommand):
+    help = 'Download the pinned Bootstrap, Bootstrap Icons and htmx releases into accounts/static/vendor/ so pages load no third-party files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Download files that are already vendored again.')
+
+    def handle(self, *args, **options):
+        static_dir = Path(apps.get_app_config('accounts').path) / 'static'
+        for name, (path, upstream, sri) in assets.VENDORED.items():
+            target = static_dir / path
+            if target.exists() and not options['force']:
+                self.stdout.write(f'{path} already vendored')
+                continue
+            try:
+                with urllib.request.urlopen(upstream, timeout=30) as response:
+                    data = response.read()
+            except OSError as e:
+                raise CommandError(f'Could not download {upstream}: {e}')
+            if sri is not None and assets.integrity(data) != sri:
+                raise CommandError(f'{upstream} does not match its recorded integrity {sri}')
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            if sri is None:
+                self.stdout.write(f'{path} {len(data)} bytes; record its integrity in VENDORED: {assets.integrity(data)}')
+            else:
+                self.stdout.write(f'{path} {len(data)} bytes')
+        assets.source.cache_clear()
+        self.stdout.write(self.style.SUCCESS('Vendored assets are up to date; run collectstatic to fingerprint and compress them.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from accounts import warmup
+
+
+class Command(BaseCommand):
+    help = 'Compile templates, populate the URL resolvers, connect to the databases and load the catalog, reporting how long each took.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stripe', action='store_true', help='Also import and configure the Stripe SDK.')
+
+    def handle(self, *args, **options):
+        report = warmup.run(include_stripe=options['stripe'] or None)
+        for name, (count, seconds) in report.items():
+            status = 'failed' if count is None else count
+            self.stdout.write(f'{name:<12} {status!s:>6} {seconds * 1000:8.1f} ms')
@@ -0,0 +1,216 @@
+"""
+In-process request metrics, exposed in the Prometheus text format.
+
+Each request collects its counters in a RequestMetrics object held in a
+context variable, so the hooks for the database, Stripe and templates only
+have to look it up and add to it. Finished requests are folded into a
+MetricsRegistry, which keeps a bounded sample of recent values per view for
+the quantiles and running totals for _sum and _count.
+"""
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# name, help text
+SUMMARIES = (
+    ('request_seconds', 'Wall time spent handling the request.'),
+    ('db_queries', 'Database queries executed per request.'),
+    ('db_seconds', 'Time spent in database queries per request.'),
+    ('stripe_calls', 'Stripe API calls made per request.'),
+    ('stripe_seconds', 'Time spent waiting on the Stripe API per request.'),
+    ('template_seconds', 'Time spent rendering templates per request.'),
+)
+
+_current = ContextVar('accounts_request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('db_queries', 'db_seconds', 'stripe_calls', 'stripe_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.stripe_calls = 0
+        self.stripe_seconds = 0.0
+        self.template_seconds = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self, sample_size=1024):
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view_name, request_seconds, request_metrics):
+        values = {
+            'request_seconds': request_seconds,
+            'db_queries': request_metrics.db_queries,
+            'db_seconds': request_metrics.db_seconds,
+            'stripe_calls': request_metrics.stripe_calls,
+            'stripe_seconds': request_metrics.stripe_seconds,
+            'template_seconds': request_metrics.template_seconds,
+        }
+        with self._lock:
+            series = self._views.get(view_name)
+            if series is None:
+                series = self._views[view_name] = {
+                    name: [deque(maxlen=self.sample_size), 0.0, 0] for name, _ in SUMMARIES
+                }
+            for name, value in values.items():
+                samples = series[name]
+                samples[0].append(value)
+                samples[1] += value
+                samples[2] += 1
+
+    def snapshot(self):
+        """Return {view: {metric: (sorted samples, sum, count)}} for rendering."""
+        with self._lock:
+            return {
+                view: {name: (sorted(s[0]), s[1], s[2]) for name, s in series.items()}
+                for view, series in self._views.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def render_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for name, help_text in SUMMARIES:
+            metric = f'accounts_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} summary')
+            for view in sorted(snapshot):
+                samples, total, count = snapshot[view][name]
+                for q in QUANTILES:
+                    lines.append(f'{metric}{{view="{view}",quantile="{q}"}} {_quantile(samples, q):g}')
+                lines.append(f'{metric}_sum{{view="{view}"}} {total:g}')
+                lines.append(f'{metric}_count{{view="{view}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _quantile(sorted_samples, q):
+    if not sorted_samples:
+        return 0
+    index = min(len(sorted_samples) - 1, int(q * len(sorted_samples)))
+    return sorted_samples[index]
+
+
+registry = MetricsRegistry(getattr(settings, 'METRICS_SAMPLE_SIZE', 1024))
+
+
+def start_request():
+    """Begin collecting for the current request; returns the token for finish_request."""
+    return _current.set(RequestMetrics())
+
+
+def finish_request(token, view_name, request_seconds):
+    """Record the current request under `view_name` and return its RequestMetrics."""
+    request_metrics = _current.get()
+    _current.reset(token)
+    if request_metrics is not None:
+        registry.observe(view_name, request_seconds, request_metrics)
+    return request_metrics
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrappers hook that times every query."""
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.db_queries += 1
+        request_metrics.db_seconds += time.perf_counter() - start
+
+
+def _install_query_wrapper(sender, connection, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+def _timed_stripe_call(func):
+    @wraps(func)
+    def _wrapped(*args, **kwargs):
+        request_metrics = _current.get()
+        if request_metrics is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            request_metrics.stripe_calls += 1
+            request_metrics.stripe_seconds += time.perf_counter() - start
+    return _wrapped
+
+
+def _timed_stripe_call_async(func):
+    @wraps(func)
+    async def _wrapped(*args, **kwargs):
+        request_metrics = _current.get()
+        if request_metrics is None:
+            return await func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            request_metrics.stripe_calls += 1
+            request_metrics.stripe_seconds += time.perf_counter() - start
+    return _wrapped
+
+
+def _timed_render(func):
+    @wraps(func)
+    def _wrapped(*args, **kwargs):
+        request_metrics = _current.get()
+        if request_metrics is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            request_metrics.template_seconds += time.perf_counter() - start
+    return _wrapped
+
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def install_stripe_hooks(stripe_module):
+    """Time every call made through the Stripe SDK's HTTP clients."""
+    http_client = stripe_module._http_client.HTTPClient
+    if getattr(http_client, '_accounts_metrics_installed', False):
+        return
+    http_client.request_with_retries = _timed_stripe_call(http_client.request_with_retries)
+    http_client.request_stream_with_retries = _timed_stripe_call(http_client.request_stream_with_retries)
+    http_client.request_with_retries_async = _timed_stripe_call_async(http_client.request_with_retries_async)
+    http_client.request_stream_with_retries_async = _timed_stripe_call_async(http_client.request_stream_with_retries_async)
+    http_client._accounts_metrics_installed = True
+
+
+def install():
+    """Hook the database and template layers. Safe to call repeatedly."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+        from django.template.backends.django import Template
+
+        connection_created.connect(_install_query_wrapper, dispatch_uid='accounts_metrics_query_wrapper')
+        for connection in connections.all(initialized_only=True):
+            _install_query_wrapper(None, connection)
+        # The Stripe hooks are installed by services.stripe_service when the SDK is first loaded
+        Template.render = _timed_render(Template.render)
+        _installed = True
@@ -0,0 +1,76 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import budgets, metrics, routers
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.url_name or match.view_name or 'unnamed'
+
+
+class RequestMetricsMiddleware:
+    """Record wall time, DB, Stripe and template timings per URL name and flag views over budget."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        metrics.install()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            self._finish(request, token, start)
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            self._finish(request, token, start)
+
+    def _finish(self, request, token, start):
+        seconds = time.perf_counter() - start
+        request_metrics = metrics.finish_request(token, _view_name(request), seconds)
+        budgets.check_request(request, request_metrics, seconds)
+
+
+class ReplicaPinningMiddleware:
+    """Give accounts.routers the current request, so it can keep recent writers on the primary."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        tokens = routers.start_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            routers.finish_request(tokens)
+
+    async def __acall__(self, request):
+        tokens = routers.start_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            routers.finish_request(tokens)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_subscriptionevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('stripe_customer_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('stripe_subscription_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('profile_image', models.CharField(blank=True, max_length=255)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('events_deleted', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='account_deletion', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_accountdeletion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscriptionevent',
+            name='customer_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='subscriptionevent',
+            name='event_type',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
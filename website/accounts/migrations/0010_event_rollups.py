@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-19 16:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_subscriptionevent_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyEventRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('currency', models.CharField(blank=True, max_length=3)),
+                ('new_subscriptions', models.PositiveIntegerField(default=0)),
+                ('cancellations', models.PositiveIntegerField(default=0)),
+                ('reactivations', models.PositiveIntegerField(default=0)),
+                ('invoices_paid', models.PositiveIntegerField(default=0)),
+                ('invoices_failed', models.PositiveIntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-day', 'currency'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'currency'), name='unique_rollup_day_currency')],
+            },
+        ),
+    ]
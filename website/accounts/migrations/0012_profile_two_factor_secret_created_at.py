@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='two_factor_secret_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
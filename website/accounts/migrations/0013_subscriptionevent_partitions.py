@@ -0,0 +1,99 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:21
+
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Frozen copy of what accounts/partitions.py did when this migration was written
+TABLE = 'accounts_subscriptionevent'
+UNPARTITIONED_TABLE = f'{TABLE}_unpartitioned'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(value):
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc).date()
+    return value.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def months_between(first, last):
+    month, last = month_start(first), month_start(last)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def create_partition_sql(month):
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{TABLE}_p{month:%Y_%m}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM ('{month.isoformat()}T00:00:00+00:00') TO ('{add_months(month, 1).isoformat()}T00:00:00+00:00')"
+    )
+
+
+def partition_table(apps, schema_editor):
+    """PostgreSQL only: move accounts_subscriptionevent into a table partitioned by month."""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+            [TABLE],
+        )
+        if cursor.fetchone() is not None:
+            return
+        # The plain indexes are recreated on the partitioned table under the same names,
+        # once the old table and its indexes are gone
+        cursor.execute(
+            'SELECT i.indexdef FROM pg_indexes i JOIN pg_class c ON c.relname = i.indexname '
+            'JOIN pg_index x ON x.indexrelid = c.oid WHERE i.tablename = %s AND NOT x.indisunique',
+            [TABLE],
+        )
+        index_sql = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'SELECT min(created) FROM "{TABLE}"')
+        oldest = cursor.fetchone()[0] or timezone.now()
+
+        cursor.execute(f'ALTER TABLE "{TABLE}" RENAME TO "{UNPARTITIONED_TABLE}"')
+        cursor.execute(
+            f'CREATE TABLE "{TABLE}" (LIKE "{UNPARTITIONED_TABLE}" INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            'PARTITION BY RANGE (created)'
+        )
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD PRIMARY KEY (id, created)')
+        cursor.execute(f'ALTER TABLE "{TABLE}" ADD CONSTRAINT "{TABLE}_event_id_created_uniq" UNIQUE (event_id, created)')
+        for month in months_between(oldest, add_months(month_start(timezone.now()), 3)):
+            cursor.execute(create_partition_sql(month))
+        cursor.execute(f'CREATE TABLE "{DEFAULT_PARTITION}" PARTITION OF "{TABLE}" DEFAULT')
+
+        cursor.execute(f'INSERT INTO "{TABLE}" SELECT * FROM "{UNPARTITIONED_TABLE}"')
+        cursor.execute(f'SELECT setval(pg_get_serial_sequence(%s, %s), coalesce(max(id), 0) + 1, false) FROM "{TABLE}"', [TABLE, 'id'])
+        cursor.execute(f'DROP TABLE "{UNPARTITIONED_TABLE}"')
+        for sql in index_sql:
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_profile_two_factor_secret_created_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscriptionevent',
+            name='customer_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptionevent',
+            index=models.Index(fields=['customer_id', '-created'], name='accounts_se_customer_created'),
+        ),
+        # PostgreSQL only: partition the table by month (see accounts/partitions.py)
+        migrations.RunPython(partition_table, migrations.RunPython.noop),
+    ]
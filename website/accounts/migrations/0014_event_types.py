@@ -0,0 +1,39 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:40
+
+# The switch to EventType is split in three migrations, each in its own
+# transaction: this one adds the table and a nullable SubscriptionEvent.type,
+# 0015 fills it in and 0016 drops event_type and makes type required.
+# PostgreSQL refuses to ALTER a table in the same transaction that updated
+# its rows ("pending trigger events"), so the data step cannot share one
+# with the schema changes around it.
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_subscriptionevent_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventType',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('code', models.CharField(max_length=100, unique=True)),
+                ('name', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='subscriptionevent',
+            name='type',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='events', to='accounts.eventtype'),
+        ),
+        migrations.AlterField(
+            model_name='subscriptionevent',
+            name='event_type',
+            field=models.CharField(max_length=255, blank=True),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:40
+
+from django.db import migrations
+
+# The friendly names as of this migration; later changes to accounts.models.EVENT_NAMES must not alter it
+EVENT_NAMES = {
+    'customer.subscription.created': 'Subscription Created',
+    'customer.subscription.deleted': 'Subscription Cancelled',
+    'customer.subscription.updated': 'Subscription Updated',
+    'invoice.created': 'Invoice Created',
+    'invoice.deleted': 'Invoice Deleted',
+    'invoice.finalization_failed': 'Invoice Finalization Failed',
+    'invoice.finalized': 'Invoice Finalized',
+    'invoice.marked_uncollectible': 'Invoice Marked Uncollectible',
+    'invoice.overdue': 'Invoice Overdue',
+    'invoice.overpaid': 'Invoice Overpaid',
+    'invoice.paid': 'Invoice Paid',
+    'invoice.payment_action_required': 'Invoice Payment Action Required',
+    'invoice.payment_failed': 'Invoice Payment Failed',
+    'invoice.payment_succeeded': 'Invoice Payment Succeeded',
+    'invoice.sent': 'Invoice Sent',
+    'invoice.upcoming': 'Invoice Upcoming',
+    'invoice.updated': 'Invoice Updated',
+    'invoice.voided': 'Invoice Voided',
+    'invoice.will_be_due': 'Invoice Will Be Due',
+    'invoice_payment.paid': 'Invoice Payment Paid',
+}
+
+
+def fill_event_types(apps, schema_editor):
+    EventType = apps.get_model('accounts', 'EventType')
+    SubscriptionEvent = apps.get_model('accounts', 'SubscriptionEvent')
+    codes = set(EVENT_NAMES) | set(SubscriptionEvent.objects.values_list('event_type', flat=True).distinct())
+    for code in sorted(codes):
+        event_type, _ = EventType.objects.get_or_create(code=code, defaults={'name': EVENT_NAMES.get(code, code)})
+        SubscriptionEvent.objects.filter(event_type=code).update(type=event_type)
+
+
+def restore_event_type_strings(apps, schema_editor):
+    EventType = apps.get_model('accounts', 'EventType')
+    SubscriptionEvent = apps.get_model('accounts', 'SubscriptionEvent')
+    for event_type in EventType.objects.all():
+        SubscriptionEvent.objects.filter(type=event_type).update(event_type=event_type.code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_event_types'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_event_types, restore_event_type_strings),
+    ]
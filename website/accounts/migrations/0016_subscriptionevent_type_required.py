@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_fill_event_types'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='subscriptionevent',
+            name='event_type',
+        ),
+        migrations.AlterField(
+            model_name='subscriptionevent',
+            name='type',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='events', to='accounts.eventtype'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriptionevent',
+            index=models.Index(fields=['customer_id', 'type', '-created'], name='accounts_se_customer_type'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 17:28
+
+import accounts.jsoncodec
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_subscriptionevent_type_required'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='recovery_codes',
+            field=models.JSONField(blank=True, decoder=accounts.jsoncodec.JSONDecoder, default=list, encoder=accounts.jsoncodec.JSONEncoder, null=True),
+        ),
+        migrations.AlterField(
+            model_name='subscriptionevent',
+            name='data',
+            field=models.JSONField(decoder=accounts.jsoncodec.JSONDecoder, encoder=accounts.jsoncodec.JSONEncoder),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-19 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_task_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='stripe_customer_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='stripe_subscription_id',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
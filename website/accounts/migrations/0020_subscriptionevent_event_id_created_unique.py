@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-19 19:05
+
+from django.db import migrations, models
+
+# The constraint migration 0013 put on the partitioned table, under the same name
+CONSTRAINT = models.UniqueConstraint(fields=['event_id', 'created'], name='accounts_subscriptionevent_event_id_created_uniq')
+
+
+def unpartitioned_field():
+    field = models.CharField(max_length=255)
+    field.set_attributes_from_name('event_id')
+    return field
+
+
+def weaken_event_id_unique(apps, schema_editor):
+    """
+    Make event_id unique per `created` on every database, as it already is on
+    PostgreSQL, where a partitioned table cannot enforce a unique constraint
+    without its partition key.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    SubscriptionEvent = apps.get_model('accounts', 'SubscriptionEvent')
+    field = unpartitioned_field()
+    field.model = SubscriptionEvent
+    schema_editor.alter_field(SubscriptionEvent, SubscriptionEvent._meta.get_field('event_id'), field)
+    schema_editor.add_constraint(SubscriptionEvent, CONSTRAINT)
+
+
+def restore_event_id_unique(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        return
+    SubscriptionEvent = apps.get_model('accounts', 'SubscriptionEvent')
+    field = unpartitioned_field()
+    field.model = SubscriptionEvent
+    schema_editor.remove_constraint(SubscriptionEvent, CONSTRAINT)
+    schema_editor.alter_field(SubscriptionEvent, field, SubscriptionEvent._meta.get_field('event_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0019_profile_stripe_id_indexes'),
+    ]
+
+    operations = [
+        # The model state catches up with what 0013 did on PostgreSQL; the
+        # other databases get the same constraint so the two never drift
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='subscriptionevent',
+                    name='event_id',
+                    field=models.CharField(max_length=255),
+                ),
+                migrations.AddConstraint(
+                    model_name='subscriptionevent',
+                    constraint=CONSTRAINT,
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(weaken_event_id_unique, restore_event_id_unique),
+            ],
+        ),
+    ]
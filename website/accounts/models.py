@@ -1,22 +1,27 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from .jsoncodec import JSONDecoder, JSONEncoder
+
 # Create your models here.
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True, max_length=2000)
     email_confirmed = models.BooleanField(default=False)
-    stripe_customer_id = models.CharField(max_length=100, blank=True, null=True)
-    stripe_subscription_id = models.CharField(max_length=100, blank=True, null=True)
+    # Indexed for the webhook's lookup by customer and the admin search
+    stripe_customer_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    stripe_subscription_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     subscription_status = models.CharField(max_length=50, blank=True, null=True)
     # Add more fields as needed
     profile_image = models.ImageField(upload_to='profile_images/', blank=True, null=True)
     two_factor_enabled = models.BooleanField(default=False)
     two_factor_secret = models.CharField(max_length=32, blank=True, null=True)
-    recovery_codes = models.JSONField(default=list, blank=True, null=True)
+    # When enable_2fa issued the secret; unconfirmed secrets are cleared by the maintenance scheduler
+    two_factor_secret_created_at = models.DateTimeField(blank=True, null=True)
+    recovery_codes = models.JSONField(default=list, blank=True, null=True, encoder=JSONEncoder, decoder=JSONDecoder)
 
     def __str__(self):
         return f"{self.user.username} Profile"
@@ -26,6 +31,12 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
 
+@receiver(post_save, sender=Profile)
+def pin_user_to_primary(sender, instance, **kwargs):
+    # Subscription changes (cancel, reactivate, webhooks) must show up on the user's next pages
+    from .routers import pin_user
+    pin_user(instance.user_id)
+
 class Membership(models.Model):
     name = models.CharField(max_length=50)
     stripe_price_id = models.CharField(max_length=100)
@@ -34,13 +45,167 @@ class Membership(models.Model):
     def __str__(self):
         return self.name
 
+@receiver([post_save, post_delete], sender=Membership)
+def invalidate_membership_catalog(sender, **kwargs):
+    from .catalog import invalidate
+    invalidate()
+
+# Friendly names shown in the event log; other Stripe types are shown as they are
+EVENT_NAMES = {
+    'customer.subscription.created': 'Subscription Created',
+    'customer.subscription.deleted': 'Subscription Cancelled',
+    'customer.subscription.updated': 'Subscription Updated',
+    'invoice.created': 'Invoice Created',
+    'invoice.deleted': 'Invoice Deleted',
+    'invoice.finalization_failed': 'Invoice Finalization Failed',
+    'invoice.finalized': 'Invoice Finalized',
+    'invoice.marked_uncollectible': 'Invoice Marked Uncollectible',
+    'invoice.overdue': 'Invoice Overdue',
+    'invoice.overpaid': 'Invoice Overpaid',
+    'invoice.paid': 'Invoice Paid',
+    'invoice.payment_action_required': 'Invoice Payment Action Required',
+    'invoice.payment_failed': 'Invoice Payment Failed',
+    'invoice.payment_succeeded': 'Invoice Payment Succeeded',
+    'invoice.sent': 'Invoice Sent',
+    'invoice.upcoming': 'Invoice Upcoming',
+    'invoice.updated': 'Invoice Updated',
+    'invoice.voided': 'Invoice Voided',
+    'invoice.will_be_due': 'Invoice Will Be Due',
+    'invoice_payment.paid': 'Invoice Payment Paid',
+}
+
+class EventType(models.Model):
+    """A Stripe event type; SubscriptionEvent rows point at it with a two-byte key instead of repeating the string."""
+    id = models.SmallAutoField(primary_key=True)
+    code = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return self.name
+
+@receiver([post_save, post_delete], sender=EventType)
+def invalidate_event_types(sender, using, created=False, **kwargs):
+    from .event_types import invalidate
+    # New rows join the cache through event_types.get(); a changed or deleted
+    # one reloads it once committed, so it never caches a row that is rolled back
+    if not created:
+        transaction.on_commit(invalidate, using=using)
+
 class SubscriptionEvent(models.Model):
-    event_id = models.CharField(max_length=255, unique=True)
-    event_type = models.CharField(max_length=255)
+    # Unique with `created`, not alone: the partitioned table on PostgreSQL
+    # cannot enforce a constraint without its partition key (see
+    # accounts/partitions.py), so the webhook looks events up by both. For the
+    # same reason the primary key there is (id, created); id still comes from
+    # the identity sequence, so the ORM keeps treating it as the key.
+    event_id = models.CharField(max_length=255)
+    type = models.ForeignKey(EventType, on_delete=models.PROTECT, related_name='events')
     created = models.DateTimeField()
-    data = models.JSONField()
+    data = models.JSONField(encoder=JSONEncoder, decoder=JSONDecoder)
     customer_id = models.CharField(max_length=255, blank=True, null=True)
     subscription_id = models.CharField(max_length=255, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # Serves the per-customer event log newest first; also covers lookups by customer_id alone
+            models.Index(fields=['customer_id', '-created'], name='accounts_se_customer_created'),
+            # The event log filtered to one type
+            models.Index(fields=['customer_id', 'type', '-created'], name='accounts_se_customer_type'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['event_id', 'created'], name='accounts_subscriptionevent_event_id_created_uniq'),
+        ]
+
+    @property
+    def event_type(self):
+        """The Stripe event type string; select_related('type') when reading many events."""
+        return self.type.code
+
+    @event_type.setter
+    def event_type(self, code):
+        from .event_types import get
+        self.type = get(code)
+
     def __str__(self):
         return f"{self.event_type} ({self.event_id})"
+
+class AccountDeletion(models.Model):
+    """A requested account deletion, carried out by accounts.deletion outside the request."""
+    user = models.OneToOneField(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='account_deletion')
+    # Copied from the account, so the record still says what was removed after the user is gone
+    username = models.CharField(max_length=150)
+    stripe_customer_id = models.CharField(max_length=100, blank=True, null=True)
+    stripe_subscription_id = models.CharField(max_length=100, blank=True, null=True)
+    profile_image = models.CharField(max_length=255, blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    events_deleted = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        state = 'completed' if self.completed_at else 'pending'
+        return f"Deletion of {self.username} ({state})"
+
+class DailyEventRollup(models.Model):
+    """Per-day subscription and invoice totals, maintained by accounts.rollups."""
+    day = models.DateField()
+    # Invoice currency, upper case; blank for events that carry no amount
+    currency = models.CharField(max_length=3, blank=True)
+    new_subscriptions = models.PositiveIntegerField(default=0)
+    cancellations = models.PositiveIntegerField(default=0)
+    reactivations = models.PositiveIntegerField(default=0)
+    invoices_paid = models.PositiveIntegerField(default=0)
+    invoices_failed = models.PositiveIntegerField(default=0)
+    # In the currency's smallest unit, as Stripe reports it
+    revenue = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'currency'], name='unique_rollup_day_currency'),
+        ]
+        ordering = ['-day', 'currency']
+
+    def __str__(self):
+        return f"{self.day} {self.currency or '-'}"
+
+class RollupState(models.Model):
+    """High-water mark: the last SubscriptionEvent primary key folded into the rollups."""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_event_id}"
+
+class Task(models.Model):
+    """A unit of background work, claimed and run by `manage.py runworker` (see accounts.taskqueue)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    # Registered name of the task function, e.g. accounts.tasks.send_confirmation_email
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Last sign of life from the worker running the task (see taskqueue.heartbeat)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    # Seconds the last attempt took
+    duration = models.FloatField(blank=True, null=True)
+    worker = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
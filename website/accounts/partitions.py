@@ -0,0 +1,163 @@
+"""
+Monthly partitions of the SubscriptionEvent table on PostgreSQL.
+
+Migration 0013 turns accounts_subscriptionevent into a table partitioned
+by range on `created`, one partition per calendar month plus a DEFAULT
+partition for anything outside them. PostgreSQL sends each INSERT from
+the webhook to the right partition itself, and a query with a bound on
+`created` only reads the months it needs. Queries by customer use the
+(customer_id, created) index in each partition and merge the results in
+order, so the event log still stops after one page.
+
+A partitioned table's unique constraints must include the partition key,
+so the primary key becomes (id, created) and event_id is unique per
+`created` rather than globally. The model declares that constraint on every
+database (migration 0020), and the webhook looks an event up by event_id
+and `created` together: a Stripe event always carries the same `created`,
+so a redelivered webhook still finds its row, and two concurrent
+deliveries collide on the constraint.
+
+ensure_partitions() creates the coming months ahead of time (it runs from
+the scheduler), and drop_partitions_before() lets the retention job detach
+and drop whole months instead of deleting their rows one batch at a time.
+
+SQLite has no table partitioning. Splitting the table into one table per
+month behind the ORM would break every query that spans months (the event
+log, exports, rollups), so there the table stays whole: the
+(customer_id, created) index serves the event log and retention falls
+back to batched row deletes. Every function here is a no-op on SQLite.
+"""
+import logging
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'accounts_subscriptionevent'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def supported(using=DEFAULT_DB_ALIAS):
+    return connections[using].vendor == 'postgresql'
+
+
+def month_start(value):
+    """First day of the month `value` (a date or aware datetime) falls in, in UTC."""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc).date()
+    return value.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def months_between(first, last):
+    """Every month from the month of `first` to the month of `last`, inclusive."""
+    month, last = month_start(first), month_start(last)
+    while month <= last:
+        yield month
+        month = add_months(month, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y_%m}'
+
+
+def partition_month(name):
+    """The month a partition named by partition_name() holds, or None for any other table."""
+    prefix = f'{TABLE}_p'
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], '%Y_%m').date()
+    except ValueError:
+        return None
+
+
+def create_partition_sql(month):
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM ('{month.isoformat()}T00:00:00+00:00') TO ('{add_months(month, 1).isoformat()}T00:00:00+00:00')"
+    )
+
+
+def is_partitioned(using=DEFAULT_DB_ALIAS):
+    if not supported(using):
+        return False
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions(using=DEFAULT_DB_ALIAS):
+    """The monthly partitions that exist, as [(month, table name)] oldest first."""
+    if not supported(using):
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s AND pg_table_is_visible(p.oid)',
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return sorted((partition_month(name), name) for name in names if partition_month(name))
+
+
+def ensure_partitions(months_ahead=3, using=DEFAULT_DB_ALIAS):
+    """Create the partitions for this month and the next `months_ahead`; returns how many were new."""
+    if not is_partitioned(using):
+        return 0
+    existing = {month for month, _ in partitions(using)}
+    this_month = month_start(timezone.now())
+    created = 0
+    for month in months_between(this_month, add_months(this_month, months_ahead)):
+        if month in existing:
+            continue
+        try:
+            with transaction.atomic(using=using), connections[using].cursor() as cursor:
+                cursor.execute(create_partition_sql(month))
+        except Exception as e:
+            # Usually rows for that month already sit in the DEFAULT partition
+            logger.warning('Could not create partition %s: %s', partition_name(month), e)
+            continue
+        created += 1
+    return created
+
+
+def droppable(existing, cutoff):
+    """The (month, name) partitions in `existing` that hold only rows created before `cutoff`."""
+    return [(month, name) for month, name in existing if datetime.combine(add_months(month, 1), datetime.min.time(), dt_timezone.utc) <= cutoff]
+
+
+def drop_partitions_before(cutoff, max_event_id=None, using=DEFAULT_DB_ALIAS):
+    """
+    Detach and drop every monthly partition that ends before `cutoff`;
+    returns the number of rows dropped.
+
+    A partition holding an event with a primary key above `max_event_id` is
+    kept, so events the rollups have not counted yet are never lost.
+    """
+    if not is_partitioned(using):
+        return 0
+    dropped = 0
+    for month, name in droppable(partitions(using), cutoff):
+        with transaction.atomic(using=using), connections[using].cursor() as cursor:
+            cursor.execute(f'SELECT count(*), max(id) FROM "{name}"')
+            rows, newest = cursor.fetchone()
+            if max_event_id is not None and newest is not None and newest > max_event_id:
+                logger.info('Keeping partition %s: it has events not rolled up yet', name)
+                continue
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+        logger.info('Dropped partition %s with %d events', name, rows)
+        dropped += rows
+    return dropped
+
@@ -0,0 +1,130 @@
+"""
+Incremental daily rollups of the SubscriptionEvent log.
+
+update() folds events with a primary key above the stored high-water mark
+into DailyEventRollup rows, one batch per transaction, and advances the mark
+in the same transaction, so an interrupted run resumes where it stopped and
+no event is counted twice. Reports read only the rollup rows.
+
+Primary keys are treated as ingestion order. That holds for SQLite's single
+writer; with concurrent writers a row can commit after a higher one, so the
+mark never passes an event younger than ROLLUP_LAG_SECONDS (see `--lag`):
+Stripe delivers an event moments after creating it, and its webhook commits
+well within the lag. A redelivered old event that commits late can still
+land below the mark; `--rebuild` recounts it.
+"""
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import DailyEventRollup, RollupState, SubscriptionEvent
+
+STATE_NAME = 'daily_events'
+COUNTERS = ('new_subscriptions', 'cancellations', 'reactivations', 'invoices_paid', 'invoices_failed', 'revenue')
+
+
+def classify(event_type, data):
+    """Return (currency, {counter: increment}) for one event; empty when it is not counted."""
+    obj = data.get('object') if isinstance(data, dict) else None
+    obj = obj if isinstance(obj, dict) else {}
+    currency = (obj.get('currency') or '').upper()
+    if event_type == 'customer.subscription.created':
+        return '', {'new_subscriptions': 1}
+    if event_type == 'customer.subscription.deleted':
+        return '', {'cancellations': 1}
+    if event_type == 'customer.subscription.updated':
+        previous = data.get('previous_attributes') or {}
+        if obj.get('cancel_at_period_end') is False and previous.get('cancel_at_period_end') is True:
+            return '', {'reactivations': 1}
+        return '', {}
+    if event_type == 'invoice.paid':
+        return currency, {'invoices_paid': 1, 'revenue': obj.get('amount_paid') or 0}
+    if event_type == 'invoice.payment_failed':
+        return currency, {'invoices_failed': 1}
+    return '', {}
+
+
+def _apply(deltas):
+    for (day, currency), counts in deltas.items():
+        rollup, _ = DailyEventRollup.objects.get_or_create(day=day, currency=currency)
+        DailyEventRollup.objects.filter(pk=rollup.pk).update(**{name: F(name) + value for name, value in counts.items()})
+
+
+def update(batch_size=1000, lag=None):
+    """
+    Fold new events into the rollups, stopping at the first one younger than
+    `lag` seconds (default settings.ROLLUP_LAG_SECONDS) so a later run picks
+    it up; returns the number of events processed.
+    """
+    lag = settings.ROLLUP_LAG_SECONDS if lag is None else lag
+    processed = 0
+    while True:
+        with transaction.atomic():
+            state, _ = RollupState.objects.select_for_update().get_or_create(name=STATE_NAME)
+            events = SubscriptionEvent.objects.filter(pk__gt=state.last_event_id)
+            if lag:
+                # Stop below the first young event rather than skip it: the
+                # mark must not pass a row whose neighbours may be in flight
+                cutoff = timezone.now() - timedelta(seconds=lag)
+                young = events.filter(created__gte=cutoff).order_by('pk').values_list('pk', flat=True).first()
+                if young is not None:
+                    events = events.filter(pk__lt=young)
+            batch = list(events.order_by('pk').values_list('pk', 'type__code', 'created', 'data')[:batch_size])
+            if not batch:
+                return processed
+            deltas = defaultdict(lambda: defaultdict(int))
+            for pk, event_type, created, data in batch:
+                currency, counts = classify(event_type, data)
+                for name, value in counts.items():
+                    deltas[created.astimezone(dt_timezone.utc).date(), currency][name] += value
+            _apply(deltas)
+            state.last_event_id = batch[-1][0]
+            state.save()
+        processed += len(batch)
+
+
+def rebuild(batch_size=1000):
+    """
+    Recompute the rollups from the event log.
+
+    Days before the oldest event still in the log keep their rollups: the
+    retention job purges whole days of events, after which the rollups are
+    the only record of them.
+    """
+    with transaction.atomic():
+        oldest = SubscriptionEvent.objects.aggregate(oldest=Min('created'))['oldest']
+        if oldest is not None:
+            DailyEventRollup.objects.filter(day__gte=oldest.astimezone(dt_timezone.utc).date()).delete()
+        RollupState.objects.filter(name=STATE_NAME).delete()
+    return update(batch_size)
+
+
+def monthly_report(months=12):
+    """Per-month totals and revenue by currency over the last `months` months, from the rollups only."""
+    since = (timezone.now() - timedelta(days=31 * months)).date().replace(day=1)
+    rows = (
+        DailyEventRollup.objects.filter(day__gte=since)
+        .annotate(month=TruncMonth('day'))
+        .values('month', 'currency')
+        .annotate(**{name: Sum(name) for name in COUNTERS})
+        .order_by('-month', 'currency')
+    )
+    report = {}
+    for row in rows:
+        month = report.setdefault(row['month'], dict({name: 0 for name in COUNTERS if name != 'revenue'}, revenue={}))
+        for name in COUNTERS:
+            if name == 'revenue':
+                if row['currency']:
+                    month['revenue'][row['currency']] = row['revenue']
+            else:
+                month[name] += row[name]
+    for month in report.values():
+        attempts = month['invoices_paid'] + month['invoices_failed']
+        month['failed_payment_rate'] = month['invoices_failed'] / attempts if attempts else 0.0
+        month['net_subscriptions'] = month['new_subscriptions'] + month['reactivations'] - month['cancellations']
+    return report
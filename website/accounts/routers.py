@@ -0,0 +1,87 @@
+"""
+Read-replica routing.
+
+Reads that tolerate a little replication lag (the SubscriptionEvent history,
+the Membership catalog and the daily rollup reports) go to the 'replica'
+database when one is configured; everything else, and every write, uses the
+primary. Reads stay on the primary:
+
+- inside a transaction on the primary, which must see its own writes;
+- for the rest of a request once it has written anything;
+- for REPLICA_PIN_SECONDS after a user's data changed (their profile was
+  saved by cancel/reactivate, a webhook, ...), so they see their own
+  changes on the next pages. The pin is a per-user key in the cache, which
+  settings require to be shared by every worker when a replica is set up.
+
+The replica is kept in sync by the database's own replication, so Django
+never migrates it (except the test suite's stand-in, see MIGRATE_REPLICA).
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+REPLICA_MODELS = {('accounts', 'subscriptionevent'), ('accounts', 'membership'), ('accounts', 'dailyeventrollup')}
+
+# The current request, and whether it has been pinned to the primary
+_request = ContextVar('accounts_replica_request', default=None)
+_pinned = ContextVar('accounts_replica_pinned', default=False)
+
+
+def _pin_key(user_id):
+    return f'db:pin:user:{user_id}'
+
+
+def pin_user(user_id):
+    """Keep `user_id`'s reads on the primary for REPLICA_PIN_SECONDS."""
+    if user_id is not None and REPLICA_ALIAS in settings.DATABASES:
+        cache.set(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+def start_request(request):
+    return _request.set(request), _pinned.set(False)
+
+
+def finish_request(tokens):
+    request_token, pinned_token = tokens
+    _request.reset(request_token)
+    _pinned.reset(pinned_token)
+
+
+def _request_pinned():
+    if _pinned.get():
+        return True
+    request = _request.get()
+    if request is None:
+        return False
+    pinned = getattr(request, '_replica_pinned', None)
+    if pinned is None:
+        session = getattr(request, 'session', None)
+        user_id = session.get(SESSION_KEY) if session is not None else None
+        pinned = request._replica_pinned = user_id is not None and cache.get(_pin_key(user_id)) is not None
+    return pinned
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (model._meta.app_label, model._meta.model_name) not in REPLICA_MODELS or REPLICA_ALIAS not in settings.DATABASES:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or _request_pinned():
+            return DEFAULT_DB_ALIAS
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if _request.get() is not None:
+            # Read your own writes for the rest of the request
+            _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS or (db == REPLICA_ALIAS and settings.MIGRATE_REPLICA)
@@ -0,0 +1,123 @@
+"""
+A minimal cron for the maintenance jobs in settings.MAINTENANCE_SCHEDULE.
+
+Each entry maps a job name to a five-field cron spec (minute hour
+day-of-month month day-of-week, with *, lists, ranges and */steps) and
+either a dotted `call` path with optional `kwargs` or a management
+`command` with optional `args`. `manage.py run_scheduler` wakes up once a
+minute and runs the jobs due in that minute, one after another. When
+several schedulers share a cache, a per-job, per-minute cache key makes sure
+only one of them runs each job.
+"""
+import io
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# (name, lowest, highest); day of week runs from 0 (Sunday), 7 is Sunday too
+CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+
+class CronSpec:
+    def __init__(self, spec):
+        parts = spec.split()
+        if len(parts) != len(CRON_FIELDS):
+            raise ValueError(f'Cron spec {spec!r} needs {len(CRON_FIELDS)} fields')
+        self.spec = spec
+        self.restricted = {}
+        for part, (name, low, high) in zip(parts, CRON_FIELDS):
+            setattr(self, name, self._parse(part, low, high, spec))
+            self.restricted[name] = part != '*'
+        if 7 in self.weekday:
+            self.weekday.add(0)
+
+    @staticmethod
+    def _parse(field, low, high, spec):
+        values = set()
+        for item in field.split(','):
+            item, _, step = item.partition('/')
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(v) for v in item.split('-', 1))
+            else:
+                start = end = int(item)
+            step = int(step) if step else 1
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f'Cron spec {spec!r}: {field!r} is outside {low}-{high}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, moment):
+        if moment.minute not in self.minute or moment.hour not in self.hour or moment.month not in self.month:
+            return False
+        day_ok = moment.day in self.day
+        weekday_ok = moment.isoweekday() % 7 in self.weekday
+        # As in cron: when both day fields are restricted, either may match
+        if self.restricted['day'] and self.restricted['weekday']:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def __repr__(self):
+        return f'CronSpec({self.spec!r})'
+
+
+def get_schedule():
+    return {name: dict(job, cron=CronSpec(job['cron'])) for name, job in settings.MAINTENANCE_SCHEDULE.items()}
+
+
+def due_jobs(moment, schedule=None):
+    """Names of the jobs whose spec matches the minute `moment` falls in."""
+    schedule = get_schedule() if schedule is None else schedule
+    moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+    return [name for name, job in schedule.items() if job['cron'].matches(moment)]
+
+
+def run_job(name, job):
+    """Run one job; returns (result, seconds). Commands report their output as the result."""
+    start = time.perf_counter()
+    if 'command' in job:
+        out = io.StringIO()
+        call_command(job['command'], *job.get('args', ()), stdout=out, stderr=out)
+        result = out.getvalue().strip()
+    else:
+        result = import_string(job['call'])(**job.get('kwargs', {}))
+    seconds = time.perf_counter() - start
+    logger.info('Maintenance job %s finished in %.2f s: %s', name, seconds, result)
+    return result, seconds
+
+
+def run_due(moment, schedule=None):
+    """Run every job due at `moment`; returns [(name, result, seconds)]. Failures are logged and reported."""
+    schedule = get_schedule() if schedule is None else schedule
+    report = []
+    for name in due_jobs(moment, schedule):
+        if not cache.add(f'scheduler:{name}:{moment:%Y%m%d%H%M}', 1, timeout=60 * 60):
+            continue
+        try:
+            result, seconds = run_job(name, schedule[name])
+        except Exception as e:
+            logger.exception('Maintenance job %s failed', name)
+            result, seconds = f'failed: {e}', None
+        report.append((name, result, seconds))
+    return report
+
+
+def minutes_between(last, now):
+    """Each minute after `last` up to and including `now`, at most an hour's worth."""
+    last = last.replace(second=0, microsecond=0)
+    now = now.replace(second=0, microsecond=0)
+    moments = []
+    moment = max(last + timedelta(minutes=1), now - timedelta(minutes=59))
+    while moment <= now:
+        moments.append(moment)
+        moment += timedelta(minutes=1)
+    return moments
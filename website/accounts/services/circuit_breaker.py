@@ -0,0 +1,112 @@
+"""
+Circuit breaker for calls to Stripe.
+
+Every guarded call is recorded in a sliding window. When enough calls in the
+window failed, or took longer than the slow-call threshold, the breaker
+opens: calls fail fast with CircuitOpenError instead of tying up a worker
+until the SDK times out, and callers fall back to the last good copy (see
+accounts.services.stripe_reads). After `open_seconds` one background probe
+repeats a real call in its own thread; success closes the breaker, failure
+keeps it open for another period.
+
+State is per process, like the membership catalog.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, PROBING = 'closed', 'open', 'probing'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, **options):
+        self.name = name
+        self._options = options
+        self._lock = threading.Lock()
+        self.reset()
+
+    def option(self, name):
+        return self._options.get(name, settings.STRIPE_CIRCUIT_BREAKER[name])
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.opened_at = 0.0
+            self._calls = deque()
+            self._probe_thread = None
+
+    def is_failure(self, exc):
+        """Client errors (bad ids, auth) say nothing about Stripe's health and do not count."""
+        from .stripe_service import get_stripe
+        stripe = get_stripe()
+        return not isinstance(exc, (stripe.error.InvalidRequestError, stripe.error.AuthenticationError, stripe.error.CardError))
+
+    def _record(self, ok, seconds):
+        now = time.monotonic()
+        with self._lock:
+            if self.state != CLOSED:
+                return
+            calls = self._calls
+            calls.append((now, ok, seconds))
+            while calls and calls[0][0] < now - self.option('window_seconds'):
+                calls.popleft()
+            if len(calls) < self.option('min_calls'):
+                return
+            failures = sum(1 for _, ok, _ in calls if not ok)
+            slow = sum(1 for _, _, seconds in calls if seconds > self.option('slow_call_seconds'))
+            if failures / len(calls) >= self.option('failure_ratio') or slow / len(calls) >= self.option('slow_ratio'):
+                self.state = OPEN
+                self.opened_at = now
+                calls.clear()
+                logger.warning('Circuit %s opened after %d failed and %d slow calls', self.name, failures, slow)
+
+    def _before_call(self, fetch):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.option('open_seconds'):
+                self.state = PROBING
+                self._probe_thread = threading.Thread(target=asyncio.run, args=(self._probe(fetch),), daemon=True, name=f'{self.name}-probe')
+                self._probe_thread.start()
+        raise CircuitOpenError(f'{self.name} circuit is {self.state}')
+
+    async def _probe(self, fetch):
+        try:
+            await asyncio.wait_for(fetch(), self.option('call_timeout'))
+        except Exception as e:
+            failed = self.is_failure(e)
+        else:
+            failed = False
+        with self._lock:
+            if failed:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            else:
+                self.state = CLOSED
+                self._calls.clear()
+        logger.warning('Circuit %s %s after probe', self.name, 'stays open' if failed else 'closed')
+
+    async def call(self, fetch):
+        """Return `await fetch()`, or raise CircuitOpenError without calling it while the circuit is open."""
+        self._before_call(fetch)
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(fetch(), self.option('call_timeout'))
+        except Exception as e:
+            self._record(not self.is_failure(e), time.monotonic() - start)
+            raise
+        self._record(True, time.monotonic() - start)
+        return result
+
+
+stripe_breaker = CircuitBreaker('stripe')
@@ -0,0 +1,8 @@
+"""Profile image storage. Pillow is only loaded by Django's ImageField when an upload is validated."""
+from django.core.files.storage import default_storage
+
+
+def delete_image(name):
+    """Remove a stored image file; profiles keep only the uploaded original, no renditions."""
+    if name and default_storage.exists(name):
+        default_storage.delete(name)
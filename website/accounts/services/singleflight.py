@@ -0,0 +1,90 @@
+"""
+Single-flight coalescing of identical async calls.
+
+do(key, fetch) runs fetch() once for every caller that asks for the same key
+while a call is already in flight; the others wait for it and receive the
+same result or exception. Waiters may sit in other threads and event loops
+(async views under WSGI each run in their own loop), so the in-flight call
+is published as a concurrent.futures.Future.
+
+With share_across_processes=True the leader also takes a short cache lock
+and publishes the result in the cache, so workers in other processes that
+share the cache backend wait for that result instead of repeating the call.
+Results are shared objects: callers must treat them as read-only.
+"""
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_in_flight = {}
+
+CACHE_PREFIX = 'singleflight'
+POLL_INTERVAL = 0.05
+
+
+async def do(key, fetch, share_across_processes=None):
+    """Return the result of `await fetch()`, shared with concurrent callers for `key`."""
+    with _lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        return await asyncio.wrap_future(future)
+    try:
+        if share_across_processes is None:
+            share_across_processes = settings.SINGLE_FLIGHT_ACROSS_PROCESSES
+        if share_across_processes:
+            result = await _do_across_processes(key, fetch)
+        else:
+            result = await fetch()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _lock:
+            _in_flight.pop(key, None)
+
+
+async def _do_across_processes(key, fetch):
+    # Each flight publishes its result under its own token, so a caller that
+    # arrives after the flight has landed fetches afresh instead of reading
+    # an old result
+    lock_key = f'{CACHE_PREFIX}:lock:{key}'
+    token = uuid.uuid4().hex
+    wait = settings.SINGLE_FLIGHT_WAIT
+    if await cache.aadd(lock_key, token, timeout=wait):
+        try:
+            result = await fetch()
+            await cache.aset(f'{CACHE_PREFIX}:result:{token}', result, wait)
+            return result
+        finally:
+            await cache.adelete(lock_key)
+    leader_token = await cache.aget(lock_key)
+    deadline = time.monotonic() + wait
+    while leader_token is not None and time.monotonic() < deadline:
+        result = await cache.aget(f'{CACHE_PREFIX}:result:{leader_token}')
+        if result is not None:
+            return result
+        if await cache.aget(lock_key) != leader_token:
+            # The leader failed or gave up without publishing a result
+            break
+        await asyncio.sleep(POLL_INTERVAL)
+    if leader_token is not None:
+        result = await cache.aget(f'{CACHE_PREFIX}:result:{leader_token}')
+        if result is not None:
+            return result
+    logger.info('No shared result for %s; fetching it in this process', key)
+    return await fetch()
@@ -0,0 +1,65 @@
+"""
+Stripe reads made by the subscription pages.
+
+profile, subscribe and subscription_details all fetch the same subscription
+(and often the same customer and product), so a user opening them together
+or in several tabs would retrieve each object several times at once. These
+helpers route the reads through accounts.services.singleflight: concurrent
+requests for one object share a single Stripe call.
+
+Each call also goes through the Stripe circuit breaker, and every good
+result is kept in the cache as a plain dict (pickling the StripeObject would
+store the API key with it). While the circuit is open, or when a call fails
+or times out, a new object is built from the last good copy instead, marked
+with is_stale(), so pages keep showing useful data during an incident.
+
+Callers pass the SDK resource (e.g. stripe.Subscription) so the views keep
+deciding which stripe module they talk to.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import singleflight
+from .circuit_breaker import CircuitOpenError, stripe_breaker
+
+STALE_CACHE_PREFIX = 'stripe:last-good'
+
+logger = logging.getLogger(__name__)
+
+
+def is_stale(obj):
+    """True for a last-good copy served in place of a live Stripe read."""
+    return getattr(obj, '_stale', False)
+
+
+async def _read(key, resource, fetch):
+    try:
+        result = await singleflight.do(key, lambda: stripe_breaker.call(fetch))
+    except Exception as e:
+        if not isinstance(e, CircuitOpenError) and not stripe_breaker.is_failure(e):
+            raise
+        data = await cache.aget(f'{STALE_CACHE_PREFIX}:{key}')
+        if data is None:
+            raise
+        stale = resource.construct_from(data, None)
+        stale._stale = True
+        return stale
+    try:
+        await cache.aset(f'{STALE_CACHE_PREFIX}:{key}', result.to_dict_recursive(), settings.STRIPE_STALE_TTL)
+    except Exception as e:
+        # Losing the fallback copy must not fail the page that has fresh data
+        logger.warning('Could not keep last good copy of %s: %s', key, e)
+    return result
+
+
+async def retrieve(resource, object_id):
+    """Return `await resource.retrieve_async(object_id)`, shared with concurrent requests for the same object."""
+    return await _read(f'stripe:{resource.OBJECT_NAME}:{object_id}', resource, lambda: resource.retrieve_async(object_id))
+
+
+async def upcoming_invoice(invoice_resource, customer_id, subscription_id):
+    """Preview of the next invoice for a subscription, shared like retrieve()."""
+    key = f'stripe:upcoming_invoice:{customer_id}:{subscription_id}'
+    return await _read(key, invoice_resource, lambda: invoice_resource.create_preview_async(customer=customer_id, subscription=subscription_id))
@@ -0,0 +1,63 @@
+"""
+Lazy access to the Stripe SDK.
+
+Importing stripe costs several hundred milliseconds, which every worker boot
+and management command used to pay through accounts.views and the admin.
+Modules use the `stripe` proxy below instead: the SDK is imported and
+configured (API key, per-loop async HTTP client, request metrics hooks) on
+first attribute access, i.e. with the first real Stripe call.
+"""
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_module = None
+
+
+def get_stripe():
+    """Return the configured stripe module, importing it on first use."""
+    global _module
+    if _module is None:
+        with _lock:
+            if _module is None:
+                import stripe
+
+                from .. import metrics, stripe_http
+
+                stripe.api_key = settings.STRIPE_SECRET_KEY
+                stripe_http.configure()
+                metrics.install_stripe_hooks(stripe)
+                _module = stripe
+    return _module
+
+
+def construct_event(payload, sig_header, secret):
+    """
+    Verify a webhook's signature and build its stripe.Event, like
+    stripe.Webhook.construct_event but parsing with accounts.jsoncodec.
+
+    The signature and the timestamp (within stripe's default tolerance, so an
+    old delivery cannot be replayed) are checked before the body is parsed,
+    so unsigned payloads cost no parsing. Raises SignatureVerificationError
+    or ValueError.
+    """
+    from .. import jsoncodec
+
+    stripe = get_stripe()
+    text = payload.decode('utf-8') if hasattr(payload, 'decode') else payload
+    stripe.WebhookSignature.verify_header(text, sig_header, secret, tolerance=stripe.Webhook.DEFAULT_TOLERANCE)
+    return stripe.Event.construct_from(jsoncodec.loads(payload), stripe.api_key)
+
+
+class _LazyStripe:
+    """Stands in for the stripe module until it is first used."""
+
+    def __getattr__(self, name):
+        return getattr(get_stripe(), name)
+
+    def __repr__(self):
+        return f'<lazy stripe module, {"loaded" if _module else "not loaded"}>'
+
+
+stripe = _LazyStripe()
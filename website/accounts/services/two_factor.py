@@ -0,0 +1,25 @@
+"""TOTP helpers for two-factor authentication; pyotp and qrcode are imported on first use."""
+import base64
+import io
+
+ISSUER_NAME = 'WebSubscription'
+
+
+def random_secret():
+    import pyotp
+    return pyotp.random_base32()
+
+
+def verify(secret, code):
+    import pyotp
+    return pyotp.TOTP(secret).verify(code)
+
+
+def qr_code_base64(secret, email):
+    """Return the provisioning URI for `secret` as a base64 PNG QR code."""
+    import pyotp
+    import qrcode
+    otp_uri = pyotp.TOTP(secret).provisioning_uri(name=email, issuer_name=ISSUER_NAME)
+    buf = io.BytesIO()
+    qrcode.make(otp_uri).save(buf, format='PNG')
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
@@ -0,0 +1,50 @@
+"""
+Static files storage for production.
+
+collectstatic copies every file under a content-hashed name (the manifest
+storage also rewrites url() references inside CSS) and then writes .gz and,
+when the optional brotli package is installed, .br variants next to each
+compressible file. accounts.assets.serve() picks the variant by
+Accept-Encoding, so nothing is compressed per request.
+"""
+import gzip
+from pathlib import Path
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.txt', '.json', '.html', '.xml', '.ttf', '.eot')
+# Below this size the headers outweigh the savings
+MIN_COMPRESS_SIZE = 256
+
+
+def compress(path):
+    """Write the compressed variants of `path` that came out smaller; returns their suffixes."""
+    data = Path(path).read_bytes()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return []
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    written = []
+    for suffix, compressed in variants:
+        if len(compressed) < len(data) * 0.95:
+            Path(path + suffix).write_bytes(compressed)
+            written.append(suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and name != self.manifest_name and self.exists(name):
+                for suffix in compress(self.path(name)):
+                    yield name + suffix, name + suffix, True
@@ -0,0 +1,75 @@
+import asyncio
+import ssl
+
+import stripe
+
+
+class LoopLocalHTTPXClient(stripe.HTTPXClient):
+    """
+    Stripe's httpx transport with one AsyncClient per event loop.
+
+    An httpx connection pool is bound to the loop it first ran on. Under WSGI
+    every async view runs in a fresh loop (async_to_sync), so the SDK's single
+    shared AsyncClient breaks on the second request and the call only
+    succeeds after a retry with back-off. Under uvicorn there is one loop and
+    this behaves like the stock client.
+
+    Each client is closed when its loop shuts down: asyncio.run and
+    async_to_sync cancel the tasks left on a loop before closing it, and a
+    task parked on the loop closes the client when cancelled, so the WSGI
+    per-request loops leave no connections behind.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # loop -> (client, the task that closes it)
+        self._loop_clients = {}
+        # Loading the CA bundle is slow, so every loop's client shares one context
+        self._verify = ssl.create_default_context(cafile=stripe.ca_bundle_path) if self._verify_ssl_certs else False
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._loop_clients.get(loop)
+        if entry is None:
+            client = self.httpx.AsyncClient(verify=self._verify)
+            entry = self._loop_clients[loop] = (client, loop.create_task(self._close_on_shutdown(loop, client)))
+        return entry[0]
+
+    async def _close_on_shutdown(self, loop, client):
+        try:
+            await loop.create_future()
+        finally:
+            self._loop_clients.pop(loop, None)
+            await client.aclose()
+
+    async def request_async(self, method, url, headers, post_data=None):
+        args, kwargs = self._get_request_args_kwargs(method, url, headers, post_data)
+        try:
+            response = await self._async_client().request(*args, **kwargs)
+        except Exception as e:
+            self._handle_request_error(e)
+        return response.content, response.status_code, response.headers
+
+    async def request_stream_async(self, method, url, headers, post_data=None):
+        client = self._async_client()
+        args, kwargs = self._get_request_args_kwargs(method, url, headers, post_data)
+        try:
+            response = await client.send(request=client.build_request(*args, **kwargs), stream=True)
+        except Exception as e:
+            self._handle_request_error(e)
+        return response.aiter_bytes(), response.status_code, response.headers
+
+    async def close_async(self):
+        entry = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            entry[1].cancel()
+            await entry[0].aclose()
+
+
+def configure():
+    """Install the HTTP clients used for all Stripe calls."""
+    stripe.default_http_client = stripe.new_default_http_client(
+        verify_ssl_certs=stripe.verify_ssl_certs,
+        proxy=stripe.proxy,
+        async_fallback_client=LoopLocalHTTPXClient(verify_ssl_certs=stripe.verify_ssl_certs, proxy=stripe.proxy),
+    )
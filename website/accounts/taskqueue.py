@@ -0,0 +1,205 @@
+"""
+A small background task queue on top of the database.
+
+Functions decorated with @task are registered by name; enqueue() stores a
+Task row in the caller's transaction, so work queued by a view only becomes
+visible to workers when the view's changes commit. `manage.py runworker`
+claims due tasks and runs them in a thread or process pool:
+
+- On PostgreSQL (and other databases that support it) a claim is
+  SELECT ... FOR UPDATE SKIP LOCKED, so workers never wait on each other's
+  rows. SQLite has no row locks; there a worker claims a task with a
+  conditional UPDATE and moves on when another worker got there first.
+- A failed attempt is retried with exponential backoff until the task's
+  max_attempts is used up; then it is marked failed.
+- Tasks left running by a worker that died are queued again by
+  requeue_stale(). A long task calls heartbeat() as it goes, so it is not
+  mistaken for a lost one; should it be requeued anyway, the outcome of
+  the first run is dropped rather than written over the new claim.
+- Each attempt is timed on the Task row and recorded in the metrics
+  registry under task:<name>, with its query and Stripe call counts.
+"""
+import logging
+import random
+import socket
+import threading
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import metrics
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+# [task, monotonic time of its last heartbeat] while run() is running it
+_running = ContextVar('accounts_running_task', default=None)
+
+
+def task(func=None, *, max_attempts=None):
+    """Register `func` as a task under its dotted path."""
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        func.task_name = name
+        func.max_attempts = max_attempts
+        _registry[name] = func
+        return func
+    return decorator(func) if func is not None else decorator
+
+
+def get_task(name):
+    if name not in _registry:
+        # Importing the module registers its tasks
+        import_string(name)
+    return _registry[name]
+
+
+def enqueue(func_or_name, *args, run_at=None, delay=None, **kwargs):
+    """Queue a call of the task with JSON-serialisable arguments; returns the Task."""
+    name = getattr(func_or_name, 'task_name', func_or_name)
+    func = get_task(name)
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    return Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs,
+        run_at=run_at,
+        max_attempts=func.max_attempts or settings.TASK_MAX_ATTEMPTS,
+    )
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{threading.get_native_id()}'
+
+
+def claim(worker=None):
+    """Mark the next due task as running for `worker` and return it, or None when nothing is due."""
+    worker = worker or worker_name()
+    now = timezone.now()
+    due = Task.objects.filter(status=Task.QUEUED, run_at__lte=now).order_by('run_at', 'pk')
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            claimed = due.select_for_update(skip_locked=True).first()
+            if claimed is None:
+                return None
+            claimed.status = Task.RUNNING
+            claimed.attempts += 1
+            claimed.started_at = claimed.heartbeat_at = now
+            claimed.worker = worker
+            claimed.save(update_fields=['status', 'attempts', 'started_at', 'heartbeat_at', 'worker'])
+            return claimed
+    # No row locks (SQLite): the conditional UPDATE decides which worker wins a task
+    for pk in due.values_list('pk', flat=True)[:10]:
+        won = Task.objects.filter(pk=pk, status=Task.QUEUED).update(
+            status=Task.RUNNING, attempts=F('attempts') + 1, started_at=now, heartbeat_at=now, worker=worker,
+        )
+        if won:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying after `attempts` failed attempts, with jitter."""
+    delay = min(settings.TASK_RETRY_BACKOFF * 2 ** (attempts - 1), settings.TASK_RETRY_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _claim_held(claimed):
+    return Task.objects.filter(pk=claimed.pk, status=Task.RUNNING, worker=claimed.worker, attempts=claimed.attempts)
+
+
+def heartbeat():
+    """
+    Tell requeue_stale() the running task is alive; call it between steps of
+    long tasks. Writes at most once per TASK_HEARTBEAT_INTERVAL seconds and
+    does nothing outside a task.
+    """
+    running = _running.get()
+    if running is None:
+        return
+    claimed, last = running
+    if time.monotonic() - last < settings.TASK_HEARTBEAT_INTERVAL:
+        return
+    running[1] = time.monotonic()
+    _claim_held(claimed).update(heartbeat_at=timezone.now())
+
+
+def run(claimed):
+    """Run a claimed task and record the outcome; returns True when it succeeded."""
+    token = metrics.start_request()
+    running = _running.set([claimed, time.monotonic()])
+    start = time.perf_counter()
+    try:
+        get_task(claimed.name)(*claimed.args, **claimed.kwargs)
+    except Exception as e:
+        claimed.last_error = f'{type(e).__name__}: {e}'
+        if claimed.attempts < claimed.max_attempts:
+            claimed.status = Task.QUEUED
+            claimed.run_at = timezone.now() + timedelta(seconds=backoff(claimed.attempts))
+            logger.warning('Task %s (%s) failed on attempt %d, retrying at %s: %s', claimed.name, claimed.pk, claimed.attempts, claimed.run_at, e)
+        else:
+            claimed.status = Task.FAILED
+            claimed.finished_at = timezone.now()
+            logger.exception('Task %s (%s) failed after %d attempts', claimed.name, claimed.pk, claimed.attempts)
+        succeeded = False
+    else:
+        claimed.status = Task.SUCCEEDED
+        claimed.finished_at = timezone.now()
+        claimed.last_error = ''
+        succeeded = True
+    finally:
+        claimed.duration = time.perf_counter() - start
+        _running.reset(running)
+        metrics.finish_request(token, f'task:{claimed.name}', claimed.duration)
+    fields = ('status', 'run_at', 'finished_at', 'duration', 'last_error')
+    if not _claim_held(claimed).update(**{field: getattr(claimed, field) for field in fields}):
+        # Requeued as stale while it ran; the row belongs to the next attempt now
+        logger.warning('Task %s (%s) finished after it was requeued; outcome not recorded', claimed.name, claimed.pk)
+    return succeeded
+
+
+def run_pending(limit=None, worker=None):
+    """Claim and run due tasks one at a time until none is left; returns (succeeded, failed)."""
+    succeeded = failed = 0
+    while limit is None or succeeded + failed < limit:
+        claimed = claim(worker)
+        if claimed is None:
+            break
+        if run(claimed):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+def requeue_stale():
+    """Queue tasks again whose worker stopped reporting back; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_STALE_AFTER)
+    silent = Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    return Task.objects.filter(silent, status=Task.RUNNING).update(status=Task.QUEUED, run_at=timezone.now())
+
+
+def work(stop, poll_interval=1.0, worker=None):
+    """Worker loop for one thread: run due tasks until `stop` (a threading.Event) is set."""
+    worker = worker or worker_name()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            claimed = claim(worker)
+        except Exception:
+            logger.exception('Could not claim a task')
+            claimed = None
+        if claimed is None:
+            stop.wait(poll_interval)
+            continue
+        run(claimed)
+    close_old_connections()
@@ -0,0 +1,76 @@
+"""
+Background tasks, run by `manage.py runworker` (see accounts.taskqueue).
+
+Views queue these instead of doing slow I/O inside the request: sending
+mail, creating Stripe customers, removing stored images and carrying out
+account deletions.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import send_mail
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from . import deletion
+from .models import AccountDeletion, Profile
+from .services import images
+from .services.stripe_service import stripe
+from .taskqueue import task
+
+logger = logging.getLogger(__name__)
+
+
+def customer_idempotency_key(user):
+    """Stripe idempotency key for the user's customer, shared by the task and the checkout fallback."""
+    return f'customer-for-user-{user.pk}'
+
+
+@task
+def send_confirmation_email(user_id, domain):
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        logger.info('Not sending confirmation email: user %s no longer exists', user_id)
+        return
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    confirm_url = f"http://{domain}{reverse('confirm_email', args=[uid, token])}"
+    message = render_to_string('accounts/confirm_email.html', {
+        'user': user,
+        'confirm_url': confirm_url,
+    })
+    send_mail('Confirm your email', message, settings.DEFAULT_FROM_EMAIL, [user.email])
+    logger.info('Confirmation email sent to %s', user.email)
+
+
+@task
+def create_stripe_customer(user_id):
+    """Create the user's Stripe customer ahead of checkout."""
+    profile = Profile.objects.select_related('user').get(user_id=user_id)
+    if profile.stripe_customer_id:
+        return
+    customer = stripe.Customer.create(
+        email=profile.user.email,
+        name=profile.user.username,
+        idempotency_key=customer_idempotency_key(profile.user),
+    )
+    # Checkout may have created (the same, idempotent) customer in the meantime
+    Profile.objects.filter(Q(stripe_customer_id__isnull=True) | Q(stripe_customer_id=''), pk=profile.pk).update(stripe_customer_id=customer.id)
+
+
+@task
+def delete_profile_image(name):
+    images.delete_image(name)
+
+
+@task(max_attempts=10)
+def process_account_deletion(deletion_id):
+    account_deletion = AccountDeletion.objects.select_related('user').get(pk=deletion_id)
+    if not deletion.process(account_deletion):
+        raise RuntimeError(f'Deletion of {account_deletion.username} failed: {account_deletion.last_error}')
@@ -0,0 +1,23 @@
+from django import template
+
+from accounts import assets
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendor_asset(name):
+    """URL of a vendored front-end asset, e.g. {% vendor_asset 'bootstrap.css' %}"""
+    return assets.url(name)
+
+
+@register.simple_tag
+def vendor_stylesheet(name):
+    """<link> for a vendored stylesheet, with its integrity hash while it still comes from the CDN."""
+    return assets.stylesheet(name)
+
+
+@register.simple_tag
+def vendor_script(name):
+    """<script> for a vendored script, with its integrity hash while it still comes from the CDN."""
+    return assets.script(name)
@@ -1,35 +1,12 @@
 from django import template
 import json
-from django.apps import apps
+from accounts import catalog, event_types
 
 register = template.Library()
 
-EVENT_NAME_MAP = {
-    'customer.subscription.created': 'Subscription Created',
-    'customer.subscription.deleted': 'Subscription Cancelled',
-    'customer.subscription.updated': 'Subscription Updated',
-    'invoice.created': 'Invoice Created',
-    'invoice.deleted': 'Invoice Deleted',
-    'invoice.finalization_failed': 'Invoice Finalization Failed',
-    'invoice.finalized': 'Invoice Finalized',
-    'invoice.marked_uncollectible': 'Invoice Marked Uncollectible',
-    'invoice.overdue': 'Invoice Overdue',
-    'invoice.overpaid': 'Invoice Overpaid',
-    'invoice.paid': 'Invoice Paid',
-    'invoice.payment_action_required': 'Invoice Payment Action Required',
-    'invoice.payment_failed': 'Invoice Payment Failed',
-    'invoice.payment_succeeded': 'Invoice Payment Succeeded',
-    'invoice.sent': 'Invoice Sent',
-    'invoice.upcoming': 'Invoice Upcoming',
-    'invoice.updated': 'Invoice Updated',
-    'invoice.voided': 'Invoice Voided',
-    'invoice.will_be_due': 'Invoice Will Be Due',
-    'invoice_payment.paid': 'Invoice Payment Paid',
-}
-
 @register.filter
 def event_friendly_name(event_type):
-    return EVENT_NAME_MAP.get(event_type, event_type)
+    return event_types.name(event_type)
 
 @register.filter
 def startswith(text, starts):
@@ -48,7 +25,7 @@ def event_friendly_name_with_cancel_check(event):
             return 'Subscription Cancelled at End of Period'
         if obj and prev and obj.get('cancel_at_period_end') is False and prev.get('cancel_at_period_end') is True:
             return 'Subscription Reactivated'
-    return event_friendly_name(event_type)
+    return event.type.name
 
 @register.filter
 def event_invoice_amount(event):
@@ -84,10 +61,10 @@ def event_subscription_product_name(event):
             elif isinstance(price, str):
                 price_id = price
         if price_id:
-            Membership = apps.get_model('accounts', 'Membership')
-            membership = Membership.objects.filter(stripe_price_id=price_id).first()
-            if membership:
-                return membership.name
+            # Look the name up in the cached catalog; a query per event row is an N+1
+            for membership in catalog.get_memberships():
+                if membership.stripe_price_id == price_id:
+                    return membership.name
         # Fallback to price nickname or id
         if price and isinstance(price, dict):
             return price.get('nickname') or price.get('id')
@@ -1,17 +1,65 @@
-from django.test import TestCase, override_settings
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.contrib import admin
 from django.contrib.auth.models import User
-from django.urls import reverse
+from django.contrib.sessions.models import Session
+from django.urls import URLResolver, get_resolver, resolve, reverse
+from django.template import engines
+from django.template.loader import get_template
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
-from unittest.mock import patch, MagicMock
-from .models import Profile, Membership, SubscriptionEvent
+from unittest.mock import patch, MagicMock, AsyncMock
+from .models import Profile, Membership, EventType, SubscriptionEvent, AccountDeletion, DailyEventRollup, RollupState, Task
+from . import assets, budgets, catalog, checks, deletion, event_types, exports, jsoncodec, maintenance, metrics, partitions, rollups, routers, scheduler, taskqueue, views, warmup
+from .stripe_http import LoopLocalHTTPXClient
+from .services import singleflight, stripe_reads
+from .services.circuit_breaker import CircuitBreaker, CircuitOpenError, stripe_breaker
+from .templatetags import event_filters
+from .benchmarks import fake_stripe
+from .benchmarks import runner as benchmark_runner
+from .management.commands import runworker
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
 import pyotp
 from django.utils import timezone
 from datetime import timedelta
+from types import SimpleNamespace
+from website.logconfig import JSONFormatter, QueueStreamHandler
+import csv
+import functools
+import io
+import json
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import stripe
+from django.core.files.uploadedfile import SimpleUploadedFile
 
 # Create your tests here.
 
+def stub_stripe_reads(mock_stripe, subscription, customer=None, product=None):
+    """Have a patched stripe module return real (picklable) objects to accounts.services.stripe_reads."""
+    for name, resource, data in (('Subscription', stripe.Subscription, subscription), ('Customer', stripe.Customer, customer), ('Product', stripe.Product, product)):
+        stub = getattr(mock_stripe, name)
+        stub.OBJECT_NAME = resource.OBJECT_NAME
+        stub.retrieve_async = AsyncMock(return_value=resource.construct_from(data or {}, 'sk_test'))
+
+
 class AuthTests(TestCase):
     def setUp(self):
         self.username = 'testuser'
@@ -188,16 +236,25 @@ class SubscriptionCancellationTests(TestCase):
         self.user.profile.save()
         self.client.login(username=self.username, password=self.password)
 
+    def _stub_profile_reads(self, mock_stripe):
+        # The redirect lands on the profile, which reads the subscription and its product
+        stub_stripe_reads(
+            mock_stripe,
+            {'id': 'sub_test123', 'status': 'active', 'items': {'object': 'list', 'data': [{'price': {'id': 'price_test', 'product': 'prod_test'}}]}},
+            product={'id': 'prod_test', 'name': 'Gold'},
+        )
+
     @patch('accounts.views.stripe')
     def test_cancel_subscription_at_period_end(self, mock_stripe):
         # Mock the Stripe subscription modification
         mock_subscription = MagicMock()
-        mock_stripe.Subscription.modify.return_value = mock_subscription
+        mock_stripe.Subscription.modify_async = AsyncMock(return_value=mock_subscription)
+        self._stub_profile_reads(mock_stripe)
         
         response = self.client.post(reverse('cancel_subscription'))
         
         # Check that Stripe was called correctly
-        mock_stripe.Subscription.modify.assert_called_once_with(
+        mock_stripe.Subscription.modify_async.assert_called_once_with(
             'sub_test123',
             cancel_at_period_end=True
         )
@@ -214,6 +271,7 @@ class SubscriptionCancellationTests(TestCase):
         # Mock the Stripe subscription deletion
         mock_subscription = MagicMock()
         mock_stripe.Subscription.delete.return_value = mock_subscription
+        self._stub_profile_reads(mock_stripe)
         
         response = self.client.post(reverse('cancel_subscription_immediately'))
         
@@ -235,12 +293,13 @@ class SubscriptionCancellationTests(TestCase):
         
         # Mock the Stripe subscription modification
         mock_subscription = MagicMock()
-        mock_stripe.Subscription.modify.return_value = mock_subscription
+        mock_stripe.Subscription.modify_async = AsyncMock(return_value=mock_subscription)
+        self._stub_profile_reads(mock_stripe)
         
         response = self.client.post(reverse('reactivate_subscription'))
         
         # Check that Stripe was called correctly
-        mock_stripe.Subscription.modify.assert_called_once_with(
+        mock_stripe.Subscription.modify_async.assert_called_once_with(
             'sub_test123',
             cancel_at_period_end=False
         )
@@ -273,26 +332,20 @@ class SubscriptionCancellationTests(TestCase):
         class Item:
             price = Price()
         mock_item = Item()
-        mock_subscription = MagicMock()
-        mock_subscription.status = 'active'
-        mock_subscription.created = 1640995200  # Unix timestamp
-        mock_subscription.current_period_start = 1640995200
-        mock_subscription.current_period_end = 1643673600
-        mock_subscription.cancel_at_period_end = False
-        mock_subscription.items.data = [mock_item]
-        mock_subscription.id = 'sub_test123'
-        
-        mock_customer = MagicMock()
-        mock_customer.name = 'Test User'
-        mock_customer.email = 'test@example.com'
-        mock_customer.id = 'cus_test123'
-        
-        # Mock Stripe API calls
-        mock_stripe.Subscription.retrieve.return_value = mock_subscription
-        mock_stripe.Customer.retrieve.return_value = mock_customer
+        stub_stripe_reads(mock_stripe, {
+            'id': 'sub_test123',
+            'status': 'active',
+            'created': 1640995200,  # Unix timestamp
+            'cancel_at_period_end': False,
+            'items': {'object': 'list', 'data': [{
+                'current_period_start': 1640995200,
+                'current_period_end': 1643673600,
+                'price': {'unit_amount': 2000, 'recurring': {'interval': 'month'}},
+            }]},
+        }, {'id': 'cus_test123', 'name': 'Test User', 'email': 'test@example.com'})
         
         # Mock the upcoming invoice to return None to avoid template issues
-        mock_stripe.Invoice.upcoming.side_effect = Exception("No upcoming invoice")
+        mock_stripe.Invoice.create_preview_async = AsyncMock(side_effect=Exception("No upcoming invoice"))
         
         # Mock stripe.error.StripeError for exception handling
         class MockStripeError(Exception):
@@ -308,7 +361,7 @@ class SubscriptionCancellationTests(TestCase):
         self.assertTemplateUsed(response, 'accounts/subscription_details.html')
         
         # Check that Stripe was called
-        mock_stripe.Subscription.retrieve.assert_called_once_with('sub_test123')
+        mock_stripe.Subscription.retrieve_async.assert_called_once_with('sub_test123')
 
 class UserDeletionTests(TestCase):
     def setUp(self):
@@ -327,28 +380,22 @@ class UserDeletionTests(TestCase):
     def test_delete_user_with_correct_email(self, mock_stripe):
         """Test that user can be deleted with correct email confirmation"""
         # Mock Stripe API calls to prevent real API calls
-        mock_subscription = MagicMock()
-        mock_subscription.status = 'active'
-        mock_subscription['items'] = {'data': [{'price': {'product': 'prod_test'}}]}
-        mock_stripe.Subscription.retrieve.return_value = mock_subscription
+        stub_stripe_reads(mock_stripe, {'id': 'sub_test123', 'status': 'active', 'items': {'object': 'list', 'data': [{'price': {'product': 'prod_test'}}]}}, {'id': 'cus_test123'})
         
         response = self.client.post(reverse('delete_user'), {'email': self.email})
         
         # Should redirect to home
         self.assertRedirects(response, reverse('home'))
         
-        # User should be deleted from database
-        self.assertFalse(User.objects.filter(username=self.username).exists())
-        self.assertFalse(Profile.objects.filter(user__username=self.username).exists())
+        # User should be deactivated and queued for the background deletion
+        self.assertFalse(User.objects.get(username=self.username).is_active)
+        self.assertTrue(AccountDeletion.objects.filter(username=self.username, completed_at__isnull=True).exists())
 
     @patch('accounts.views.stripe')
     def test_delete_user_with_incorrect_email(self, mock_stripe):
         """Test that user is not deleted with incorrect email"""
         # Mock Stripe API calls to prevent real API calls
-        mock_subscription = MagicMock()
-        mock_subscription.status = 'active'
-        mock_subscription['items'] = {'data': [{'price': {'product': 'prod_test'}}]}
-        mock_stripe.Subscription.retrieve.return_value = mock_subscription
+        stub_stripe_reads(mock_stripe, {'id': 'sub_test123', 'status': 'active', 'items': {'object': 'list', 'data': [{'price': {'product': 'prod_test'}}]}}, {'id': 'cus_test123'})
         
         response = self.client.post(reverse('delete_user'), {'email': 'wrong@email.com'})
         
@@ -363,10 +410,7 @@ class UserDeletionTests(TestCase):
     def test_delete_user_with_empty_email(self, mock_stripe):
         """Test that user is not deleted with empty email"""
         # Mock Stripe API calls to prevent real API calls
-        mock_subscription = MagicMock()
-        mock_subscription.status = 'active'
-        mock_subscription['items'] = {'data': [{'price': {'product': 'prod_test'}}]}
-        mock_stripe.Subscription.retrieve.return_value = mock_subscription
+        stub_stripe_reads(mock_stripe, {'id': 'sub_test123', 'status': 'active', 'items': {'object': 'list', 'data': [{'price': {'product': 'prod_test'}}]}}, {'id': 'cus_test123'})
         
         response = self.client.post(reverse('delete_user'), {'email': ''})
         
@@ -381,10 +425,7 @@ class UserDeletionTests(TestCase):
     def test_delete_user_without_email(self, mock_stripe):
         """Test that user is not deleted without email parameter"""
         # Mock Stripe API calls to prevent real API calls
-        mock_subscription = MagicMock()
-        mock_subscription.status = 'active'
-        mock_subscription['items'] = {'data': [{'price': {'product': 'prod_test'}}]}
-        mock_stripe.Subscription.retrieve.return_value = mock_subscription
+        stub_stripe_reads(mock_stripe, {'id': 'sub_test123', 'status': 'active', 'items': {'object': 'list', 'data': [{'price': {'product': 'prod_test'}}]}}, {'id': 'cus_test123'})
         
         response = self.client.post(reverse('delete_user'), {})
         
@@ -399,19 +440,16 @@ class UserDeletionTests(TestCase):
     def test_delete_user_case_insensitive_email(self, mock_stripe):
         """Test that email comparison is case insensitive"""
         # Mock Stripe API calls to prevent real API calls
-        mock_subscription = MagicMock()
-        mock_subscription.status = 'active'
-        mock_subscription['items'] = {'data': [{'price': {'product': 'prod_test'}}]}
-        mock_stripe.Subscription.retrieve.return_value = mock_subscription
+        stub_stripe_reads(mock_stripe, {'id': 'sub_test123', 'status': 'active', 'items': {'object': 'list', 'data': [{'price': {'product': 'prod_test'}}]}}, {'id': 'cus_test123'})
         
         response = self.client.post(reverse('delete_user'), {'email': self.email.upper()})
         
         # Should redirect to home (successful deletion)
         self.assertRedirects(response, reverse('home'))
         
-        # User should be deleted from database
-        self.assertFalse(User.objects.filter(username=self.username).exists())
-        self.assertFalse(Profile.objects.filter(user__username=self.username).exists())
+        # User should be deactivated and queued for the background deletion
+        self.assertFalse(User.objects.get(username=self.username).is_active)
+        self.assertTrue(AccountDeletion.objects.filter(username=self.username).exists())
 
     def test_delete_user_requires_login(self):
         """Test that delete_user requires authentication"""
@@ -434,6 +472,74 @@ class UserDeletionTests(TestCase):
         # User should still exist in database
         self.assertTrue(User.objects.filter(username=self.username).exists())
 
+class AccountDeletionJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = self.settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user(username='leaving', email='leaving@example.com', password='leavingpass123')
+        profile = self.user.profile
+        profile.stripe_customer_id = 'cus_leaving'
+        profile.stripe_subscription_id = 'sub_leaving'
+        profile.profile_image = SimpleUploadedFile('avatar.png', b'png-bytes', content_type='image/png')
+        profile.save()
+        self.image_path = profile.profile_image.path
+        SubscriptionEvent.objects.bulk_create(
+            SubscriptionEvent(event_id=f'evt_leaving_{i}', event_type='invoice.paid', created=timezone.now(), data={}, customer_id='cus_leaving')
+            for i in range(25)
+        )
+        SubscriptionEvent.objects.create(event_id='evt_other', event_type='invoice.paid', created=timezone.now(), data={}, customer_id='cus_other')
+
+    @patch('accounts.deletion.stripe')
+    def test_process_removes_everything_and_records_completion(self, mock_stripe):
+        account_deletion = deletion.request_deletion(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(deletion.process(account_deletion, batch_size=10))
+        mock_stripe.Subscription.cancel.assert_called_once_with('sub_leaving', api_key=settings.STRIPE_SECRET_KEY)
+        event_deletes = [q for q in queries.captured_queries if q['sql'].startswith('DELETE FROM "accounts_subscriptionevent"')]
+        self.assertEqual(len(event_deletes), 3)
+        self.assertEqual(list(SubscriptionEvent.objects.values_list('event_id', flat=True)), ['evt_other'])
+        self.assertFalse(os.path.exists(self.image_path))
+        self.assertFalse(User.objects.filter(username='leaving').exists())
+        account_deletion.refresh_from_db()
+        self.assertIsNotNone(account_deletion.completed_at)
+        self.assertEqual(account_deletion.events_deleted, 25)
+
+    @patch('accounts.deletion.stripe')
+    def test_failed_deletion_is_retried_by_the_command(self, mock_stripe):
+        mock_stripe.error = stripe.error
+        mock_stripe.Subscription.cancel.side_effect = stripe.error.APIConnectionError('Stripe unreachable')
+        deletion.request_deletion(self.user)
+        out = io.StringIO()
+        # Left to the worker while its task is queued
+        call_command('process_account_deletions', stdout=out)
+        self.assertIn('0 account deletions completed, 0 failed', out.getvalue())
+        self.assertEqual(taskqueue.run_pending(), (0, 1))
+        Task.objects.update(status=Task.FAILED)
+        call_command('process_account_deletions', stdout=out)
+        self.assertIn('0 account deletions completed, 1 failed', out.getvalue())
+        self.assertIn('Stripe unreachable', AccountDeletion.objects.get().last_error)
+        self.assertTrue(User.objects.filter(username='leaving').exists())
+        mock_stripe.Subscription.cancel.side_effect = None
+        call_command('process_account_deletions', stdout=out)
+        self.assertIsNotNone(AccountDeletion.objects.get().completed_at)
+        self.assertFalse(User.objects.filter(username='leaving').exists())
+
+    @patch('accounts.deletion.stripe')
+    def test_admin_bulk_actions_queue_and_process_accounts(self, mock_stripe):
+        other = User.objects.create_user(username='leaving2', password='leavingpass123')
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpass123')
+        self.client.force_login(admin_user)
+        self.client.post(reverse('admin:auth_user_changelist'), {'action': 'schedule_deletion', '_selected_action': [self.user.pk, other.pk]})
+        self.assertEqual(AccountDeletion.objects.filter(completed_at__isnull=True).count(), 2)
+        self.assertFalse(User.objects.get(pk=other.pk).is_active)
+        pending = list(AccountDeletion.objects.values_list('pk', flat=True))
+        self.client.post(reverse('admin:accounts_accountdeletion_changelist'), {'action': 'process_deletions', '_selected_action': pending})
+        self.assertEqual(AccountDeletion.objects.filter(completed_at__isnull=False).count(), 2)
+        self.assertFalse(User.objects.filter(username__in=['leaving', 'leaving2']).exists())
+
 class ProfileUpdateHTMXTests(TestCase):
     def setUp(self):
         self.username = 'htmxuser'
@@ -595,28 +701,1428 @@ class SubscriptionEventLogTests(TestCase):
     def test_event_log_renders_latest_20(self):
         response = self.client.get(reverse('subscription_details'))
         self.assertEqual(response.status_code, 200)
-        # Only 20 events should be shown
-        self.assertContains(response, 'Show next')
+        # Only 20 events are rendered with the page; the rest come from the scroll sentinel
+        self.assertContains(response, 'data-event-id=', count=20)
+        self.assertContains(response, 'id="event-log-more"')
         self.assertNotContains(response, 'Show previous')
         # The most recent event (evt_0) should be present
         self.assertContains(response, 'Subscription Created: Gold')
         # The 21st event (evt_20) should not be present
-        self.assertNotContains(response, 'evt_20')
+        self.assertNotContains(response, 'data-event-id="evt_20"')
 
-    def test_event_log_pagination_next_and_previous(self):
-        # Go to page 2
-        response = self.client.get(reverse('subscription_details') + '?page=2')
+    def test_event_log_scrolls_with_a_keyset_cursor(self):
+        response = self.client.get(reverse('subscription_details'))
+        cursor = response.context['next_cursor']
+        with patch('accounts.views.stripe') as mock_stripe, CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('event_log_htmx'), {'cursor': cursor})
         self.assertEqual(response.status_code, 200)
-        # Should show both next and previous buttons (since there are 25 events)
-        self.assertContains(response, 'Show next')
-        self.assertContains(response, 'Show previous')
-        # The oldest event (evt_24) should be present on page 2
-        self.assertContains(response, 'evt_24')
-        # The most recent event (evt_0) should not be present
-        self.assertNotContains(response, 'evt_0')
+        # Only the rows: no page, no Stripe
+        self.assertNotContains(response, '<html')
+        self.assertEqual(mock_stripe.mock_calls, [])
+        self.assertEqual([e.event_id for e in response.context['subscription_events']], [f'evt_{i}' for i in range(20, 25)])
+        # The oldest event (evt_24) closes the log: no further sentinel
+        self.assertContains(response, 'data-event-id="evt_24"')
+        self.assertNotContains(response, 'event-log-more')
+        self.assertNotContains(response, 'data-event-id="evt_0"')
+        event_queries = [q['sql'] for q in queries.captured_queries if 'accounts_subscriptionevent' in q['sql']]
+        self.assertEqual(len(event_queries), 1)
+        self.assertNotIn('OFFSET', event_queries[0])
+        self.assertNotIn('COUNT(', event_queries[0])
+
+    def test_event_log_cursor_breaks_ties_and_rejects_garbage(self):
+        tied = SubscriptionEvent.objects.get(event_id='evt_19').created
+        SubscriptionEvent.objects.filter(event_id__in=['evt_20', 'evt_21']).update(created=tied)
+        first, cursor = views._subscription_event_batch('cus_event123', size=20)
+        rest, end = views._subscription_event_batch('cus_event123', cursor, size=20)
+        self.assertIsNone(end)
+        self.assertEqual(len({e.pk for e in first} | {e.pk for e in rest}), 25)
+        self.assertEqual(self.client.get(reverse('event_log_htmx'), {'cursor': 'garbage'}).status_code, 400)
 
     def test_event_log_no_events(self):
         # Remove all events
         SubscriptionEvent.objects.all().delete()
         response = self.client.get(reverse('subscription_details'))
         self.assertContains(response, 'No relevant events found for this subscription.')
+
+class MembershipCatalogTests(TestCase):
+    def setUp(self):
+        catalog.invalidate()
+        self.gold = Membership.objects.create(name='Gold', stripe_price_id='price_gold', description='Gold plan')
+
+    def tearDown(self):
+        catalog.invalidate()
+
+    def test_catalog_is_served_from_memory(self):
+        self.assertEqual([m.name for m in catalog.get_memberships()], ['Gold'])
+        with self.assertNumQueries(0):
+            catalog.get_memberships()
+
+    def test_membership_changes_invalidate_catalog(self):
+        catalog.get_memberships()
+        Membership.objects.create(name='Silver', stripe_price_id='price_silver')
+        self.assertEqual([m.name for m in catalog.get_memberships()], ['Gold', 'Silver'])
+        self.gold.delete()
+        self.assertEqual([m.name for m in catalog.get_memberships()], ['Silver'])
+
+    def test_anonymous_subscribe_page_is_cached(self):
+        response = self.client.get(reverse('subscribe'))
+        self.assertContains(response, 'Gold')
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('subscribe'))
+        self.assertContains(response, 'Gold')
+        # Anonymous visitors are sent to login instead of posting a checkout form
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        self.gold.name = 'Platinum'
+        self.gold.save()
+        self.assertContains(self.client.get(reverse('subscribe')), 'Platinum')
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cacheuser', password='cachepass123')
+        self.user.profile.email_confirmed = True
+        self.user.profile.save()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_anonymous_pages_are_publicly_cacheable(self):
+        for name in ('home', 'subscription_success', 'subscription_cancel', 'subscribe'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('s-maxage', response['Cache-Control'])
+            self.assertIn('Cookie', response['Vary'])
+
+    def test_anonymous_home_is_served_from_cache(self):
+        self.client.get(reverse('home'))
+        with patch('accounts.views.render') as mock_render:
+            response = self.client.get(reverse('home'))
+        mock_render.assert_not_called()
+        self.assertContains(response, 'Get Started Today')
+
+    def test_authenticated_users_get_private_fresh_pages(self):
+        self.client.get(reverse('home'))
+        self.client.login(username='cacheuser', password='cachepass123')
+        response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Welcome Back!')
+        self.assertIn('private', response['Cache-Control'])
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='metricsuser', password='metricspass123')
+        self.user.profile.email_confirmed = True
+        self.user.profile.save()
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.login(username='metricsuser', password='metricspass123')
+        self.client.get(reverse('logged_in_page'))
+        snapshot = metrics.registry.snapshot()
+        self.assertIn('logged_in_page', snapshot)
+        queries, _, count = snapshot['logged_in_page']['db_queries']
+        self.assertEqual(count, 1)
+        self.assertGreater(queries[0], 0)
+        template_seconds, _, _ = snapshot['logged_in_page']['template_seconds']
+        self.assertGreater(template_seconds[0], 0)
+
+    def test_stripe_calls_are_counted(self):
+        import stripe
+        token = metrics.start_request()
+        with patch.object(stripe._http_client.RequestsClient, 'request', return_value=('{"id": "sub_1", "object": "subscription"}', 200, {})):
+            stripe.Subscription.retrieve('sub_1', api_key='sk_test')
+        metrics.finish_request(token, 'manual', 0.1)
+        calls, _, _ = metrics.registry.snapshot()['manual']['stripe_calls']
+        self.assertEqual(calls, [1])
+
+    def test_metrics_endpoint_requires_staff_or_token(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(METRICS_TOKEN='scrape-token'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '# TYPE accounts_request_seconds summary')
+        self.assertContains(response, 'accounts_request_seconds{view="home",quantile="0.99"}')
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username='metricsuser', password='metricspass123')
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+class LoggingConfigTests(TestCase):
+    def test_json_formatter_emits_structured_record(self):
+        record = logging.LogRecord('accounts.views', logging.INFO, __file__, 1, 'Updated profile for customer %s', ('cus_1',), None)
+        record.event_id = 'evt_1'
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual(entry['message'], 'Updated profile for customer cus_1')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'accounts.views')
+        self.assertEqual(entry['event_id'], 'evt_1')
+
+    def test_queue_handler_formats_on_listener_thread(self):
+        stream = io.StringIO()
+        handler = QueueStreamHandler(stream=stream)
+        handler.setFormatter(JSONFormatter())
+        test_logger = logging.getLogger('accounts.tests.queue')
+        test_logger.addHandler(handler)
+        test_logger.propagate = False
+        try:
+            test_logger.warning('Webhook for %s', 'cus_2')
+        finally:
+            test_logger.removeHandler(handler)
+            handler.close()
+        self.assertEqual(json.loads(stream.getvalue())['message'], 'Webhook for cus_2')
+
+class CheckoutSessionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='checkoutuser', email='checkout@example.com', password='checkoutpass123')
+        self.user.profile.email_confirmed = True
+        self.user.profile.save()
+        self.membership = Membership.objects.create(name='Gold', stripe_price_id='price_gold')
+        self.client.login(username='checkoutuser', password='checkoutpass123')
+
+    @patch('accounts.views.stripe')
+    def test_checkout_creates_customer_and_redirects_to_stripe(self, mock_stripe):
+        mock_stripe.Customer.create_async = AsyncMock(return_value=MagicMock(id='cus_new'))
+        mock_stripe.checkout.Session.create_async = AsyncMock(return_value=MagicMock(url='https://checkout.stripe.test/session'))
+        response = self.client.post(reverse('create_checkout_session', args=[self.membership.id]))
+        self.assertRedirects(response, 'https://checkout.stripe.test/session', fetch_redirect_response=False)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.stripe_customer_id, 'cus_new')
+        kwargs = mock_stripe.checkout.Session.create_async.call_args.kwargs
+        self.assertEqual(kwargs['customer'], 'cus_new')
+        self.assertEqual(kwargs['line_items'], [{'price': 'price_gold', 'quantity': 1}])
+
+class StripeHTTPClientTests(TestCase):
+    def test_async_client_is_created_per_event_loop(self):
+        client = LoopLocalHTTPXClient()
+
+        async def loop_client():
+            return client._async_client(), client._async_client()
+
+        first, same_loop = async_to_sync(loop_client)()
+        second, _ = async_to_sync(loop_client)()
+        self.assertIs(first, same_loop)
+        self.assertIsNot(first, second)
+
+    def test_async_client_is_closed_with_its_event_loop(self):
+        client = LoopLocalHTTPXClient()
+
+        async def loop_client():
+            return client._async_client()
+
+        first = async_to_sync(loop_client)()
+        second = asyncio.run(loop_client())
+        self.assertTrue(first.is_closed)
+        self.assertTrue(second.is_closed)
+        self.assertEqual(client._loop_clients, {})
+
+        async def closed_early():
+            loop_client = client._async_client()
+            await client.close_async()
+            return loop_client
+
+        self.assertTrue(async_to_sync(closed_early)().is_closed)
+
+class BenchmarkSuiteTests(TestCase):
+    @override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_signed_webhook_is_accepted(self):
+        user = User.objects.create_user(username='hookuser', password='hookpass123')
+        user.profile.stripe_customer_id = fake_stripe.CUSTOMER_ID
+        user.profile.save()
+        event = fake_stripe.webhook_event('customer.subscription.updated', event_id='evt_signed')
+        payload, signature = fake_stripe.signed_webhook(event, 'whsec_test')
+        response = self.client.post(reverse('stripe_webhook'), data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(SubscriptionEvent.objects.filter(event_id='evt_signed').exists())
+        user.profile.refresh_from_db()
+        self.assertEqual(user.profile.stripe_subscription_id, fake_stripe.SUBSCRIPTION_ID)
+
+    def test_fake_stripe_server_answers_the_sdk(self):
+        import stripe
+        with fake_stripe.FakeStripeServer() as server, fake_stripe.use_fake_stripe(server):
+            subscription = stripe.Subscription.retrieve('sub_fake')
+            customer = async_to_sync(stripe.Customer.retrieve_async)('cus_fake')
+        self.assertEqual(subscription.id, 'sub_fake')
+        self.assertEqual(customer.email, 'bench@example.com')
+        self.assertEqual(server.request_count, 2)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'profile': {'requests_per_second': 100, 'p95_ms': 10, 'queries_per_request': 4, 'stripe_calls_per_request': 2}}
+        ok = {'profile': {'requests_per_second': 90, 'p95_ms': 12, 'queries_per_request': 4, 'stripe_calls_per_request': 2}}
+        slow = {'profile': {'requests_per_second': 50, 'p95_ms': 30, 'queries_per_request': 5, 'stripe_calls_per_request': 2}}
+        self.assertEqual(benchmark_runner.compare(ok, baseline), [])
+        self.assertEqual(len(benchmark_runner.compare(slow, baseline)), 3)
+        # Counts vary with single-flight timing under concurrency
+        jitter = {'profile': dict(baseline['profile'], stripe_calls_per_request=2.1)}
+        self.assertEqual(benchmark_runner.compare(jitter, baseline), [])
+
+@override_settings(STRIPE_WEBHOOK_SECRET=benchmark_runner.WEBHOOK_SECRET)
+class RouteBudgetTests(TestCase):
+    """Request every project route against a realistically sized fixture and hold it to its @budget."""
+    EVENT_COUNT = 5000
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        server = cls.enterClassContext(fake_stripe.FakeStripeServer())
+        cls.enterClassContext(fake_stripe.use_fake_stripe(server))
+        # The fixture's event types are rolled back with it; drop them from the cache too
+        cls.addClassCleanup(event_types.invalidate)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = benchmark_runner.create_fixtures(cls.EVENT_COUNT)
+
+    def _routes(self, patterns):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                # Admin and django.contrib.auth routes are not ours to budget
+                if getattr(pattern.urlconf_module, '__name__', None) == 'accounts.urls':
+                    yield from self._routes(pattern.url_patterns)
+            elif pattern.name:
+                yield pattern.name, pattern.callback
+
+    def _request(self, name):
+        kwargs = {
+            'confirm_email': {'uidb64': urlsafe_base64_encode(force_bytes(self.user.pk)), 'token': default_token_generator.make_token(self.user)},
+            'create_checkout_session': {'membership_id': Membership.objects.get().pk},
+            'static_asset': {'path': 'admin/css/base.css'},
+        }.get(name)
+        url = reverse(name, kwargs=kwargs)
+        if name == 'stripe_webhook':
+            payload, signature = fake_stripe.signed_webhook(fake_stripe.webhook_event(), benchmark_runner.WEBHOOK_SECRET)
+            return self.client.post(url, data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+        data = {
+            'login': {'username': benchmark_runner.USERNAME, 'password': benchmark_runner.PASSWORD},
+            'delete_user': {'email': 'bench@example.com'},
+            'username_update_htmx': {'username': 'budgetuser2'},
+            'bio_update_htmx': {'bio': 'Within budget'},
+            'resend_verification_email': {'username': benchmark_runner.USERNAME},
+        }.get(name)
+        return self.client.get(url) if data is None else self.client.post(url, data)
+
+    def _measure(self, name):
+        cache.clear()
+        catalog.warm()
+        event_types.warm()
+        self.client.force_login(self.user)
+        with transaction.atomic():
+            measured = self._measured(name, lambda: self._request(name))
+            transaction.set_rollback(True)
+        return measured
+
+    def _measured(self, name, send):
+        """Send one request and return what it cost as (queries, stripe calls, seconds)."""
+        metrics.registry.reset()
+        send()
+        recorded = metrics.registry.snapshot()[name]
+        return int(recorded['db_queries'][1]), int(recorded['stripe_calls'][1]), recorded['request_seconds'][1]
+
+    def test_every_route_stays_within_its_budget(self):
+        unbudgeted = []
+        for name, callback in self._routes(get_resolver().url_patterns):
+            view_budget = budgets.get_budget(callback)
+            if view_budget is None:
+                unbudgeted.append(name)
+                continue
+            with self.subTest(route=name):
+                self.assertEqual(budgets.violations(view_budget, *self._measure(name)), [])
+        self.assertEqual(unbudgeted, [], 'Declare a @budget for every route')
+
+    def test_login_flows_stay_within_their_budgets(self):
+        # A fresh anonymous client, the way users arrive: no session row yet,
+        # and login() cycles the session key, which the other routes never pay for
+        from accounts.views import hash_code
+        cache.clear()
+        catalog.warm()
+        event_types.warm()
+        secret = pyotp.random_base32()
+        credentials = {'username': benchmark_runner.USERNAME, 'password': benchmark_runner.PASSWORD}
+        flows = {
+            'password': [('login', lambda: self.client.post(reverse('login'), credentials))],
+            'totp': [
+                ('login', lambda: self.client.post(reverse('login'), credentials)),
+                ('two_factor_challenge', lambda: self.client.get(reverse('two_factor_challenge'))),
+                ('two_factor_challenge', lambda: self.client.post(reverse('two_factor_challenge'), {'code': '000000'})),
+                ('two_factor_challenge', lambda: self.client.post(reverse('two_factor_challenge'), {'code': pyotp.TOTP(secret).now()})),
+            ],
+            'recovery_code': [
+                ('login', lambda: self.client.post(reverse('login'), credentials)),
+                ('two_factor_challenge', lambda: self.client.post(reverse('two_factor_challenge'), {'recovery_code': 'RECOVER1'})),
+            ],
+        }
+        for flow, steps in flows.items():
+            with self.subTest(flow=flow), transaction.atomic():
+                self.client.logout()
+                if flow != 'password':
+                    Profile.objects.filter(user=self.user).update(two_factor_enabled=True, two_factor_secret=secret, recovery_codes=[hash_code('RECOVER1')])
+                for name, send in steps:
+                    measured = self._measured(name, send)
+                    self.assertEqual(budgets.violations(budgets.get_budget(resolve(reverse(name)).func), *measured), [], name)
+                self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+                transaction.set_rollback(True)
+
+    def test_subscription_details_with_an_expired_catalog_stays_within_budget(self):
+        cache.clear()
+        catalog.invalidate()
+        event_types.warm()
+        self.client.force_login(self.user)
+        with transaction.atomic():
+            measured = self._measured('subscription_details', lambda: self.client.get(reverse('subscription_details')))
+            transaction.set_rollback(True)
+        self.assertEqual(budgets.violations(budgets.get_budget(views.subscription_details), *measured), [])
+
+    def test_event_log_does_not_query_per_event(self):
+        catalog.warm()
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as first_page:
+            self.client.get(reverse('subscription_details'))
+        with CaptureQueriesContext(connection) as second_page:
+            self.client.get(reverse('subscription_details'), {'page': 2})
+        self.assertEqual(len(first_page), len(second_page))
+        self.assertFalse([q for q in first_page.captured_queries if 'accounts_membership' in q['sql']])
+
+    def test_over_budget_request_is_logged(self):
+        with patch.object(views.custom_login, 'budget', budgets.Budget(0, 0, 0)), \
+                self.assertLogs('accounts.budgets', level='WARNING') as logs:
+            self.client.get(reverse('login'))
+        self.assertIn('login exceeded its budget', logs.output[0])
+
+class PasswordHashingTests(TestCase):
+    def test_suite_uses_the_fast_hasher(self):
+        self.assertTrue(settings.TESTING)
+        user = User.objects.create_user(username='fasthash', password='fastpass123')
+        self.assertTrue(user.password.startswith('md5$'))
+
+    def test_login_rehashes_with_the_preferred_hasher(self):
+        user = User.objects.create_user(username='rehash', password='rehashpass123')
+        user.profile.email_confirmed = True
+        user.profile.save()
+        with self.settings(PASSWORD_HASHERS=['accounts.hashers.TunedScryptPasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher']):
+            response = self.client.post(reverse('login'), {'username': 'rehash', 'password': 'rehashpass123'})
+            self.assertRedirects(response, reverse('profile'))
+            user.refresh_from_db()
+            self.assertTrue(user.password.startswith(f'scrypt${settings.SCRYPT_WORK_FACTOR}$'))
+            self.assertTrue(user.check_password('rehashpass123'))
+
+    def test_benchmark_hashers_reports_per_core_rate(self):
+        out = io.StringIO()
+        call_command('benchmark_hashers', hasher=['scrypt'], rounds=1, stdout=out)
+        self.assertIn('hashes/s per core', out.getvalue())
+
+class SessionBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='sessionuser', password='sessionpass123')
+
+    def _queries_per_request(self):
+        # A new client, because SessionMiddleware picks its engine when the handler loads
+        client = Client()
+        client.force_login(self.user)
+        client.get(reverse('logged_in_page'))
+        with CaptureQueriesContext(connection) as queries:
+            client.get(reverse('logged_in_page'))
+        return len(queries)
+
+    def test_cached_db_sessions_skip_the_session_query(self):
+        # cached_db needs a shared cache, so the default stays on the database
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.db')
+        self.assertFalse(settings.SHARED_CACHE)
+        db_queries = self._queries_per_request()
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db'):
+            cached_queries = self._queries_per_request()
+        # Only the user lookup is left
+        self.assertEqual((db_queries, cached_queries), (2, 1))
+
+    def test_two_factor_flow_works_with_signed_cookie_sessions(self):
+        self.user.profile.email_confirmed = True
+        self.user.profile.two_factor_enabled = True
+        self.user.profile.two_factor_secret = pyotp.random_base32()
+        self.user.profile.save()
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            response = self.client.post(reverse('login'), {'username': 'sessionuser', 'password': 'sessionpass123'})
+            self.assertRedirects(response, reverse('two_factor_challenge'))
+            code = pyotp.TOTP(self.user.profile.two_factor_secret).now()
+            response = self.client.post(reverse('two_factor_challenge'), {'code': code})
+            self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
+            self.assertEqual(int(self.client.session['_auth_user_id']), self.user.pk)
+
+    def test_purge_sessions_deletes_only_expired_rows_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'expired{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(5)]
+            + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))]
+        )
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_sessions', batch_size=2, stdout=out)
+        self.assertIn('Purged 5 expired sessions', out.getvalue())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('DELETE')]), 3)
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpass123')
+        self.client.force_login(self.admin)
+        SubscriptionEvent.objects.bulk_create(
+            SubscriptionEvent(
+                event_id=f'evt_admin_{i}',
+                event_type='invoice.paid' if i % 2 else 'customer.subscription.created',
+                created=timezone.now(),
+                data={'object': {'blob': 'x' * 100}},
+                customer_id=f'cus_admin_{i % 3}',
+            )
+            for i in range(150)
+        )
+
+    def test_event_changelist_skips_count_and_payload(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:accounts_subscriptionevent_changelist'))
+        self.assertEqual(response.status_code, 200)
+        event_queries = [q['sql'] for q in queries.captured_queries if 'accounts_subscriptionevent' in q['sql']]
+        self.assertFalse([sql for sql in event_queries if 'COUNT(' in sql])
+        self.assertFalse([sql for sql in event_queries if '"accounts_subscriptionevent"."data"' in sql])
+        self.assertEqual(response.context['cl'].paginator.count, 150)
+
+    def test_event_search_uses_exact_and_prefix_lookups(self):
+        url = reverse('admin:accounts_subscriptionevent_changelist')
+        response = self.client.get(url, {'q': 'cus_admin_1'})
+        self.assertEqual(response.context['cl'].result_count, 50)
+        response = self.client.get(url, {'q': 'evt_admin_7'})
+        self.assertEqual([e.event_id for e in response.context['cl'].result_list], ['evt_admin_7'])
+        # No substring matches: that would need a full scan
+        response = self.client.get(url, {'q': 'admin_7'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+        response = self.client.get(url, {'event_type': 'invoice.paid'})
+        self.assertEqual(response.context['cl'].result_count, 75)
+
+    def test_profile_changelist_joins_users(self):
+        for i in range(5):
+            User.objects.create_user(username=f'listed{i}', password='listedpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:accounts_profile_changelist'), {'q': 'listed'})
+        self.assertEqual(response.context['cl'].result_count, 5)
+        user_lookups = [q for q in queries.captured_queries if q['sql'].startswith('SELECT "auth_user"') and 'WHERE "auth_user"."id" =' in q['sql']]
+        # Only request.user; the listed profiles come with their users joined
+        self.assertEqual(len(user_lookups), 1)
+
+    def test_search_is_answered_from_indexes(self):
+        for model, table in ((SubscriptionEvent, 'accounts_subscriptionevent'), (Profile, 'accounts_profile')):
+            with self.subTest(model=model.__name__):
+                queryset, _ = admin.site._registry[model].get_search_results(None, model.objects.all(), 'cus_admin_1')
+                plan = queryset.explain()
+                self.assertNotIn(f'SCAN {table}', plan)
+                self.assertNotIn('SCAN auth_user', plan)
+        Profile.objects.filter(user=self.admin).update(stripe_customer_id='cus_admin_profile')
+        for term in ('cus_admin_profile', 'adm'):
+            response = self.client.get(reverse('admin:accounts_profile_changelist'), {'q': term})
+            self.assertEqual([p.user for p in response.context['cl'].result_list], [self.admin])
+
+class EventRollupTests(TestCase):
+    def _event(self, event_id, event_type, obj, created, previous=None):
+        data = {'object': obj}
+        if previous is not None:
+            data['previous_attributes'] = previous
+        return SubscriptionEvent.objects.create(event_id=event_id, event_type=event_type, created=created, data=data, customer_id='cus_roll')
+
+    def setUp(self):
+        self.day = timezone.now().replace(hour=12) - timedelta(days=1)
+        self._event('evt_r1', 'customer.subscription.created', {'id': 'sub_1'}, self.day)
+        self._event('evt_r2', 'invoice.paid', {'amount_paid': 2000, 'currency': 'usd'}, self.day)
+        self._event('evt_r3', 'invoice.paid', {'amount_paid': 1500, 'currency': 'eur'}, self.day)
+        self._event('evt_r4', 'invoice.payment_failed', {'amount_due': 2000, 'currency': 'usd'}, self.day)
+        self._event('evt_r5', 'customer.subscription.updated', {'cancel_at_period_end': False}, self.day, {'cancel_at_period_end': True})
+
+    def test_update_folds_only_new_events(self):
+        self.assertEqual(rollups.update(batch_size=2), 5)
+        usd = DailyEventRollup.objects.get(day=self.day.date(), currency='USD')
+        self.assertEqual((usd.invoices_paid, usd.invoices_failed, usd.revenue), (1, 1, 2000))
+        counts = DailyEventRollup.objects.get(day=self.day.date(), currency='')
+        self.assertEqual((counts.new_subscriptions, counts.reactivations), (1, 1))
+        self.assertEqual(rollups.update(), 0)
+        self._event('evt_r6', 'customer.subscription.deleted', {'id': 'sub_1'}, self.day)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(rollups.update(), 1)
+        event_reads = [q['sql'] for q in queries.captured_queries if 'FROM "accounts_subscriptionevent"' in q['sql']]
+        self.assertEqual(len(event_reads), 2)
+        self.assertTrue(all('"accounts_subscriptionevent"."id" >' in sql for sql in event_reads))
+        counts.refresh_from_db()
+        self.assertEqual(counts.cancellations, 1)
+
+    def test_update_stays_behind_young_events(self):
+        self._event('evt_r6', 'customer.subscription.deleted', {'id': 'sub_1'}, timezone.now())
+        # Older by its Stripe timestamp, but stored after the young event
+        self._event('evt_r7', 'customer.subscription.created', {'id': 'sub_2'}, self.day)
+        with self.settings(ROLLUP_LAG_SECONDS=60):
+            self.assertEqual(rollups.update(), 5)
+            self.assertEqual(rollups.update(), 0)
+        self.assertEqual(RollupState.objects.get().last_event_id, SubscriptionEvent.objects.get(event_id='evt_r5').pk)
+        self.assertEqual(rollups.update(lag=0), 2)
+        counts = DailyEventRollup.objects.get(day=self.day.date(), currency='')
+        self.assertEqual(counts.new_subscriptions, 2)
+
+    def test_report_reads_only_rollups(self):
+        call_command('update_rollups', stdout=io.StringIO())
+        admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='adminpass123')
+        self.client.force_login(admin_user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:accounts_dailyeventrollup_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if 'accounts_subscriptionevent' in q['sql']])
+        self.assertContains(response, '20.00 USD')
+        self.assertContains(response, '15.00 EUR')
+        self.assertContains(response, '33%')
+
+    def test_rebuild_recomputes_from_scratch(self):
+        rollups.update()
+        DailyEventRollup.objects.update(revenue=0)
+        call_command('update_rollups', rebuild=True, stdout=io.StringIO())
+        self.assertEqual(DailyEventRollup.objects.get(currency='EUR').revenue, 1500)
+
+class EventExportTests(TestCase):
+    def setUp(self):
+        created = timezone.now()
+        SubscriptionEvent.objects.create(event_id='evt_x1', event_type='invoice.paid', created=created, customer_id='cus_x', subscription_id='sub_x',
+                                         data={'object': {'amount_paid': 2000, 'currency': 'usd', 'lines': {'data': [{'price': {'product': 'prod_x'}}]}}})
+        SubscriptionEvent.objects.create(event_id='evt_x2', event_type='customer.subscription.created', created=created, customer_id='cus_x', subscription_id='sub_x',
+                                         data={'object': fake_stripe.subscription_object('sub_x', 'cus_x')})
+        SubscriptionEvent.objects.create(event_id='evt_y1', event_type='invoice.paid', created=created, customer_id='cus_y', data={})
+
+    def test_export_view_streams_flattened_csv_to_staff(self):
+        staff = User.objects.create_user(username='staff', password='staffpass123', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('export_events'), {'customer_id': 'cus_x'})
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], list(exports.FIELDS))
+        self.assertEqual([row[0] for row in rows[1:]], ['evt_x1', 'evt_x2'])
+        self.assertEqual(rows[1][5:], ['2000', 'USD', 'prod_x'])
+        self.assertEqual(rows[2][5:], ['2000', 'USD', fake_stripe.PRODUCT_ID])
+
+    async def test_export_view_streams_chunks_asynchronously_under_asgi(self):
+        staff = await sync_to_async(User.objects.create_user)(username='staff', password='staffpass123', is_staff=True)
+        await self.async_client.aforce_login(staff)
+        with patch.object(exports, 'aiter_csv', functools.partial(exports.aiter_csv, chunk_size=2)):
+            response = await self.async_client.get(reverse('export_events'))
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        # The header and the first event, then the other two
+        self.assertEqual(len(chunks), 2)
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual([row[0] for row in rows[1:]], ['evt_x1', 'evt_x2', 'evt_y1'])
+
+    def test_export_view_is_staff_only(self):
+        user = User.objects.create_user(username='notstaff', password='notstaffpass123')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('export_events')).status_code, 403)
+
+    def test_export_command_writes_csv_in_chunks(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as f:
+            call_command('export_events', f.name, chunk_size=1, stderr=io.StringIO())
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[3][:2], ['evt_y1', 'invoice.paid'])
+
+    def test_parquet_export_needs_pyarrow(self):
+        with patch.dict(sys.modules, {'pyarrow': None, 'pyarrow.parquet': None}):
+            with self.assertRaisesMessage(CommandError, 'pip install pyarrow'):
+                call_command('export_events', os.devnull, format='parquet', stderr=io.StringIO())
+
+class StartupImportTests(TestCase):
+    """Cold start budget: `python -X importtime` on django.setup() plus the URLconf."""
+    LAZY_MODULES = ('stripe', 'httpx', 'pyotp', 'qrcode', 'PIL')
+    URLCONF_IMPORT_BUDGET_MS = 500
+
+    def _import_times(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='website.settings')
+        env.setdefault('SECRET_KEY', 'importtime')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup(); import website.urls'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and '|' in line and 'cumulative' not in line:
+                _, cumulative, name = line[len('import time:'):].split('|')
+                times[name.strip()] = int(cumulative) / 1000
+        return times
+
+    def test_heavy_dependencies_load_lazily(self):
+        times = self._import_times()
+        self.assertIn('accounts.views', times)
+        self.assertEqual([name for name in self.LAZY_MODULES if name in times], [])
+        self.assertLess(times['website.urls'], self.URLCONF_IMPORT_BUDGET_MS)
+
+    def test_stripe_proxy_configures_sdk_on_first_use(self):
+        from .services import stripe_service
+        self.assertIs(stripe_service.stripe.Subscription, stripe.Subscription)
+        self.assertIsInstance(stripe.default_http_client._async_fallback_client, LoopLocalHTTPXClient)
+        self.assertTrue(stripe._http_client.HTTPClient._accounts_metrics_installed)
+
+
+class WorkerWarmupTests(TestCase):
+    # warmup.run() opens a connection to every database, including the replica
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.loader = engines['django'].engine.template_loaders[0]
+        self.loader.reset()
+
+    def test_run_compiles_every_template_and_reverses_routes(self):
+        report = warmup.run(include_stripe=False)
+        self.assertEqual(set(report), {'templates', 'urls', 'connections', 'catalog', 'event_types'})
+        self.assertEqual(report['templates'][0], 26)
+        self.assertGreater(report['urls'][0], 20)
+        self.assertIn('accounts/subscription_details.html', self.loader.get_template_cache)
+        self.assertIn('base.html', self.loader.get_template_cache)
+        with patch.object(self.loader, 'get_template_sources', side_effect=AssertionError('template loaded from disk')):
+            get_template('accounts/subscription_details.html')
+
+    def test_run_closes_the_connections_it_opened(self):
+        # The importing thread, or a --preload master, must not hand its connections to the workers
+        with patch.object(warmup.connections, 'close_all') as close_all:
+            warmup.run(include_stripe=False)
+        close_all.assert_called_once_with()
+
+    def test_asgi_defaults_to_no_persistent_connections(self):
+        code = 'from django.conf import settings; print(settings.DATABASES["default"]["CONN_MAX_AGE"])'
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='website.settings', SECRET_KEY='asgi')
+        env.pop('CONN_MAX_AGE', None)
+        results = []
+        for asgi in ('', '1'):
+            result = subprocess.run(
+                [sys.executable, '-c', f'import django; django.setup(); {code}'],
+                cwd=settings.BASE_DIR, env=dict(env, DJANGO_ASGI=asgi), capture_output=True, text=True, timeout=120,
+            )
+            self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+            results.append(result.stdout.strip())
+        self.assertEqual(results, ['60', '0'])
+
+    def test_failed_step_is_logged_not_raised(self):
+        with patch.object(warmup, 'open_connections', side_effect=DatabaseError('down')), \
+                patch.object(warmup, 'STEPS', (('connections', warmup.open_connections),)), \
+                self.assertLogs('accounts.warmup', 'WARNING'):
+            report = warmup.run(include_stripe=False)
+        self.assertIsNone(report['connections'][0])
+
+    def test_command_reports_steps_without_importing_stripe(self):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='website.settings')
+        env.setdefault('SECRET_KEY', 'warmup')
+        result = subprocess.run(
+            [sys.executable, 'manage.py', 'warmup'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        self.assertRegex(result.stdout, r'templates\s+26 ')
+        out = io.StringIO()
+        with patch.object(warmup, 'preload_stripe', return_value=1) as preload:
+            call_command('warmup', '--stripe', stdout=out)
+        preload.assert_called_once()
+        self.assertIn('stripe', out.getvalue())
+
+
+class StaticAssetTests(TestCase):
+    """collectstatic with the production storage, then the precompressed serving view."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root)
+        # Stand-ins for the files `manage.py vendor_assets` downloads
+        cls.vendor_dir = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.vendor_dir)
+        for path, _, _ in assets.VENDORED.values():
+            os.makedirs(os.path.dirname(os.path.join(cls.vendor_dir, path)), exist_ok=True)
+            with open(os.path.join(cls.vendor_dir, path), 'w') as f:
+                f.write(f'/* {path} */\n')
+        cls.enterClassContext(override_settings(
+            STATIC_ROOT=cls.static_root,
+            STATICFILES_DIRS=[cls.vendor_dir],
+            STORAGES=dict(settings.STORAGES, staticfiles={'BACKEND': 'accounts.storage.CompressedManifestStaticFilesStorage'}),
+        ))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        cls.hashed_css = staticfiles_storage.stored_name('admin/css/base.css')
+
+    def test_collectstatic_writes_fingerprinted_gzip_variants(self):
+        import gzip
+        self.assertNotEqual(self.hashed_css, 'admin/css/base.css')
+        original = os.path.join(self.static_root, self.hashed_css)
+        with open(original, 'rb') as f, open(original + '.gz', 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), f.read())
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'staticfiles.json.gz')))
+
+    def test_serves_gzip_variant_with_immutable_headers(self):
+        response = self.client.get(f'/static/{self.hashed_css}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_serves_identity_when_gzip_not_accepted(self):
+        response = self.client.get(f'/static/{self.hashed_css}', HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        unhashed = self.client.get('/static/admin/css/base.css')
+        self.assertEqual(unhashed.status_code, 200)
+        self.assertNotIn('immutable', unhashed['Cache-Control'])
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/static/staticfiles.json').status_code, 404)
+
+    def test_vendored_assets_are_served_from_static(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        assets.source.cache_clear()
+        self.addCleanup(assets.source.cache_clear)
+        self.assertEqual(assets.url('htmx.js'), f"/static/{staticfiles_storage.stored_name('vendor/htmx/htmx.min.js')}")
+        self.assertEqual(assets.script('htmx.js'), f'<script src="{assets.url("htmx.js")}"></script>')
+
+    def test_missing_vendored_asset_loads_from_the_cdn_with_its_integrity(self):
+        htmx, upstream, sri = assets.VENDORED['htmx.js']
+        assets.source.cache_clear()
+        self.addCleanup(assets.source.cache_clear)
+        cache.clear()
+        with patch('accounts.assets.finders.find', side_effect=lambda path: None if path == htmx else path):
+            self.assertEqual([warning.id for warning in checks.check_vendored_assets(None)], ['accounts.W001'])
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, f'<script src="{upstream}" integrity="{sri}" crossorigin="anonymous"></script>')
+        self.assertContains(response, '/static/vendor/bootstrap/bootstrap.min')
+        # collectstatic still runs; the page falls back to the CDN copy
+        os.rename(os.path.join(self.vendor_dir, htmx), os.path.join(self.vendor_dir, htmx + '.away'))
+        self.addCleanup(os.rename, os.path.join(self.vendor_dir, htmx + '.away'), os.path.join(self.vendor_dir, htmx))
+        with tempfile.TemporaryDirectory() as static_root, self.settings(STATIC_ROOT=static_root):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            self.assertTrue(os.path.exists(os.path.join(static_root, 'staticfiles.json')))
+
+    def test_vendor_assets_rejects_a_download_that_does_not_match_its_integrity(self):
+        target = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, target)
+        download = MagicMock()
+        download.__enter__.return_value.read.return_value = b'/* tampered */'
+        with patch('accounts.management.commands.vendor_assets.apps.get_app_config', return_value=MagicMock(path=target)), \
+                patch('accounts.management.commands.vendor_assets.urllib.request.urlopen', return_value=download), \
+                self.assertRaisesMessage(CommandError, 'does not match its recorded integrity'):
+            call_command('vendor_assets', stdout=io.StringIO())
+        self.assertFalse(os.path.exists(os.path.join(target, 'static', assets.VENDORED['bootstrap.css'][0])))
+
+
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    async def _slow_fetch(self, release, value='sub'):
+        self.calls += 1
+        await release.wait()
+        return value
+
+    def test_concurrent_calls_share_one_fetch(self):
+        async def scenario():
+            release = asyncio.Event()
+            tasks = [asyncio.create_task(singleflight.do('k', lambda: self._slow_fetch(release), False)) for _ in range(5)]
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(*tasks)
+
+        results = asyncio.run(scenario())
+        self.assertEqual(results, ['sub'] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(singleflight._in_flight, {})
+
+    def test_exception_reaches_every_waiter_and_is_not_remembered(self):
+        async def failing():
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            raise stripe.error.APIConnectionError('down')
+
+        async def scenario():
+            return await asyncio.gather(*(singleflight.do('k', failing, False) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(r, stripe.error.APIConnectionError) for r in results))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(asyncio.run(singleflight.do('k', lambda: self._fetch_now('fresh'), False)), 'fresh')
+
+    async def _fetch_now(self, value):
+        self.calls += 1
+        return value
+
+    def test_waiters_in_other_threads_and_loops_share_the_call(self):
+        started, release = threading.Event(), threading.Event()
+
+        async def blocking_fetch():
+            self.calls += 1
+            started.set()
+            await asyncio.to_thread(release.wait, 5)
+            return 'shared'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(asyncio.run(singleflight.do('k', blocking_fetch, False))))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(asyncio.run(singleflight.do('k', blocking_fetch, False))))
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+        self.assertEqual(results, ['shared', 'shared'])
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(SINGLE_FLIGHT_WAIT=2)
+    def test_waits_for_result_published_by_another_process(self):
+        cache.set('singleflight:lock:k', 'other-process')
+
+        async def scenario():
+            asyncio.get_running_loop().call_later(0.1, cache.set, 'singleflight:result:other-process', 'from cache')
+            return await singleflight.do('k', lambda: self._fetch_now('local'), True)
+
+        self.assertEqual(asyncio.run(scenario()), 'from cache')
+        self.assertEqual(self.calls, 0)
+        # Once the other process has released the lock, a new caller leads its own flight
+        cache.delete('singleflight:lock:k')
+        self.assertEqual(asyncio.run(singleflight.do('k', lambda: self._fetch_now('local'), True)), 'local')
+        self.assertFalse(cache.has_key('singleflight:lock:k'))
+
+    @override_settings(SINGLE_FLIGHT_WAIT=2)
+    def test_fetches_itself_when_other_process_gives_up(self):
+        cache.set('singleflight:lock:k', 'other-process')
+
+        async def scenario():
+            asyncio.get_running_loop().call_later(0.1, cache.delete, 'singleflight:lock:k')
+            return await singleflight.do('k', lambda: self._fetch_now('local'), True)
+
+        self.assertEqual(asyncio.run(scenario()), 'local')
+        self.assertEqual(self.calls, 1)
+
+    @patch('accounts.views.stripe')
+    def test_subscription_details_reads_through_single_flight(self, mock_stripe):
+        user = User.objects.create_user(username='flightuser', password='flightpass123')
+        user.profile.stripe_customer_id = 'cus_flight'
+        user.profile.stripe_subscription_id = 'sub_flight'
+        user.profile.save()
+        subscription = stripe.Subscription.construct_from({'id': 'sub_flight', 'status': 'canceled', 'items': {'object': 'list', 'data': []}}, 'sk_test')
+        mock_stripe.Subscription.OBJECT_NAME, mock_stripe.Customer.OBJECT_NAME = 'subscription', 'customer'
+        mock_stripe.Subscription.retrieve_async = AsyncMock(return_value=subscription)
+        mock_stripe.Customer.retrieve_async = AsyncMock(return_value=stripe.Customer.construct_from({'id': 'cus_flight'}, 'sk_test'))
+        self.client.force_login(user)
+        with patch.object(singleflight, 'do', wraps=singleflight.do) as do:
+            self.client.get(reverse('subscription_details'))
+        keys = [call.args[0] for call in do.call_args_list]
+        self.assertEqual(len(keys), 2)
+        self.assertTrue(keys[0].endswith(':sub_flight') and keys[1].endswith(':cus_flight'))
+
+
+class CircuitBreakerTests(TestCase):
+    OPTIONS = dict(window_seconds=30, min_calls=4, failure_ratio=0.5, slow_call_seconds=1.0, slow_ratio=1.0, open_seconds=60, call_timeout=1.0)
+
+    def setUp(self):
+        cache.clear()
+        stripe_breaker.reset()
+        self.addCleanup(stripe_breaker.reset)
+
+    def _breaker(self, **options):
+        return CircuitBreaker('test', **dict(self.OPTIONS, **options))
+
+    def _call(self, breaker, fetch):
+        return asyncio.run(breaker.call(fetch))
+
+    def test_opens_after_failure_ratio_and_fails_fast(self):
+        breaker = self._breaker()
+        fetch = AsyncMock(side_effect=stripe.error.APIConnectionError('down'))
+        for _ in range(4):
+            with self.assertRaises(stripe.error.APIConnectionError):
+                self._call(breaker, fetch)
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            self._call(breaker, fetch)
+        self.assertEqual(fetch.await_count, 4)
+
+    def test_slow_calls_and_timeouts_count_but_client_errors_do_not(self):
+        breaker = self._breaker()
+        for _ in range(4):
+            with self.assertRaises(stripe.error.InvalidRequestError):
+                self._call(breaker, AsyncMock(side_effect=stripe.error.InvalidRequestError('No such subscription', 'id')))
+        self.assertEqual(breaker.state, 'closed')
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return 'late'
+
+        slow_breaker = self._breaker(slow_call_seconds=0.01)
+        for _ in range(4):
+            self.assertEqual(self._call(slow_breaker, slow), 'late')
+        self.assertEqual(slow_breaker.state, 'open')
+
+        timeout_breaker = self._breaker(call_timeout=0.01, min_calls=1)
+        with self.assertRaises(TimeoutError):
+            self._call(timeout_breaker, slow)
+        self.assertEqual(timeout_breaker.state, 'open')
+
+    def test_background_probe_closes_or_reopens_the_circuit(self):
+        breaker = self._breaker(open_seconds=0, min_calls=1)
+        with self.assertRaises(stripe.error.APIError):
+            self._call(breaker, AsyncMock(side_effect=stripe.error.APIError('500')))
+        with self.assertRaises(CircuitOpenError):
+            self._call(breaker, AsyncMock(side_effect=stripe.error.APIError('500')))
+        breaker._probe_thread.join(5)
+        self.assertEqual(breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError):
+            self._call(breaker, AsyncMock(return_value='ok'))
+        breaker._probe_thread.join(5)
+        self.assertEqual(breaker.state, 'closed')
+        self.assertEqual(self._call(breaker, AsyncMock(return_value='ok')), 'ok')
+
+    def test_open_circuit_serves_last_good_copy_marked_stale(self):
+        subscription = stripe.Subscription.construct_from({'id': 'sub_1', 'status': 'active'}, 'sk_test')
+        resource = SimpleNamespace(OBJECT_NAME='subscription', retrieve_async=AsyncMock(return_value=subscription), construct_from=stripe.Subscription.construct_from)
+        fresh = asyncio.run(stripe_reads.retrieve(resource, 'sub_1'))
+        self.assertFalse(stripe_reads.is_stale(fresh))
+        # The last good copy is plain data: no API key goes into the cache
+        self.assertEqual(cache.get(f'{stripe_reads.STALE_CACHE_PREFIX}:stripe:subscription:sub_1'), {'id': 'sub_1', 'status': 'active'})
+        stripe_breaker.state, stripe_breaker.opened_at = 'open', time.monotonic()
+        stale = asyncio.run(stripe_reads.retrieve(resource, 'sub_1'))
+        self.assertTrue(stripe_reads.is_stale(stale))
+        self.assertIsInstance(stale, stripe.Subscription)
+        self.assertEqual(stale.status, 'active')
+        self.assertIsNone(stale.api_key)
+        self.assertFalse(stripe_reads.is_stale(fresh))
+        self.assertEqual(resource.retrieve_async.await_count, 1)
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(stripe_reads.retrieve(resource, 'sub_unknown'))
+
+    @patch('accounts.views.stripe')
+    def test_profile_shows_stale_billing_details_while_stripe_is_down(self, mock_stripe):
+        user = User.objects.create_user(username='staleuser', password='stalepass123')
+        user.profile.stripe_subscription_id = 'sub_stale'
+        user.profile.save()
+        subscription = stripe.Subscription.construct_from({'id': 'sub_stale', 'items': {'object': 'list', 'data': [{'price': {'id': 'price_1', 'product': 'prod_1'}}]}}, 'sk_test')
+        mock_stripe.Subscription = SimpleNamespace(OBJECT_NAME='subscription', retrieve_async=AsyncMock(return_value=subscription), construct_from=stripe.Subscription.construct_from)
+        mock_stripe.Product = SimpleNamespace(OBJECT_NAME='product', retrieve_async=AsyncMock(return_value=stripe.Product.construct_from({'id': 'prod_1', 'name': 'Gold'}, 'sk_test')), construct_from=stripe.Product.construct_from)
+        self.client.force_login(user)
+        self.assertNotContains(self.client.get(reverse('profile')), 'last known values')
+        mock_stripe.Subscription.retrieve_async.side_effect = stripe.error.APIConnectionError('down')
+        response = self.client.get(reverse('profile'))
+        self.assertContains(response, 'last known values')
+        self.assertContains(response, 'Gold')
+
+
+TASK_CALLS = []
+
+
+@taskqueue.task(max_attempts=2)
+def record_task_call(value, fail=False):
+    TASK_CALLS.append(value)
+    if fail:
+        raise RuntimeError('task failed')
+
+
+@taskqueue.task(max_attempts=2)
+def long_task_call(value, beat=False):
+    # Runs past TASK_STALE_AFTER, optionally sending a heartbeat on the way
+    Task.objects.filter(status=Task.RUNNING).update(
+        started_at=timezone.now() - timedelta(seconds=settings.TASK_STALE_AFTER + 1),
+        heartbeat_at=timezone.now() - timedelta(seconds=settings.TASK_STALE_AFTER + 1),
+    )
+    if beat:
+        taskqueue.heartbeat()
+    TASK_CALLS.append((value, taskqueue.requeue_stale()))
+    if not beat:
+        TASK_CALLS.append(taskqueue.claim('worker-2').worker)
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        TASK_CALLS.clear()
+        metrics.registry.reset()
+
+    def test_enqueued_task_runs_once_and_is_timed(self):
+        queued = taskqueue.enqueue(record_task_call, 'a')
+        self.assertEqual((queued.name, queued.args, queued.max_attempts), ('accounts.tests.record_task_call', ['a'], 2))
+        self.assertEqual(taskqueue.run_pending(), (1, 0))
+        self.assertEqual(taskqueue.run_pending(), (0, 0))
+        self.assertEqual(TASK_CALLS, ['a'])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.SUCCEEDED, 1))
+        self.assertIsNotNone(queued.duration)
+        self.assertEqual(metrics.registry.snapshot()['task:accounts.tests.record_task_call']['request_seconds'][2], 1)
+
+    def test_failed_task_is_retried_with_backoff_then_marked_failed(self):
+        queued = taskqueue.enqueue(record_task_call, 'b', fail=True)
+        self.assertEqual(taskqueue.run_pending(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.QUEUED, 1))
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=settings.TASK_RETRY_BACKOFF * 0.7))
+        self.assertIn('task failed', queued.last_error)
+        # Not due yet
+        self.assertEqual(taskqueue.run_pending(), (0, 0))
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.assertEqual(taskqueue.run_pending(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+        self.assertEqual(TASK_CALLS, ['b', 'b'])
+
+    def test_claim_hands_each_task_to_one_worker(self):
+        taskqueue.enqueue(record_task_call, 'c')
+        taskqueue.enqueue(record_task_call, 'later', delay=60)
+        claimed = taskqueue.claim('worker-1')
+        self.assertEqual((claimed.status, claimed.worker, claimed.args), (Task.RUNNING, 'worker-1', ['c']))
+        self.assertIsNone(taskqueue.claim('worker-2'))
+        Task.objects.filter(pk=claimed.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=settings.TASK_STALE_AFTER + 1))
+        self.assertEqual(taskqueue.requeue_stale(), 1)
+        self.assertEqual(taskqueue.claim('worker-2').pk, claimed.pk)
+
+    @override_settings(TASK_HEARTBEAT_INTERVAL=0)
+    def test_heartbeat_keeps_a_long_task_from_being_requeued(self):
+        queued = taskqueue.enqueue(long_task_call, 'e', beat=True)
+        self.assertEqual(taskqueue.run_pending(), (1, 0))
+        self.assertEqual(TASK_CALLS, [('e', 0)])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.SUCCEEDED, 1))
+
+    def test_task_requeued_while_running_keeps_the_new_claim(self):
+        queued = taskqueue.enqueue(long_task_call, 'f')
+        with self.assertLogs('accounts.taskqueue', 'WARNING'):
+            taskqueue.run(taskqueue.claim('worker-1'))
+        self.assertEqual(TASK_CALLS, [('f', 1), 'worker-2'])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.worker, queued.attempts, queued.finished_at), (Task.RUNNING, 'worker-2', 2, None))
+
+    def test_views_queue_email_and_deletion_work(self):
+        self.client.post(reverse('register'), {
+            'username': 'queued', 'email': 'queued@example.com',
+            'password1': 'Queued-pass-123', 'password2': 'Queued-pass-123',
+        })
+        self.assertEqual(list(Task.objects.values_list('name', flat=True)), ['accounts.tasks.send_confirmation_email'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(taskqueue.run_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/confirm-email/', mail.outbox[0].body)
+
+        user = User.objects.get(username='queued')
+        self.client.force_login(user)
+        with patch('accounts.deletion.stripe'):
+            self.client.post(reverse('delete_user'), {'email': 'queued@example.com'})
+            self.assertTrue(Task.objects.filter(name='accounts.tasks.process_account_deletion', status=Task.QUEUED).exists())
+            self.assertEqual(taskqueue.run_pending(), (1, 0))
+        self.assertFalse(User.objects.filter(username='queued').exists())
+
+    def test_runworker_once_reports_results(self):
+        taskqueue.enqueue(record_task_call, 'd')
+        out = io.StringIO()
+        call_command('runworker', '--once', stdout=out)
+        self.assertIn('1 tasks succeeded, 0 failed.', out.getvalue())
+
+    def test_terminated_runworker_stops_its_worker_processes(self):
+        self.addCleanup(signal.signal, signal.SIGTERM, signal.getsignal(signal.SIGTERM))
+        processes = [MagicMock(**{'is_alive.return_value': True}) for _ in range(2)]
+        threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM)).start()
+        runworker._supervise(processes)
+        for process in processes:
+            process.terminate.assert_called_once_with()
+            process.join.assert_called_once_with()
+
+
+class MaintenanceSchedulerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cron_specs(self):
+        from datetime import datetime
+        every_quarter = scheduler.CronSpec('*/15 * * * *')
+        self.assertTrue(every_quarter.matches(datetime(2026, 10, 19, 10, 30)))
+        self.assertFalse(every_quarter.matches(datetime(2026, 10, 19, 10, 31)))
+        weekday_mornings = scheduler.CronSpec('30 3 * * 1-5')
+        self.assertTrue(weekday_mornings.matches(datetime(2026, 10, 19, 3, 30)))  # Monday
+        self.assertFalse(weekday_mornings.matches(datetime(2026, 10, 18, 3, 30)))  # Sunday
+        first_or_sunday = scheduler.CronSpec('0 0 1 * 7')
+        self.assertTrue(first_or_sunday.matches(datetime(2026, 10, 18, 0, 0)))
+        self.assertTrue(first_or_sunday.matches(datetime(2026, 10, 1, 0, 0)))
+        self.assertFalse(first_or_sunday.matches(datetime(2026, 10, 19, 0, 0)))
+        for bad in ('* * * *', '60 * * * *', '*/0 * * * *', 'a * * * *'):
+            with self.assertRaises(ValueError):
+                scheduler.CronSpec(bad)
+        for name, job in settings.MAINTENANCE_SCHEDULE.items():
+            scheduler.CronSpec(job['cron'])
+
+    def test_abandoned_2fa_secrets_are_cleared_in_batches(self):
+        old = timezone.now() - timedelta(days=2)
+        for username, enabled, created_at in (('abandoned', False, old), ('legacy', False, None), ('pending', False, timezone.now()), ('enabled', True, old)):
+            user = User.objects.create_user(username=username, password='twofactorpass123')
+            Profile.objects.filter(user=user).update(two_factor_enabled=enabled, two_factor_secret='JBSWY3DPEHPK3PXP', two_factor_secret_created_at=created_at)
+        self.assertEqual(maintenance.clear_abandoned_2fa_secrets(max_age_hours=24, batch_size=1), 2)
+        remaining = set(Profile.objects.filter(two_factor_secret__isnull=False).values_list('user__username', flat=True))
+        self.assertEqual(remaining, {'pending', 'enabled'})
+
+    def test_enable_2fa_records_when_the_secret_was_issued(self):
+        user = User.objects.create_user(username='issuer', email='issuer@example.com', password='issuerpass123')
+        self.client.force_login(user)
+        self.client.get(reverse('enable_2fa'))
+        user.profile.refresh_from_db()
+        self.assertIsNotNone(user.profile.two_factor_secret_created_at)
+
+    def test_old_events_are_purged_only_once_rolled_up(self):
+        old = timezone.now() - timedelta(days=settings.SUBSCRIPTION_EVENT_RETENTION_DAYS + 1)
+        SubscriptionEvent.objects.bulk_create([
+            SubscriptionEvent(event_id=f'evt_old_{i}', event_type='invoice.paid', created=old, data={}) for i in range(3)
+        ] + [SubscriptionEvent(event_id='evt_new', event_type='invoice.paid', created=timezone.now(), data={})])
+        self.assertEqual(maintenance.purge_old_events(), 0)
+        rollups.update()
+        SubscriptionEvent.objects.create(event_id='evt_old_late', event_type='invoice.paid', created=old, data={})
+        self.assertEqual(maintenance.purge_old_events(batch_size=2), 3)
+        self.assertEqual(set(SubscriptionEvent.objects.values_list('event_id', flat=True)), {'evt_new', 'evt_old_late'})
+
+    def test_rebuild_keeps_the_rollups_of_purged_days(self):
+        old = timezone.now() - timedelta(days=settings.SUBSCRIPTION_EVENT_RETENTION_DAYS + 1)
+        SubscriptionEvent.objects.create(event_id='evt_old_paid', event_type='invoice.paid', created=old, data={'object': {'amount_paid': 700, 'currency': 'usd'}})
+        SubscriptionEvent.objects.create(event_id='evt_new_paid', event_type='invoice.paid', created=timezone.now(), data={'object': {'amount_paid': 300, 'currency': 'usd'}})
+        rollups.update()
+        self.assertEqual(maintenance.purge_old_events(), 1)
+        DailyEventRollup.objects.filter(day=timezone.now().date()).update(revenue=0)
+        call_command('update_rollups', rebuild=True, stdout=io.StringIO())
+        self.assertEqual(DailyEventRollup.objects.get(day=old.date()).revenue, 700)
+        self.assertEqual(DailyEventRollup.objects.get(day=timezone.now().date()).revenue, 300)
+
+    def test_due_jobs_run_once_per_minute_and_are_reported(self):
+        from datetime import datetime
+        Session.objects.create(session_key='expired', session_data='', expire_date=timezone.now() - timedelta(days=1))
+        schedule = {
+            'purge_sessions': {'cron': scheduler.CronSpec('*/15 * * * *'), 'call': 'accounts.maintenance.purge_sessions'},
+            'update_rollups': {'cron': scheduler.CronSpec('0 * * * *'), 'command': 'update_rollups'},
+            'nightly': {'cron': scheduler.CronSpec('0 3 * * *'), 'call': 'accounts.maintenance.purge_old_events'},
+        }
+        moment = datetime(2026, 10, 19, 10, 0)
+        report = scheduler.run_due(moment, schedule)
+        self.assertEqual([(name, result) for name, result, _ in report], [('purge_sessions', 1), ('update_rollups', 'Rolled up 0 subscription events.')])
+        self.assertEqual(scheduler.run_due(moment, schedule), [])
+        self.assertEqual(len(scheduler.minutes_between(datetime(2026, 10, 19, 9, 58, 30), moment)), 2)
+
+    def test_command_runs_named_jobs(self):
+        out = io.StringIO()
+        call_command('run_scheduler', '--run', 'purge_sessions', '--run', 'clear_abandoned_2fa_secrets', stdout=out)
+        self.assertIn('purge_sessions: 0 (', out.getvalue())
+        self.assertIn('clear_abandoned_2fa_secrets: 0 (', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('run_scheduler', '--run', 'nope')
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        # The flush after each test removed the rows the cache points at
+        event_types.invalidate()
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='readerpass123')
+        Profile.objects.filter(user=self.user).update(stripe_customer_id='cus_reader')
+        SubscriptionEvent.objects.create(event_id='evt_primary', event_type='invoice.paid', created=timezone.now(), data={}, customer_id='cus_reader')
+        # Only the replica has this row, so reading it proves where a query went
+        replica_type, _ = EventType.objects.using('replica').get_or_create(code='invoice.paid', defaults={'name': 'Invoice Paid'})
+        SubscriptionEvent.objects.using('replica').create(event_id='evt_replica', type=replica_type, created=timezone.now(), data={}, customer_id='cus_reader')
+        cache.clear()
+
+    def test_history_reads_use_the_replica_outside_transactions(self):
+        self.assertEqual(list(SubscriptionEvent.objects.values_list('event_id', flat=True)), ['evt_replica'])
+        self.assertEqual(Membership.objects.all().db, 'replica')
+        self.assertEqual(Profile.objects.all().db, 'default')
+        with transaction.atomic():
+            self.assertEqual(list(SubscriptionEvent.objects.values_list('event_id', flat=True)), ['evt_primary'])
+
+    def test_write_in_a_request_keeps_the_rest_of_it_on_the_primary(self):
+        tokens = routers.start_request(SimpleNamespace(session={}))
+        try:
+            self.assertEqual(SubscriptionEvent.objects.get().event_id, 'evt_replica')
+            Membership.objects.create(name='Gold', stripe_price_id='price_gold')
+            self.assertEqual(SubscriptionEvent.objects.get().event_id, 'evt_primary')
+        finally:
+            routers.finish_request(tokens)
+        self.assertEqual(SubscriptionEvent.objects.get().event_id, 'evt_replica')
+
+    def test_user_is_pinned_to_the_primary_after_their_profile_changes(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('subscription_details'))
+        self.assertEqual([e.event_id for e in response.context['subscription_events']], ['evt_replica'])
+        profile = Profile.objects.get(user=self.user)
+        profile.subscription_status = 'canceled'
+        profile.save()
+        response = self.client.get(reverse('subscription_details'))
+        self.assertEqual([e.event_id for e in response.context['subscription_events']], ['evt_primary'])
+
+
+class EventPartitionTests(TestCase):
+    def test_monthly_partition_names_and_bounds(self):
+        from datetime import date, datetime, timezone as dt_timezone
+        self.assertEqual(partitions.month_start(datetime(2026, 1, 31, 23, 30, tzinfo=dt_timezone(timedelta(hours=-2)))), date(2026, 2, 1))
+        self.assertEqual(partitions.add_months(date(2026, 11, 1), 3), date(2027, 2, 1))
+        self.assertEqual(list(partitions.months_between(date(2026, 11, 15), date(2027, 1, 2))), [date(2026, 11, 1), date(2026, 12, 1), date(2027, 1, 1)])
+        name = partitions.partition_name(date(2026, 12, 1))
+        self.assertEqual(name, 'accounts_subscriptionevent_p2026_12')
+        self.assertEqual(partitions.partition_month(name), date(2026, 12, 1))
+        self.assertIsNone(partitions.partition_month(partitions.DEFAULT_PARTITION))
+        self.assertIn("FROM ('2026-12-01T00:00:00+00:00') TO ('2027-01-01T00:00:00+00:00')", partitions.create_partition_sql(date(2026, 12, 1)))
+
+    def test_only_partitions_wholly_before_the_cutoff_are_droppable(self):
+        from datetime import date, datetime, timezone as dt_timezone
+        existing = [(date(2024, month, 1), partitions.partition_name(date(2024, month, 1))) for month in (8, 9, 10)]
+        cutoff = datetime(2024, 10, 1, tzinfo=dt_timezone.utc)
+        self.assertEqual([month for month, _ in partitions.droppable(existing, cutoff)], [date(2024, 8, 1), date(2024, 9, 1)])
+        self.assertEqual(partitions.droppable(existing, cutoff - timedelta(seconds=1)), existing[:1])
+
+    def test_sqlite_keeps_one_table_and_purges_rows(self):
+        self.assertFalse(partitions.is_partitioned())
+        self.assertEqual(partitions.ensure_partitions(), 0)
+        self.assertEqual(partitions.drop_partitions_before(timezone.now()), 0)
+        self.assertIn('ensure_event_partitions', scheduler.get_schedule())
+
+    def test_event_log_query_uses_the_customer_created_index(self):
+        events = SubscriptionEvent.objects.filter(customer_id='cus_indexed').order_by('-created')[:20]
+        self.assertIn('accounts_se_customer_created', events.explain())
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_event_id_is_unique_with_its_created_time(self):
+        event = fake_stripe.webhook_event('invoice.paid', fake_stripe.full_invoice_object(), event_id='evt_redelivered')
+        for _ in range(2):
+            payload, signature = fake_stripe.signed_webhook(event, 'whsec_test')
+            response = self.client.post(reverse('stripe_webhook'), data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+            self.assertEqual(response.status_code, 200)
+        stored = SubscriptionEvent.objects.get(event_id='evt_redelivered')
+        # What a concurrent delivery that missed the row runs into
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            SubscriptionEvent.objects.create(event_id='evt_redelivered', event_type='invoice.paid', created=stored.created, data={})
+
+
+class EventTypeTests(TestCase):
+    def setUp(self):
+        # Types created here are rolled back after the test; do not leave them cached
+        self.addCleanup(event_types.invalidate)
+        self.user = User.objects.create_user(username='typed', email='typed@example.com', password='typedpass123')
+        Profile.objects.filter(user=self.user).update(stripe_customer_id='cus_typed')
+        for i, event_type in enumerate(['invoice.paid', 'customer.subscription.created', 'invoice.paid', 'customer.subscription.paused']):
+            SubscriptionEvent.objects.create(event_id=f'evt_typed_{i}', event_type=event_type, created=timezone.now() - timedelta(minutes=i), data={}, customer_id='cus_typed')
+
+    def test_types_are_stored_once_with_their_friendly_names(self):
+        self.assertEqual(EventType.objects.filter(code='invoice.paid').count(), 1)
+        self.assertEqual(SubscriptionEvent.objects.filter(type__code='invoice.paid').count(), 2)
+        self.assertEqual(EventType.objects.get(code='invoice.paid').name, 'Invoice Paid')
+        self.assertEqual(EventType.objects.get(code='customer.subscription.paused').name, 'customer.subscription.paused')
+        self.assertEqual(SubscriptionEvent.objects.get(event_id='evt_typed_1').event_type, 'customer.subscription.created')
+
+    def test_known_types_are_looked_up_in_memory(self):
+        event_types.warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(event_types.get('invoice.paid').name, 'Invoice Paid')
+        with self.captureOnCommitCallbacks(execute=True):
+            # Select, then an insert in its own savepoint
+            with self.assertNumQueries(4):
+                created = event_types.get('customer.subscription.resumed')
+        with self.assertNumQueries(0):
+            self.assertEqual(event_types.get('customer.subscription.resumed'), created)
+            self.assertEqual(event_filters.event_friendly_name('customer.subscription.resumed'), 'customer.subscription.resumed')
+
+    def test_rolled_back_types_are_not_cached(self):
+        event_types.warm()
+        with transaction.atomic():
+            event_types.get('customer.subscription.trial_will_end')
+            transaction.set_rollback(True)
+        with self.assertNumQueries(4):
+            event_types.get('customer.subscription.trial_will_end')
+
+    def test_event_log_page_reads_types_in_the_same_query(self):
+        with self.assertNumQueries(1):
+            events, _ = views._subscription_event_batch('cus_typed')
+            names = [event_filters.event_friendly_name_with_cancel_check(event) for event in events]
+        self.assertEqual(names, ['Invoice Paid', 'Subscription Created', 'Invoice Paid', 'customer.subscription.paused'])
+
+    def test_event_log_filters_by_type(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('subscription_details'), {'type': 'invoice.paid'})
+        self.assertEqual([e.event_id for e in response.context['subscription_events']], ['evt_typed_0', 'evt_typed_2'])
+        events = SubscriptionEvent.objects.filter(customer_id='cus_typed', type=EventType.objects.get(code='invoice.paid')).order_by('-created')
+        self.assertIn('accounts_se_customer_type', events.explain())
+
+
+class EventTypeMigrationTests(TransactionTestCase):
+    """The switch to EventType over existing rows, forwards and back."""
+    BEFORE = '0013_subscriptionevent_partitions'
+    AFTER = '0016_subscriptionevent_type_required'
+
+    def _migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('accounts', target)])
+        return executor.loader.project_state([('accounts', target)]).apps
+
+    def test_existing_events_are_moved_to_event_types_and_back(self):
+        leaf = MigrationExecutor(connection).loader.graph.leaf_nodes('accounts')[0][1]
+        self.addCleanup(event_types.invalidate)
+        self.addCleanup(self._migrate, leaf)
+        old_apps = self._migrate(self.BEFORE)
+        OldEvent = old_apps.get_model('accounts', 'SubscriptionEvent')
+        OldEvent.objects.bulk_create(
+            OldEvent(event_id=f'evt_migrated_{i}', event_type=code, created=timezone.now(), data={}, customer_id='cus_migrated')
+            for i, code in enumerate(['invoice.paid', 'customer.subscription.paused', 'invoice.paid'])
+        )
+        new_apps = self._migrate(self.AFTER)
+        Event = new_apps.get_model('accounts', 'SubscriptionEvent')
+        self.assertEqual(
+            list(Event.objects.using('default').order_by('event_id').values_list('event_id', 'type__code', 'type__name')),
+            [
+                ('evt_migrated_0', 'invoice.paid', 'Invoice Paid'),
+                ('evt_migrated_1', 'customer.subscription.paused', 'customer.subscription.paused'),
+                ('evt_migrated_2', 'invoice.paid', 'Invoice Paid'),
+            ],
+        )
+        old_apps = self._migrate(self.BEFORE)
+        OldEvent = old_apps.get_model('accounts', 'SubscriptionEvent')
+        self.assertEqual(
+            list(OldEvent.objects.using('default').order_by('event_id').values_list('event_type', flat=True)),
+            ['invoice.paid', 'customer.subscription.paused', 'invoice.paid'],
+        )
+
+
+class JSONCodecTests(TestCase):
+    def test_codec_setting(self):
+        with self.settings(JSON_CODEC='json'):
+            self.assertEqual(jsoncodec.codec_name(), 'json')
+        with self.settings(JSON_CODEC='auto'):
+            self.assertEqual(jsoncodec.codec_name(), 'orjson' if jsoncodec.orjson else 'json')
+        with self.settings(JSON_CODEC='yaml'), self.assertRaises(ImproperlyConfigured):
+            jsoncodec.codec_name()
+
+    def test_json_fields_round_trip_with_either_codec(self):
+        payload = {'object': fake_stripe.full_invoice_object(lines=2), 'huge': 2 ** 70, 'text': 'café'}
+        for codec in ('json', 'auto'):
+            with self.settings(JSON_CODEC=codec):
+                event = SubscriptionEvent.objects.create(event_id=f'evt_codec_{codec}', event_type='invoice.paid', created=timezone.now(), data=payload)
+                event.refresh_from_db()
+                self.assertEqual(event.data, payload)
+                self.assertEqual(jsoncodec.loads(jsoncodec.dumps(payload)), payload)
+        self.assertEqual(json.dumps({'b': 1, 'a': [1]}, cls=jsoncodec.JSONEncoder, indent=2), json.dumps({'b': 1, 'a': [1]}, indent=2))
+        with self.assertRaises(ValueError):
+            jsoncodec.loads('{not json')
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_webhook_verifies_the_signature_before_parsing(self):
+        event = fake_stripe.webhook_event('invoice.paid', fake_stripe.full_invoice_object(), event_id='evt_parsed')
+        payload, signature = fake_stripe.signed_webhook(event, 'whsec_test')
+        with patch('accounts.jsoncodec.loads', wraps=jsoncodec.loads) as loads:
+            response = self.client.post(reverse('stripe_webhook'), data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature.replace('v1=', 'v1=0'))
+            self.assertEqual(response.status_code, 400)
+            loads.assert_not_called()
+            response = self.client.post(reverse('stripe_webhook'), data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+            self.assertEqual(response.status_code, 200)
+            loads.assert_called_once()
+        self.assertEqual(SubscriptionEvent.objects.get(event_id='evt_parsed').data['object']['amount_paid'], 6000)
+
+    @override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+    def test_webhook_rejects_a_replayed_delivery(self):
+        event = fake_stripe.webhook_event('invoice.paid', fake_stripe.full_invoice_object(), event_id='evt_replayed')
+        payload, signature = fake_stripe.signed_webhook(event, 'whsec_test', timestamp=int(time.time()) - 30 * 86400)
+        response = self.client.post(reverse('stripe_webhook'), data=payload, content_type='application/json', HTTP_STRIPE_SIGNATURE=signature)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SubscriptionEvent.objects.filter(event_id='evt_replayed').exists())
+
+    def test_benchmark_command_reports_each_codec(self):
+        out = io.StringIO()
+        call_command('benchmark_json', '--rounds', '1', stdout=out)
+        self.assertIn('json    encode', out.getvalue())
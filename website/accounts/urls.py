@@ -11,6 +11,7 @@ urlpatterns = [
     path('cancel-subscription-immediately/', views.cancel_subscription_immediately, name='cancel_subscription_immediately'),
     path('reactivate-subscription/', views.reactivate_subscription, name='reactivate_subscription'),
     path('subscription-details/', views.subscription_details, name='subscription_details'),
+    path('export-events/', views.export_events, name='export_events'),
     path('delete-user/', views.delete_user, name='delete_user'),
     path('upload-profile-image/', views.upload_profile_image, name='upload_profile_image'),
     path('clear-profile-image/', views.clear_profile_image, name='clear_profile_image'),
@@ -18,6 +19,7 @@ urlpatterns = [
     path('username-update-htmx/', views.username_update_htmx, name='username_update_htmx'),
     path('bio-edit-htmx/', views.bio_edit_htmx, name='bio_edit_htmx'),
     path('bio-update-htmx/', views.bio_update_htmx, name='bio_update_htmx'),
+    path('event-log-htmx/', views.event_log_htmx, name='event_log_htmx'),
     path('resend-verification/', views.resend_verification_email, name='resend_verification_email'),
     path('enable-2fa/', views.enable_2fa, name='enable_2fa'),
     path('disable-2fa/', views.disable_2fa, name='disable_2fa'),
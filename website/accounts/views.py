@@ -3,36 +3,47 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.models import User
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode
+from django.utils.encoding import force_str
 from django.template.loader import render_to_string
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import send_mail
 from django.contrib.auth.tokens import default_token_generator
-from .models import Profile, Membership, SubscriptionEvent
-from django.http import HttpResponse
+from .models import Profile, Membership, EventType, SubscriptionEvent
+from django.http import HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
 import logging
 from .forms import CustomUserCreationForm, ProfileImageForm
 from django.conf import settings
-import stripe
+from .services.stripe_service import stripe
 from django.views.decorators.csrf import csrf_exempt
 from functools import wraps
 from django.views.decorators.http import require_POST
-import pyotp
-import qrcode
-import io
 import secrets
 import hashlib
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from datetime import timezone as dt_timezone
-from django.core.paginator import Paginator
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
 from django.urls import reverse
+from django.core.cache import cache
+from asgiref.sync import sync_to_async
+import asyncio
+from . import catalog
+from .catalog import SUBSCRIBE_PAGE_CACHE_KEY
+from .caching import cache_anonymous_page, patch_anonymous_cache_headers
+from . import metrics
+from . import deletion
+from . import taskqueue
+from . import tasks
+from . import exports
+from . import assets
+from .services import stripe_reads, stripe_service, two_factor
+from .services.circuit_breaker import CircuitOpenError
+from .budgets import budget
 
 logger = logging.getLogger(__name__)
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
 # Custom decorator for subscription-required pages
 def subscription_required(view_func):
@@ -55,6 +66,7 @@ def subscription_required(view_func):
     return _wrapped_view
 
 # Templates needed: accounts/register.html, accounts/profile.html, accounts/home.html, accounts/login.html, accounts/registration_pending.html
+@budget(5)
 def register(request):
     if request.method == 'POST':
         form = CustomUserCreationForm(request.POST)
@@ -63,27 +75,15 @@ def register(request):
             user.is_active = True  # User can log in, but we will check email_confirmed
             user.save()
             # profile = Profile.objects.create(user=user)
-            # Send confirmation email
-            current_site = get_current_site(request)
-            subject = 'Confirm your email'
-            token = default_token_generator.make_token(user)
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
-            confirm_url = f"http://{current_site.domain}/confirm-email/{uid}/{token}/"
-            message = render_to_string('accounts/confirm_email.html', {
-                'user': user,
-                'confirm_url': confirm_url,
-            })
-            try:
-                send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
-                logger.info(f"Confirmation email sent to {user.email}")
-            except Exception as e:
-                logger.error(f"Failed to send confirmation email to {user.email}: {e}")
+            # The confirmation email is sent by the task worker
+            taskqueue.enqueue(tasks.send_confirmation_email, user.pk, get_current_site(request).domain)
             return render(request, 'accounts/registration_pending.html', {'email': user.email})
     else:
         form = CustomUserCreationForm()
     return render(request, 'accounts/register.html', {'form': form})
 
 
+@budget(11)
 def custom_login(request):
     show_resend_verification = False
     username_attempt = None
@@ -124,37 +124,45 @@ def custom_login(request):
     return render(request, 'accounts/login.html', {'form': form, 'show_resend_verification': show_resend_verification, 'username_attempt': username_attempt})
 
 
+@budget(4, 2, max_ms=1000)
 @login_required
-def profile(request):
-    profile = request.user.profile
+async def profile(request):
+    user = await request.auser()
+    profile = await Profile.objects.select_related('user').aget(user=user)
     product_name = None
     current_period_end = None
     current_period_start = None
+    stripe_stale = False
     if profile.stripe_subscription_id:
         try:
-            subscription = stripe.Subscription.retrieve(profile.stripe_subscription_id)
+            subscription = await stripe_reads.retrieve(stripe.Subscription, profile.stripe_subscription_id)
             price = subscription['items']['data'][0]['price']
-            product = stripe.Product.retrieve(price['product'])
+            product = await stripe_reads.retrieve(stripe.Product, price['product'])
             product_name = product['name']
             item = subscription['items']['data'][0]
             current_period_end = item.get('current_period_end')
             current_period_start = item.get('current_period_start')
+            stripe_stale = stripe_reads.is_stale(subscription) or stripe_reads.is_stale(product)
         except Exception as e:
             product_name = None  # Optionally log the error
             current_period_end = None
             current_period_start = None
-    return render(request, 'accounts/profile.html', {
+    return await sync_to_async(render)(request, 'accounts/profile.html', {
         'profile': profile,
         'subscription_product_name': product_name,
         'current_period_end': current_period_end,
         'current_period_start': current_period_start,
+        'stripe_stale': stripe_stale,
     })
 
 
+@budget(2)
+@cache_anonymous_page()
 def home(request):
     return render(request, 'accounts/home.html')
 
 
+@budget(5)
 def confirm_email(request, uidb64, token):
     try:
         uid = force_str(urlsafe_base64_decode(uidb64))
@@ -164,44 +172,65 @@ def confirm_email(request, uidb64, token):
     if user is not None and default_token_generator.check_token(user, token):
         user.profile.email_confirmed = True
         user.profile.save()
+        if not user.profile.stripe_customer_id:
+            # Have the Stripe customer ready before the user reaches checkout
+            taskqueue.enqueue(tasks.create_stripe_customer, user.pk)
         return render(request, 'accounts/email_confirmed.html')
     else:
         return HttpResponse('Invalid confirmation link.')
 
-def subscribe(request):
-    memberships = Membership.objects.all()
+def _render_anonymous_subscribe(request):
+    return render_to_string("accounts/subscribe.html", {"memberships": catalog.get_memberships(), "stripe_pk": settings.STRIPE_PUBLISHABLE_KEY}, request=request)
+
+@budget(4, 1, max_ms=1000)
+async def subscribe(request):
+    user = await request.auser()
+    if not user.is_authenticated:
+        # The anonymous page is identical for every visitor, so serve it whole from the cache
+        content = await cache.aget(SUBSCRIBE_PAGE_CACHE_KEY)
+        if content is None:
+            content = await sync_to_async(_render_anonymous_subscribe)(request)
+            await cache.aset(SUBSCRIBE_PAGE_CACHE_KEY, content, settings.SUBSCRIBE_PAGE_CACHE_TIMEOUT)
+        return patch_anonymous_cache_headers(HttpResponse(content), settings.SUBSCRIBE_PAGE_CACHE_TIMEOUT)
+    memberships = await sync_to_async(catalog.get_memberships)()
     current_price_id = None
-    if request.user.is_authenticated and hasattr(request.user, 'profile') and request.user.profile.stripe_subscription_id and request.user.profile.subscription_status == 'active':
+    profile = await Profile.objects.filter(user=user).afirst()
+    if profile and profile.stripe_subscription_id and profile.subscription_status == 'active':
         try:
-            subscription = stripe.Subscription.retrieve(request.user.profile.stripe_subscription_id)
+            subscription = await stripe_reads.retrieve(stripe.Subscription, profile.stripe_subscription_id)
             if subscription['items']['data']:
                 current_price_id = subscription['items']['data'][0]['price']['id']
         except Exception:
             pass
-    return render(request, "accounts/subscribe.html", {"memberships": memberships, "stripe_pk": settings.STRIPE_PUBLISHABLE_KEY, "current_price_id": current_price_id})
+    return await sync_to_async(render)(request, "accounts/subscribe.html", {"memberships": memberships, "stripe_pk": settings.STRIPE_PUBLISHABLE_KEY, "current_price_id": current_price_id})
 
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 
-def create_checkout_session(request, membership_id):
-    if not request.user.is_authenticated:
+@budget(4, 2)
+async def create_checkout_session(request, membership_id):
+    user = await request.auser()
+    if not user.is_authenticated:
         return redirect('login')
     
-    membership = Membership.objects.get(id=membership_id)
+    membership = await Membership.objects.aget(id=membership_id)
+    profile = await Profile.objects.aget(user=user)
     
     # Get or create Stripe customer
-    if not request.user.profile.stripe_customer_id:
-        customer = stripe.Customer.create(
-            email=request.user.email,
-            name=request.user.username,
+    if not profile.stripe_customer_id:
+        # Usually done by the create_stripe_customer task; the shared idempotency key stops a duplicate
+        customer = await stripe.Customer.create_async(
+            email=user.email,
+            name=user.username,
+            idempotency_key=tasks.customer_idempotency_key(user),
         )
-        request.user.profile.stripe_customer_id = customer.id
-        request.user.profile.save()
+        profile.stripe_customer_id = customer.id
+        await profile.asave()
     
-    session = stripe.checkout.Session.create(
+    session = await stripe.checkout.Session.create_async(
         payment_method_types=['card'],
         mode='subscription',
-        customer=request.user.profile.stripe_customer_id,
+        customer=profile.stripe_customer_id,
         line_items=[{
             'price': membership.stripe_price_id,
             'quantity': 1,
@@ -211,49 +240,51 @@ def create_checkout_session(request, membership_id):
     )
     return redirect(session.url)
 
+@budget(2)
+@cache_anonymous_page()
 def subscription_success(request):
     return render(request, 'accounts/subscription_success.html')
 
+@budget(2)
+@cache_anonymous_page()
 def subscription_cancel(request):
     return render(request, 'accounts/subscription_cancel.html')
 
+@budget(6, max_ms=1000)
 @csrf_exempt
 def stripe_webhook(request):
-    import stripe
-    import logging
-    logger = logging.getLogger(__name__)
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
     endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
     event = None
 
     logger.info('Stripe webhook received!')
-    logger.debug(f'Payload length: {len(payload)}')
-    logger.debug(f'Signature header: {sig_header}')
+    logger.debug('Payload length: %d, signature header present: %s', len(payload), sig_header is not None)
 
     if not endpoint_secret:
         logger.error('STRIPE_WEBHOOK_SECRET not configured in settings')
         return HttpResponse(status=500)
 
     try:
-        event = stripe.Webhook.construct_event(
+        event = stripe_service.construct_event(
             payload, sig_header, endpoint_secret
         )
-        logger.info(f'Stripe event type: {event["type"]}')
+        logger.info('Stripe event type: %s', event['type'])
     except ValueError as e:
-        logger.error(f'Invalid payload: {e}')
+        logger.error('Invalid payload: %s', e)
         return HttpResponse(status=400)
     except stripe.error.SignatureVerificationError as e:
-        logger.error(f'Invalid signature: {e}')
+        logger.error('Invalid signature: %s', e)
         return HttpResponse(status=400)
 
     # Only log relevant events
     if event['type'].startswith('customer.subscription') or event['type'].startswith('invoice.'):
+        # A redelivered event carries the same `created`, the other half of the unique constraint
         SubscriptionEvent.objects.get_or_create(
             event_id=event['id'],
+            created=timezone.datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
             defaults={
                 'event_type': event['type'],
-                'created': timezone.datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
                 'data': event['data'],
                 'customer_id': event['data']['object'].get('customer'),
                 'subscription_id': event['data']['object'].get('id'),
@@ -274,85 +305,130 @@ def stripe_webhook(request):
                 profile.stripe_subscription_id = stripe_subscription_id
             profile.subscription_status = status
             profile.save()
-            logger.info(f'Updated profile for customer {stripe_customer_id} with subscription {stripe_subscription_id} and status {status}')
+            logger.info('Updated profile for customer %s with subscription %s and status %s', stripe_customer_id, stripe_subscription_id, status)
         except Profile.DoesNotExist:
-            logger.warning(f'Profile with customer_id {stripe_customer_id} does not exist')
+            logger.warning('Profile with customer_id %s does not exist', stripe_customer_id)
     return HttpResponse(status=200)
 
+@budget(2)
+def prometheus_metrics(request):
+    """Expose request metrics to staff users or a scraper holding METRICS_TOKEN"""
+    token = settings.METRICS_TOKEN
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if not authorized and token and auth_header.startswith('Bearer '):
+        authorized = secrets.compare_digest(auth_header[len('Bearer '):], token)
+    if not authorized:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@budget(2)
+def export_events(request):
+    """Stream the subscription event log as CSV to staff users"""
+    if not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse(status=403)
+    queryset = SubscriptionEvent.objects.all()
+    if request.GET.get('customer_id'):
+        queryset = queryset.filter(customer_id=request.GET['customer_id'])
+    if request.GET.get('event_type'):
+        queryset = queryset.filter(type__code=request.GET['event_type'])
+    if isinstance(request, ASGIRequest):
+        content = exports.aiter_csv(queryset)
+    else:
+        content = exports.iter_csv(exports.iter_rows(queryset))
+    response = StreamingHttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="subscription-events.csv"'
+    return response
+
+@budget(0)
+def static_asset(request, path):
+    """Serve collected static files, precompressed and with immutable caching for fingerprinted names"""
+    return assets.serve(request, path)
+
+@budget(2)
 @login_required
 def logged_in_page(request):
     return render(request, 'accounts/logged_in_page.html')
 
+@budget(3)
 @subscription_required
 def subscribing_page(request):
     return render(request, 'accounts/subscribing_page.html')
 
+@budget(4, 1)
 @login_required
-def cancel_subscription(request):
+async def cancel_subscription(request):
     """Cancel the user's subscription in Stripe and update local status"""
-    if not request.user.profile.stripe_subscription_id:
+    user = await request.auser()
+    profile = await Profile.objects.aget(user=user)
+    if not profile.stripe_subscription_id:
         messages.error(request, 'No active subscription found to cancel.')
         return redirect('profile')
     
     try:
         # Cancel the subscription in Stripe
-        subscription = stripe.Subscription.modify(
-            request.user.profile.stripe_subscription_id,
+        subscription = await stripe.Subscription.modify_async(
+            profile.stripe_subscription_id,
             cancel_at_period_end=True
         )
         
-        logger.info(f'Cancelled subscription {request.user.profile.stripe_subscription_id} for user {request.user.username}')
+        logger.info('Cancelled subscription %s for user %s', profile.stripe_subscription_id, user.username)
         
         # Update local subscription status
-        #request.user.profile.subscription_status = 'canceled'
-        request.user.profile.save()
+        #profile.subscription_status = 'canceled'
+        await profile.asave()
         
         messages.success(request, 'Your subscription has been cancelled successfully. You will continue to have access until the end of your current billing period.')
         
     except stripe.error.StripeError as e:
-        logger.error(f'Error cancelling subscription: {e}')
+        logger.error('Error cancelling subscription: %s', e)
         messages.error(request, f'Error cancelling subscription: {str(e)}')
     except Exception as e:
-        logger.error(f'Unexpected error cancelling subscription: {e}')
+        logger.error('Unexpected error cancelling subscription: %s', e)
         messages.error(request, 'An unexpected error occurred while cancelling your subscription.')
     
     return redirect('profile')
 
+@budget(4, 1)
 @login_required
-def reactivate_subscription(request):
+async def reactivate_subscription(request):
     """Reactivate a cancelled subscription"""
-    if not request.user.profile.stripe_subscription_id:
+    user = await request.auser()
+    profile = await Profile.objects.aget(user=user)
+    if not profile.stripe_subscription_id:
         messages.error(request, 'No subscription found to reactivate.')
         return redirect('profile')
     
     try:
         # Reactivate the subscription in Stripe
-        subscription = stripe.Subscription.modify(
-            request.user.profile.stripe_subscription_id,
+        subscription = await stripe.Subscription.modify_async(
+            profile.stripe_subscription_id,
             cancel_at_period_end=False
         )
         
-        logger.info(f'Reactivated subscription {request.user.profile.stripe_subscription_id} for user {request.user.username}')
+        logger.info('Reactivated subscription %s for user %s', profile.stripe_subscription_id, user.username)
         
         # Update local subscription status
-        request.user.profile.subscription_status = 'active'
-        request.user.profile.save()
+        profile.subscription_status = 'active'
+        await profile.asave()
         
         messages.success(request, 'Your subscription has been reactivated successfully.')
         
     except stripe.error.StripeError as e:
-        logger.error(f'Error reactivating subscription: {e}')
+        logger.error('Error reactivating subscription: %s', e)
         messages.error(request, f'Error reactivating subscription: {str(e)}')
     except Exception as e:
-        logger.error(f'Unexpected error reactivating subscription: {e}')
+        logger.error('Unexpected error reactivating subscription: %s', e)
         messages.error(request, 'An unexpected error occurred while reactivating your subscription.')
     
     return redirect('profile')
 
+@budget(6, 3, max_ms=1000)
 @login_required
-def subscription_details(request):
+async def subscription_details(request):
     """Display detailed subscription information"""
-    profile = request.user.profile
+    user = await request.auser()
+    profile = await Profile.objects.aget(user=user)
     subscription = None
     customer = None
     current_period_start = None
@@ -360,30 +436,31 @@ def subscription_details(request):
     upcoming_invoice = None
     if profile.stripe_subscription_id:
         try:
-            subscription = stripe.Subscription.retrieve(profile.stripe_subscription_id)
-            customer = stripe.Customer.retrieve(profile.stripe_customer_id)
+            # The subscription and customer are independent, so fetch them concurrently
+            subscription, customer = await asyncio.gather(
+                stripe_reads.retrieve(stripe.Subscription, profile.stripe_subscription_id),
+                stripe_reads.retrieve(stripe.Customer, profile.stripe_customer_id),
+            )
             if subscription['items']['data']:
                 item = subscription['items']['data'][0]
                 current_period_start = item.get('current_period_start')
                 current_period_end = item.get('current_period_end')
             if subscription.status == 'active':
                 try:
-                    upcoming_invoice = stripe.Invoice.upcoming(customer=profile.stripe_customer_id)
+                    upcoming_invoice = await stripe_reads.upcoming_invoice(stripe.Invoice, profile.stripe_customer_id, profile.stripe_subscription_id)
                 except Exception:
                     pass
+        except CircuitOpenError as e:
+            logger.warning('Subscription details without Stripe data: %s', e)
+            messages.error(request, 'Billing details are temporarily unavailable. Please try again in a few minutes.')
         except stripe.error.StripeError as e:
-            logger.error(f'Error retrieving subscription details: {e}')
+            logger.error('Error retrieving subscription details: %s', e)
             messages.error(request, f'Error retrieving subscription details: {str(e)}')
         except Exception as e:
-            logger.error(f'Unexpected error retrieving subscription details: {e}')
+            logger.error('Unexpected error retrieving subscription details: %s', e)
             messages.error(request, 'An unexpected error occurred while retrieving subscription details.')
-    # Pagination logic for subscription events (page-based)
-    all_events = SubscriptionEvent.objects.filter(customer_id=profile.stripe_customer_id).order_by('-created')
-    page_size = 20
-    page_number = int(request.GET.get('page', 1))
-    paginator = Paginator(all_events, page_size)
-    page_obj = paginator.get_page(page_number)
-    subscription_events = page_obj.object_list
+    event_type = request.GET.get('type', '')
+    subscription_events, next_cursor = await sync_to_async(_subscription_event_batch)(profile.stripe_customer_id, event_type=event_type)
     context = {
         'subscription': subscription,
         'customer': customer,
@@ -391,15 +468,60 @@ def subscription_details(request):
         'current_period_start': current_period_start,
         'current_period_end': current_period_end,
         'subscription_events': subscription_events,
-        'page_obj': page_obj,
-        'has_next': page_obj.has_next(),
-        'has_previous': page_obj.has_previous(),
-        'next_page_number': page_obj.next_page_number() if page_obj.has_next() else None,
-        'previous_page_number': page_obj.previous_page_number() if page_obj.has_previous() else None,
+        'next_cursor': next_cursor,
         'profile': profile,
+        'event_type': event_type,
+        'stripe_stale': any(stripe_reads.is_stale(obj) for obj in (subscription, customer, upcoming_invoice) if obj is not None),
     }
-    return render(request, 'accounts/subscription_details.html', context)
+    return await sync_to_async(render)(request, 'accounts/subscription_details.html', context)
+
+EVENT_LOG_BATCH_SIZE = 20
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+def _event_cursor(event):
+    # Keyset position of the last row shown: created in whole microseconds, then pk for ties
+    return f'{(event.created - _EPOCH) // _MICROSECOND}-{event.pk}'
+
+def _parse_event_cursor(cursor):
+    micros, _, pk = cursor.partition('-')
+    return _EPOCH + int(micros) * _MICROSECOND, int(pk)
+
+def _subscription_event_batch(customer_id, cursor=None, event_type=None, size=EVENT_LOG_BATCH_SIZE):
+    """
+    The next `size` events of a customer's log, newest first, after `cursor`;
+    returns (events, cursor for the batch after it or None).
+
+    Keyset pagination: each batch is an index range scan from the cursor, with
+    no COUNT and no OFFSET, so it costs the same however far back the user scrolls.
+    """
+    events = SubscriptionEvent.objects.filter(customer_id=customer_id).select_related('type').order_by('-created', '-pk')
+    if event_type:
+        # One type: a seek on the (customer_id, type, created) index
+        events = events.filter(type=EventType.objects.filter(code=event_type).first())
+    if cursor:
+        created, pk = _parse_event_cursor(cursor)
+        events = events.filter(Q(created__lt=created) | Q(created=created, pk__lt=pk))
+    batch = list(events[:size + 1])
+    if len(batch) > size:
+        return batch[:size], _event_cursor(batch[size - 1])
+    return batch, None
+
+@budget(4)
+@login_required
+def event_log_htmx(request):
+    """Return the next batch of event log rows for infinite scroll, without calling Stripe."""
+    try:
+        events, next_cursor = _subscription_event_batch(request.user.profile.stripe_customer_id, request.GET.get('cursor'), request.GET.get('type'))
+    except (ValueError, OverflowError):
+        return HttpResponse(status=400)
+    return render(request, 'accounts/partials/event_rows.html', {
+        'subscription_events': events,
+        'next_cursor': next_cursor,
+        'event_type': request.GET.get('type', ''),
+    })
 
+@budget(4, 1)
 @login_required
 def cancel_subscription_immediately(request):
     """Cancel the user's subscription immediately in Stripe"""
@@ -411,7 +533,7 @@ def cancel_subscription_immediately(request):
         # Cancel the subscription immediately in Stripe
         subscription = stripe.Subscription.delete(request.user.profile.stripe_subscription_id)
         
-        logger.info(f'Immediately cancelled subscription {request.user.profile.stripe_subscription_id} for user {request.user.username}')
+        logger.info('Immediately cancelled subscription %s for user %s', request.user.profile.stripe_subscription_id, request.user.username)
         
         # Update local subscription status
         # request.user.profile.subscription_status = 'canceled'
@@ -421,45 +543,52 @@ def cancel_subscription_immediately(request):
         messages.success(request, 'Your subscription has been cancelled immediately. You no longer have access to premium features.')
         
     except stripe.error.StripeError as e:
-        logger.error(f'Error cancelling subscription immediately: {e}')
+        logger.error('Error cancelling subscription immediately: %s', e)
         messages.error(request, f'Error cancelling subscription: {str(e)}')
     except Exception as e:
-        logger.error(f'Unexpected error cancelling subscription immediately: {e}')
+        logger.error('Unexpected error cancelling subscription immediately: %s', e)
         messages.error(request, 'An unexpected error occurred while cancelling your subscription.')
     
     return redirect('profile')
 
+@budget(15)
 @login_required
 @require_POST
 def delete_user(request):
     email_input = request.POST.get('email')
     if email_input and email_input.strip().lower() == request.user.email.strip().lower():
         user = request.user
+        # Stripe cleanup and the event purge run later in the task worker
+        deletion.request_deletion(user)
         logout(request)
-        user.delete()
         messages.success(request, 'Your account has been deleted.')
         return redirect('home')
     else:
         messages.error(request, 'The email address you entered does not match your account. Account not deleted.')
         return redirect('subscription_details')
 
+@budget(3)
 @login_required
 def upload_profile_image(request):
     if request.method == 'POST':
+        previous_image = request.user.profile.profile_image.name
         form = ProfileImageForm(request.POST, request.FILES, instance=request.user.profile)
         if form.is_valid():
             form.save()
+            if previous_image and previous_image != form.instance.profile_image.name:
+                taskqueue.enqueue(tasks.delete_profile_image, previous_image)
             messages.success(request, 'Profile image updated successfully.')
         else:
             messages.error(request, 'There was an error uploading the image.')
     return redirect('profile')
 
+@budget(3)
 @login_required
 def clear_profile_image(request):
     if request.method == 'POST':
         profile = request.user.profile
         if profile.profile_image:
-            profile.profile_image.delete(save=False)
+            taskqueue.enqueue(tasks.delete_profile_image, profile.profile_image.name)
             profile.profile_image = None
             profile.save()
             messages.success(request, 'Profile image removed.')
@@ -467,11 +596,13 @@ def clear_profile_image(request):
             messages.info(request, 'No profile image to remove.')
     return redirect('profile')
 
+@budget(2)
 @login_required
 def username_edit_htmx(request):
     user = request.user
     return render(request, 'accounts/partials/username_edit.html', {'user': user})
 
+@budget(4)
 @login_required
 @require_POST
 def username_update_htmx(request):
@@ -494,6 +625,7 @@ def username_update_htmx(request):
     user.save()
     return render(request, 'accounts/partials/username_display.html', {'user': user})
 
+@budget(3)
 @login_required
 def bio_edit_htmx(request):
     """Return the profile text edit partial for the current user."""
@@ -501,6 +633,7 @@ def bio_edit_htmx(request):
     profile = user.profile
     return render(request, 'accounts/partials/bio_edit.html', {'profile': profile})
 
+@budget(4)
 @login_required
 @require_POST
 def bio_update_htmx(request):
@@ -521,6 +654,7 @@ def bio_update_htmx(request):
     profile.save()
     return render(request, 'accounts/partials/bio_display.html', {'profile': profile})
 
+@budget(3)
 @require_POST
 def resend_verification_email(request):
     username = request.POST.get('username')
@@ -535,23 +669,8 @@ def resend_verification_email(request):
     if hasattr(user, 'profile') and user.profile.email_confirmed:
         messages.info(request, 'Your email is already confirmed. You can log in.')
         return redirect('login')
-    # Send confirmation email
-    current_site = get_current_site(request)
-    subject = 'Confirm your email'
-    token = default_token_generator.make_token(user)
-    uid = urlsafe_base64_encode(force_bytes(user.pk))
-    confirm_url = f"http://{current_site.domain}/confirm-email/{uid}/{token}/"
-    message = render_to_string('accounts/confirm_email.html', {
-        'user': user,
-        'confirm_url': confirm_url,
-    })
-    try:
-        send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
-        logger.info(f"Resent confirmation email to {user.email}")
-        messages.success(request, f'A new confirmation email has been sent to {user.email}.')
-    except Exception as e:
-        logger.error(f"Failed to resend confirmation email to {user.email}: {e}")
-        messages.error(request, 'Failed to send confirmation email. Please contact support.')
+    taskqueue.enqueue(tasks.send_confirmation_email, user.pk, get_current_site(request).domain)
+    messages.success(request, f'A new confirmation email is on its way to {user.email}.')
     return redirect('login')
 
 def generate_recovery_codes(n=10):
@@ -560,6 +679,7 @@ def generate_recovery_codes(n=10):
 def hash_code(code):
     return hashlib.sha256(code.encode()).hexdigest()
 
+@budget(2)
 @login_required
 def show_recovery_codes(request):
     # Only show after enabling 2FA
@@ -569,6 +689,7 @@ def show_recovery_codes(request):
         return redirect('profile')
     return render(request, 'accounts/show_recovery_codes.html', {'codes': codes})
 
+@budget(4)
 @login_required
 def enable_2fa(request):
     profile = request.user.profile
@@ -578,8 +699,7 @@ def enable_2fa(request):
         if not secret:
             messages.error(request, 'No 2FA secret found. Please reload the page.')
             return redirect('enable_2fa')
-        totp = pyotp.TOTP(secret)
-        if totp.verify(code):
+        if two_factor.verify(secret, code):
             profile.two_factor_enabled = True
             # Generate and store recovery codes
             codes = generate_recovery_codes()
@@ -593,26 +713,20 @@ def enable_2fa(request):
     else:
         # Generate a new secret if not already present
         if not profile.two_factor_secret:
-            secret = pyotp.random_base32()
+            secret = two_factor.random_secret()
             profile.two_factor_secret = secret
+            profile.two_factor_secret_created_at = timezone.now()
             profile.save()
         else:
             secret = profile.two_factor_secret
-        totp = pyotp.TOTP(secret)
-        otp_uri = totp.provisioning_uri(name=request.user.email, issuer_name="WebSubscription")
-        # Generate QR code
-        qr = qrcode.make(otp_uri)
-        buf = io.BytesIO()
-        qr.save(buf, format='PNG')
-        qr_code = buf.getvalue()
-        import base64
-        qr_code_b64 = base64.b64encode(qr_code).decode('utf-8')
+        qr_code_b64 = two_factor.qr_code_base64(secret, request.user.email)
         context = {
             'qr_code_b64': qr_code_b64,
             'secret': secret,
         }
         return render(request, 'accounts/enable_2fa.html', context)
 
+@budget(3)
 @login_required
 def disable_2fa(request):
     profile = request.user.profile
@@ -622,9 +736,7 @@ def disable_2fa(request):
         if not secret:
             messages.error(request, 'No 2FA secret found.')
             return redirect('disable_2fa')
-        import pyotp
-        totp = pyotp.TOTP(secret)
-        if totp.verify(code):
+        if two_factor.verify(secret, code):
             profile.two_factor_enabled = False
             profile.two_factor_secret = ''
             profile.save()
@@ -634,6 +746,7 @@ def disable_2fa(request):
             messages.error(request, 'Invalid code. Please try again.')
     return render(request, 'accounts/disable_2fa.html')
 
+@budget(13)
 def two_factor_challenge(request):
     user_id = request.session.get('2fa_user_id')
     if not user_id:
@@ -641,7 +754,7 @@ def two_factor_challenge(request):
         return redirect('login')
     User = get_user_model()
     try:
-        user = User.objects.get(pk=user_id)
+        user = User.objects.select_related('profile').get(pk=user_id)
     except User.DoesNotExist:
         messages.error(request, 'User not found.')
         return redirect('login')
@@ -651,9 +764,7 @@ def two_factor_challenge(request):
         code = request.POST.get('code')
         recovery_code = request.POST.get('recovery_code')
         if code:
-            import pyotp
-            totp = pyotp.TOTP(profile.two_factor_secret)
-            if totp.verify(code):
+            if two_factor.verify(profile.two_factor_secret, code):
                 login(request, user)
                 del request.session['2fa_user_id']
                 messages.success(request, 'Logged in with 2FA!')
@@ -0,0 +1,116 @@
+"""
+Worker warm-up, run from wsgi.py/asgi.py when the application is created
+and by `manage.py warmup`.
+
+Without it the first requests after a deploy pay for compiling templates,
+loading templatetag libraries, populating the URL resolvers and loading the
+membership catalog and event types, which shows up as a p99 spike. Each step is best
+effort: a failure is logged and the worker still starts.
+
+Warm-up runs on the importing thread, possibly in a gunicorn --preload
+master, so the database connections it opens are closed at the end: a
+forked worker must not share the master's socket, and request threads
+open their own connections anyway.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template import engines
+from django.urls import NoReverseMatch, URLResolver, get_resolver, reverse
+
+from . import catalog, event_types
+
+logger = logging.getLogger(__name__)
+
+
+def compile_templates():
+    """Compile every template under accounts/templates into the cached loader."""
+    template_dir = Path(apps.get_app_config('accounts').path) / 'templates'
+    engine = engines['django']
+    compiled = 0
+    for path in sorted(template_dir.rglob('*.html')):
+        name = path.relative_to(template_dir).as_posix()
+        try:
+            engine.get_template(name)
+            compiled += 1
+        except Exception as e:
+            logger.warning('Could not compile template %s: %s', name, e)
+    return compiled
+
+
+def _named_routes(patterns, namespace=None):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            inner = ':'.join(filter(None, (namespace, pattern.namespace))) or None
+            yield from _named_routes(pattern.url_patterns, inner)
+        elif pattern.name:
+            yield f'{namespace}:{pattern.name}' if namespace else pattern.name
+
+
+def resolve_urls():
+    """Populate the URL resolvers, including namespaced ones, by reversing every named route."""
+    resolver = get_resolver()
+    reversed_count = 0
+    for name in _named_routes(resolver.url_patterns):
+        try:
+            reverse(name)
+            reversed_count += 1
+        except NoReverseMatch:
+            # Routes that need arguments; reversing them still populated their resolver
+            pass
+    return reversed_count
+
+
+def open_connections():
+    """Connect every configured database, so an unreachable one is logged before the first request."""
+    for alias in connections:
+        connections[alias].ensure_connection()
+    return len(connections.all())
+
+
+def warm_catalog():
+    memberships = catalog.warm()
+    return len(memberships) if memberships is not None else None
+
+
+def warm_event_types():
+    loaded = event_types.warm()
+    return len(loaded) if loaded is not None else None
+
+
+def preload_stripe():
+    """Import and configure the Stripe SDK now instead of on the first request that calls Stripe."""
+    from .services.stripe_service import get_stripe
+    get_stripe()
+    return 1
+
+
+STEPS = (
+    ('templates', compile_templates),
+    ('urls', resolve_urls),
+    ('connections', open_connections),
+    ('catalog', warm_catalog),
+    ('event_types', warm_event_types),
+)
+
+
+def run(include_stripe=None):
+    """Run every warm-up step; returns {step: (count, seconds)}."""
+    include_stripe = settings.WARMUP_PRELOAD_STRIPE if include_stripe is None else include_stripe
+    steps = STEPS + ((('stripe', preload_stripe),) if include_stripe else ())
+    report = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            count = step()
+        except Exception as e:
+            logger.warning('Warm-up step %s failed: %s', name, e)
+            count = None
+        report[name] = (count, time.perf_counter() - start)
+    connections.close_all()
+    logger.info('Warm-up finished in %.0f ms', sum(seconds for _, seconds in report.values()) * 1000)
+    return report
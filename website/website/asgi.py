@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'website.settings')
+# Read by settings: no persistent database connections under ASGI
+os.environ['DJANGO_ASGI'] = '1'
 
 application = get_asgi_application()
+
+# Compile templates, populate the URL resolvers, connect to the database and
+# load the Membership catalog before the first request arrives
+from accounts import warmup  # noqa: E402
+warmup.run()
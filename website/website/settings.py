@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -30,6 +33,9 @@ SECRET_KEY = os.environ.get('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# True while `manage.py test` runs; selects the fast test profile below
+TESTING = sys.argv[1:2] == ['test']
+
 ALLOWED_HOSTS = ['*'] # Not for production
 
 
@@ -46,8 +52,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'accounts.middleware.ReplicaPinningMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -61,13 +69,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept in memory, also with DEBUG on.
+            # The autoreloader clears them when a template file changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -82,9 +97,43 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep each WSGI worker's connection open between requests. Django
+        # does not support persistent connections under ASGI, where asgi.py
+        # sets DJANGO_ASGI and requests close their connection again.
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', 0 if os.environ.get('DJANGO_ASGI') == '1' else 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional read replica for the event history, catalog and reports (see
+# accounts.routers), configured like the primary from DATABASE_REPLICA_*.
+# Replication itself happens outside Django (e.g. PostgreSQL streaming
+# replication): nothing here copies rows to the replica or migrates it.
+# Tests use a second, separately created SQLite database instead, built
+# from the models, so they can tell which database a read went to.
+MIGRATE_REPLICA = False
+if os.environ.get('DATABASE_REPLICA_HOST') or os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': os.environ.get('DATABASE_REPLICA_ENGINE', DATABASES['default']['ENGINE']),
+        'NAME': os.environ.get('DATABASE_REPLICA_NAME', ''),
+        'HOST': os.environ.get('DATABASE_REPLICA_HOST', ''),
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', ''),
+        'USER': os.environ.get('DATABASE_REPLICA_USER', ''),
+        'PASSWORD': os.environ.get('DATABASE_REPLICA_PASSWORD', ''),
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+    }
+elif TESTING:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db-replica.sqlite3',
+        'TEST': {'MIGRATE': False},
+    }
+    MIGRATE_REPLICA = True
+DATABASE_ROUTERS = ['accounts.routers.ReplicaRouter']
+# Seconds a user's reads stay on the primary after their data changed
+REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -105,6 +154,38 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# JSON codec for JSONField columns and webhook payloads (see accounts.jsoncodec):
+# "auto" uses orjson when it is installed, "json" forces the standard library
+JSON_CODEC = os.environ.get('JSON_CODEC', 'auto')
+
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new passwords: "pbkdf2" (Django's
+# default), "scrypt" or "argon2" (needs the argon2-cffi package). The others
+# stay listed so existing hashes still verify; Django re-hashes them with the
+# preferred hasher on the owner's next successful login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+# scrypt: 128 * N * r bytes of memory per hash (32 MiB with these defaults)
+SCRYPT_WORK_FACTOR = int(os.environ.get('SCRYPT_WORK_FACTOR', 2 ** 15))
+SCRYPT_BLOCK_SIZE = int(os.environ.get('SCRYPT_BLOCK_SIZE', 8))
+SCRYPT_PARALLELISM = int(os.environ.get('SCRYPT_PARALLELISM', 3))
+# argon2id: memory in KiB; one lane so a login burst does not oversubscribe cores
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 19456))
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 1))
+
+PASSWORD_HASHER_CHOICES = {
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'accounts.hashers.TunedScryptPasswordHasher',
+    'argon2': 'accounts.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [PASSWORD_HASHER_CHOICES[PASSWORD_HASHER]] + [
+    hasher for name, hasher in PASSWORD_HASHER_CHOICES.items() if name != PASSWORD_HASHER
+]
+if TESTING:
+    # Deliberately weak and fast; test users never hold real passwords
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -121,11 +202,165 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed copies plus .gz/.br variants (see
+# accounts.storage), served by accounts.assets.serve. Tests use the plain
+# storage so they do not need a collectstatic run.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if TESTING else 'accounts.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Without CACHE_BACKEND each process keeps its own LocMemCache. Point it at a
+# cache every worker shares (e.g. django.core.cache.backends.redis.RedisCache
+# with CACHE_LOCATION=redis://...) before relying on it across processes.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+SHARED_CACHE = CACHE_BACKEND not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# accounts.routers pins a user to the primary with a cache key every worker must see
+if 'replica' in DATABASES and not SHARED_CACHE and not TESTING:
+    raise ImproperlyConfigured('A read replica needs a cache shared by all workers; set CACHE_BACKEND')
+
+# Seconds the in-process Membership catalog is trusted before it is reloaded.
+# Saves and deletes of a Membership invalidate it immediately.
+MEMBERSHIP_CATALOG_TIMEOUT = 300
+SUBSCRIBE_PAGE_CACHE_TIMEOUT = 60 * 15
+# Full-page cache lifetime for pages served to anonymous users (also sent to the CDN)
+ANONYMOUS_PAGE_CACHE_TIMEOUT = 60 * 15
+
+# Concurrent requests for the same Stripe object share one call (see
+# accounts.services.singleflight). Set SINGLE_FLIGHT_ACROSS_PROCESSES=1 with a
+# cache shared between workers to coalesce across processes too; callers in
+# other processes wait up to SINGLE_FLIGHT_WAIT seconds for the result.
+SINGLE_FLIGHT_ACROSS_PROCESSES = os.environ.get('SINGLE_FLIGHT_ACROSS_PROCESSES', '') == '1'
+SINGLE_FLIGHT_WAIT = 10
+
+# Circuit breaker around Stripe reads (accounts.services.circuit_breaker).
+# It opens when, among at least min_calls calls in the last window_seconds,
+# failure_ratio failed or slow_ratio took over slow_call_seconds; pages then
+# show the last good copy (kept for STRIPE_STALE_TTL seconds) until a
+# background probe succeeds, tried every open_seconds.
+STRIPE_CIRCUIT_BREAKER = {
+    'window_seconds': 30,
+    'min_calls': 10,
+    'failure_ratio': 0.5,
+    'slow_call_seconds': 2.0,
+    'slow_ratio': 0.5,
+    'open_seconds': 30,
+    'call_timeout': 5.0,
+}
+STRIPE_STALE_TTL = 60 * 60 * 24
+
+# accounts.warmup runs when wsgi.py/asgi.py create the application. Importing
+# the Stripe SDK there makes every worker boot slower, so it is opt-in; with
+# gunicorn --preload it is paid once in the master before forking.
+WARMUP_PRELOAD_STRIPE = os.environ.get('WARMUP_PRELOAD_STRIPE', '') == '1'
+
+
+# Sessions
+# SESSION_BACKEND selects where sessions live:
+#   "db"             - django_session only; every authenticated request queries it (default)
+#   "cached_db"      - read from the cache, written through to django_session
+#   "cache"          - cache only; sessions are lost when the cache is cleared
+#   "signed_cookies" - no server storage; the session (including the 2FA user id
+#                      and freshly generated recovery codes) is signed but readable
+#                      by the client
+# The two cache backends need SHARED_CACHE: with a per-process cache a logout
+# or a key rotation handled by one worker leaves the session alive in the
+# others. Expired django_session rows are removed by `manage.py purge_sessions`.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'db')
+if SESSION_BACKEND in ('cache', 'cached_db') and not SHARED_CACHE:
+    raise ImproperlyConfigured(f'SESSION_BACKEND={SESSION_BACKEND} needs a cache shared by all workers; set CACHE_BACKEND')
+SESSION_ENGINE = f'django.contrib.sessions.backends.{SESSION_BACKEND}'
+
+
+# Subscription events deleted per transaction when an account is removed
+ACCOUNT_DELETION_BATCH_SIZE = 1000
+
+# Background tasks (accounts.taskqueue, run by `manage.py runworker`). A failed
+# attempt is retried after TASK_RETRY_BACKOFF * 2**(attempt - 1) seconds, at
+# most TASK_RETRY_BACKOFF_MAX; tasks with no heartbeat for TASK_STALE_AFTER
+# seconds are assumed lost with their worker and queued again. Long tasks
+# send a heartbeat at most every TASK_HEARTBEAT_INTERVAL seconds.
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BACKOFF = 30
+TASK_RETRY_BACKOFF_MAX = 60 * 60
+TASK_STALE_AFTER = 60 * 10
+TASK_HEARTBEAT_INTERVAL = 60
+
+# Age in seconds below which accounts.rollups.update() leaves subscription
+# events for its next run, so a transaction still in flight on another
+# connection cannot commit below the high-water mark. SQLite's single writer
+# commits in primary-key order and needs no lag.
+ROLLUP_LAG_SECONDS = int(os.environ.get('ROLLUP_LAG_SECONDS', 0 if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' else 60))
+
+# Maintenance jobs run by `manage.py run_scheduler` (see accounts.scheduler):
+# five-field cron specs in the server's TIME_ZONE, with either a dotted
+# `call` (plus `kwargs`) or a management `command` (plus `args`). Cleanup
+# jobs delete batch_size rows per transaction and pause between batches.
+MAINTENANCE_SCHEDULE = {
+    'purge_sessions': {
+        'cron': '*/15 * * * *',
+        'call': 'accounts.maintenance.purge_sessions',
+        'kwargs': {'batch_size': 1000, 'pause': 0.1},
+    },
+    'clear_abandoned_2fa_secrets': {
+        'cron': '5 * * * *',
+        'call': 'accounts.maintenance.clear_abandoned_2fa_secrets',
+        'kwargs': {'max_age_hours': 24},
+    },
+    'update_rollups': {
+        'cron': '*/5 * * * *',
+        'command': 'update_rollups',
+        'args': ['--lag', str(ROLLUP_LAG_SECONDS)],
+    },
+    'purge_old_events': {
+        'cron': '30 3 * * *',
+        'call': 'accounts.maintenance.purge_old_events',
+        'kwargs': {'batch_size': 500, 'pause': 0.5},
+    },
+    'process_account_deletions': {
+        'cron': '*/10 * * * *',
+        'command': 'process_account_deletions',
+    },
+    # PostgreSQL only: create next months' SubscriptionEvent partitions ahead of time
+    'ensure_event_partitions': {
+        'cron': '0 2 * * *',
+        'call': 'accounts.partitions.ensure_partitions',
+        'kwargs': {'months_ahead': 3},
+    },
+}
+# Subscription events older than this are deleted once they are in the rollups
+SUBSCRIPTION_EVENT_RETENTION_DAYS = 365 * 2
+
+
+# Request metrics, scraped from /metrics/ by staff users or with
+# "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Recent samples kept per view and metric for the p50/p95/p99 quantiles
+METRICS_SAMPLE_SIZE = 1024
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -140,22 +375,44 @@ EMAIL_HOST_USER = "jesper.esbensen@eeng.dk"
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = 'jesper.esbensen@eeng.dk'
 
+# Logging
+# DJANGO_ENV selects the profile: "development" logs readable lines
+# synchronously to the console, "production" queues JSON lines to a
+# background thread. LOG_LEVEL overrides the level of the accounts logger.
+DJANGO_ENV = os.environ.get('DJANGO_ENV', 'development')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG' if DJANGO_ENV == 'development' else 'INFO')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{levelname} {name}: {message}',
+            'style': '{',
+        },
+        'json': {
+            '()': 'website.logconfig.JSONFormatter',
+        },
+    },
+    # Only the handler of the active profile is defined, so development
+    # does not start the queue listener thread.
     'handlers': {
-        'console': {
+        'default': {
             'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        } if DJANGO_ENV == 'development' else {
+            'class': 'website.logconfig.QueueStreamHandler',
+            'formatter': 'json',
         },
     },
     'root': {
-        'handlers': ['console'],
-        'level': 'DEBUG',
+        'handlers': ['default'],
+        'level': 'INFO' if DJANGO_ENV == 'development' else 'WARNING',
     },
     'loggers': {
         'accounts': {
-            'handlers': ['console'],
-            'level': 'DEBUG',
+            'handlers': ['default'],
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },
@@ -31,4 +31,6 @@ urlpatterns = [
     path('accounts/', include('accounts.urls')),
     path('logged-in/', accounts_views.logged_in_page, name='logged_in_page'),
     path('subscribing/', accounts_views.subscribing_page, name='subscribing_page'),
+    path('metrics/', accounts_views.prometheus_metrics, name='metrics'),
+    path(settings.STATIC_URL.lstrip('/') + '<path:path>', accounts_views.static_asset, name='static_asset'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
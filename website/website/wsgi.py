@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'website.settings')
 
 application = get_wsgi_application()
+
+# Compile templates, populate the URL resolvers, connect to the database and
+# load the Membership catalog before the first request arrives
+from accounts import warmup  # noqa: E402
+warmup.run()